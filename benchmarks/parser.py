@@ -0,0 +1,88 @@
+"""Micro-benchmark of bubble text parsing
+
+Times parse_message_text over the fixture corpus in
+tests/fixtures/messages, next to the line-scanning parser it replaced,
+and reports microseconds per message.
+
+    python -m benchmarks.parser
+    python -m benchmarks.parser -n 20000 -o parser.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from src.message_parser import parse_message_text
+
+CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'tests', 'fixtures', 'messages', 'corpus.json')
+
+
+def legacy_parse(full_text):
+    """The parser used before message_parser, kept here as the reference"""
+    lines = [line for line in full_text.splitlines() if line.strip()]
+    sender = ""
+    time_sent = ""
+    for line in reversed(lines):
+        line = line.strip()
+        if not time_sent and ("بعدازظهر" in line or "قبل‌ازظهر" in line):
+            time_sent = line
+        elif not sender and line and not any(x in line for x in ["بعدازظهر", "قبل‌ازظهر"]):
+            sender = line.rstrip(',').strip()
+    views_count = None
+    remaining_lines = []
+    for line in lines:
+        if line != sender and line != time_sent:
+            if line.strip().isdigit() and not views_count:
+                views_count = line.strip()
+            elif not line.strip().endswith(','):
+                remaining_lines.append(line)
+    return sender, time_sent, views_count, '\n'.join(remaining_lines)
+
+
+def load_texts(path=CORPUS):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [case['text'] for case in json.load(f)]
+
+
+def time_parser(parse, texts, iterations):
+    """Best of three runs, in microseconds per message"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for text in texts:
+                parse(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / (iterations * len(texts)) * 1e6
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=5000, help='passes over the corpus per run')
+    parser.add_argument('-o', '--output', help='write results JSON here')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    texts = load_texts()
+    results = {
+        'parse_message_text': time_parser(parse_message_text, texts, args.iterations),
+        'legacy': time_parser(legacy_parse, texts, args.iterations),
+    }
+    for name, us in results.items():
+        print(f"{name:20} {us:8.2f} us/message")
+
+    if args.output:
+        report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                  'messages': len(texts), 'us_per_message': results}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""End-to-end benchmark of the scrape -> format -> send pipeline
+
+Synthetic channels are written as HTML snapshots and served through
+FixtureBackend, parsed like live bubbles, formatted and queued by
+MessageProcessor, and sent by TelegramHandler to a FakeTelegramClient.
+Nothing touches Eitaa or Telegram.
+
+    python -m benchmarks.pipeline                       # all scenarios
+    python -m benchmarks.pipeline -s fanout -o out.json
+    python -m benchmarks.pipeline --save-baseline       # store as baseline
+    python -m benchmarks.pipeline --baseline benchmarks/baseline.json
+
+benchmarks/baseline.json is committed; regenerate it with --save-baseline
+on the same machine before comparing, since the numbers depend on it.
+
+Stages (milliseconds, p50/p95/p99):
+    fetch    one channel poll: picking new bubbles and parsing their text
+    media    copying one poll's media into the MediaStore
+    format   formatting and queueing one message
+    send     queue_record until the fake client sent it, per target
+    total    poll start until the last target received the message
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from src.fake_telegram import FakeTelegramClient
+from src.fetch_backend import FixtureBackend
+from src.media_store import MediaStore
+from src.message_processor import MessageProcessor
+from src.resource_policy import process_tree_rss
+from src.telegram_handler import TelegramHandler
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# channels: تعداد کانال، rate: پیام جدید هر کانال در هر دور
+SCENARIOS = {
+    'text_only': {'channels': 5, 'rate': 10, 'media_share': 0.0, 'targets': 1, 'cycles': 5},
+    'media_mix': {'channels': 5, 'rate': 10, 'media_share': 0.3, 'targets': 1, 'cycles': 5},
+    'many_channels': {'channels': 50, 'rate': 2, 'media_share': 0.1, 'targets': 1, 'cycles': 5},
+    'fanout': {'channels': 5, 'rate': 10, 'media_share': 0.3, 'targets': 5, 'cycles': 5},
+    'burst': {'channels': 2, 'rate': 200, 'media_share': 0.1, 'targets': 2, 'cycles': 2},
+}
+DEFAULTS = {
+    'poll_interval': 0.2,  # فاصله بین دورها به ثانیه
+    'fetch_latency': 0.0,
+    'send_latency': 0.002,
+    'media_kb': 64,
+}
+STAGES = ('fetch', 'media', 'format', 'send', 'total')
+logger = logging.getLogger('benchmark')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+    }
+
+
+def write_snapshots(snapshot_dir, scenario, seed_mid=4296000000):
+    """Write one HTML snapshot per synthetic channel, return the channel ids"""
+    os.makedirs(os.path.join(snapshot_dir, 'media'), exist_ok=True)
+    media_file = os.path.join('media', 'photo.jpg')
+    with open(os.path.join(snapshot_dir, media_file), 'wb') as f:
+        f.write(os.urandom(scenario['media_kb'] * 1024))
+
+    channels = [str(1000 + i) for i in range(scenario['channels'])]
+    per_channel = scenario['rate'] * scenario['cycles']
+    media_every = round(1 / scenario['media_share']) if scenario['media_share'] else 0
+    for channel_id in channels:
+        bubbles = []
+        for n in range(per_channel):
+            mid = seed_mid + n * 65536
+            media = ''
+            if media_every and n % media_every == 0:
+                media = f'<div class="media-container"><img src="{media_file}"></div>'
+            bubbles.append(
+                f'<div class="bubble" data-mid="{mid}"><div class="bubble-content">{media}'
+                f'<div class="message">پیام آزمایشی {n} از کانال {channel_id}<br>خط دوم'
+                f'<div class="time"><div>{n + 10}</div><div>مدیر کانال,</div>'
+                f'<div>10:{n % 60:02d} قبل‌ازظهر</div></div></div></div></div>'
+            )
+        with open(os.path.join(snapshot_dir, f'{channel_id}.html'), 'w', encoding='utf-8') as f:
+            f.write('<html><body><div id="column-center">' + '\n'.join(bubbles) + '</div></body></html>')
+    return channels
+
+
+class PacedBackend(FixtureBackend):
+    """FixtureBackend that reveals rate more messages per channel each cycle"""
+
+    def __init__(self, snapshot_dir, rate, latency=0.0, media_store=None):
+        super().__init__(snapshot_dir, latency, media_store)
+        self.rate = rate
+        self.cycle = 0
+
+    def _load(self, channel_id):
+        loaded = super()._load(channel_id)
+        if loaded is None:
+            return None
+        to_record, raw = loaded
+        return to_record, raw[:self.rate * (self.cycle + 1)]
+
+
+class TimedTelegramHandler(TelegramHandler):
+    """TelegramHandler that stamps when each message was queued and polled"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.poll_start = None
+        self.queued_at = {}
+        self.polled_at = {}
+
+    def queue_record(self, record, specific_targets=None):
+        # زمان قبل از صف ثبت می‌شود چون ارسال در ترد دیگری زودتر تمام می‌شود
+        self.queued_at[record.text] = time.monotonic()
+        self.polled_at[record.text] = self.poll_start
+        super().queue_record(record, specific_targets)
+
+
+def bench_config(work_dir, scenario, targets):
+    # مسیرهای مطلق جایگزین پوشه config می‌شوند
+    return {
+        'telegram': {
+            'default_targets': targets,
+            # محدودیت نرخ واقعی در بنچمارک فقط انتظار اضافه می‌کند
+            'rate_limit': {'global_per_second': 100000, 'per_chat_per_minute': 6000000, 'per_chat_burst': 100000},
+        },
+        'eitaa': {'checkpoint_backend': 'json', 'media': {'cache_max_mb': 1024}},
+        'paths': {
+            'images_dir': os.path.join(work_dir, 'images'),
+            'last_message_file': os.path.join(work_dir, 'last_message.json'),
+            'outbox_file': os.path.join(work_dir, 'outbox.db'),
+        },
+    }
+
+
+class RssSampler:
+    """Track the peak RSS of this process tree in a background thread"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak = max(self.peak, process_tree_rss())
+            except OSError:
+                return
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_scenario(name, scenario):
+    scenario = {**DEFAULTS, **scenario}
+    work_dir = tempfile.mkdtemp(prefix=f'bench-{name}-')
+    try:
+        snapshot_dir = os.path.join(work_dir, 'snapshots')
+        channels = write_snapshots(snapshot_dir, scenario)
+        targets = [-(100 + i) for i in range(scenario['targets'])]
+        config = bench_config(work_dir, scenario, targets)
+
+        client = FakeTelegramClient(scenario['send_latency'])
+        media_store = MediaStore(config, logger, logger)
+        handler = TimedTelegramHandler(config, targets, logger, logger, media_store, client=client)
+        processor = MessageProcessor(config, handler, logger, logger)
+        backend = PacedBackend(snapshot_dir, scenario['rate'], scenario['fetch_latency'], media_store)
+
+        stages = {stage: [] for stage in STAGES}
+        for channel_id in channels:
+            # خواندن فایل snapshot جزو زمان poll نیست، مثل صفحه‌ای که از قبل باز است
+            backend._load(channel_id)
+        handler.connect()
+
+        with RssSampler() as rss:
+            start = time.monotonic()
+            for cycle in range(scenario['cycles']):
+                backend.cycle = cycle
+                cycle_start = time.monotonic()
+                for channel_id in channels:
+                    poll_start = handler.poll_start = time.monotonic()
+                    last = processor.load_last_message_id(channel_id)
+                    newest, records = backend.fetch(channel_id, last)
+                    fetched = time.monotonic()
+                    media = backend.fetch_media(records, channel_id)
+                    stages['fetch'].append((fetched - poll_start) * 1000)
+                    stages['media'].append((time.monotonic() - fetched) * 1000)
+
+                    for record in records:
+                        before = time.monotonic()
+                        processor.forward_records([record], media, targets)
+                        stages['format'].append((time.monotonic() - before) * 1000)
+                    if newest:
+                        processor.save_last_message_id(channel_id, newest)
+                processor.flush_last_message_ids()
+                handler.flush_outbox()
+                remaining = scenario['poll_interval'] - (time.monotonic() - cycle_start)
+                if remaining > 0 and cycle < scenario['cycles'] - 1:
+                    time.sleep(remaining)
+
+            handler.drain(timeout=120)
+            elapsed = time.monotonic() - start
+
+        handler.stop()
+        handler.telegram_thread.join(timeout=10)
+
+        # هر پیام آزمایشی متن یکتا دارد، پس متن ارسالی کلید است
+        delivered = {}
+        for sent_time, target, caption, _ in client.sent:
+            if caption not in handler.queued_at:
+                continue
+            stages['send'].append((sent_time - handler.queued_at[caption]) * 1000)
+            delivered[caption] = max(delivered.get(caption, 0), sent_time)
+        for caption, sent_time in delivered.items():
+            stages['total'].append((sent_time - handler.polled_at[caption]) * 1000)
+
+        expected = len(handler.queued_at) * len(targets)
+        return {
+            'scenario': {k: scenario[k] for k in sorted(scenario)},
+            'messages': len(handler.queued_at),
+            'deliveries': len(client.sent),
+            'missing_deliveries': expected - len(stages['send']),
+            'elapsed_s': elapsed,
+            'msgs_per_sec': len(delivered) / elapsed if elapsed else None,
+            'peak_rss_mb': rss.peak,
+            'stages': {stage: summarize(values) for stage, values in stages.items()},
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance, min_delta_ms=1.0):
+    """Print changes against the baseline, return the list of regressions
+
+    Latency changes smaller than min_delta_ms are never regressions, so
+    jitter on sub-millisecond stages does not fail the comparison.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f"{name}: no baseline")
+            continue
+        rows = [('msgs_per_sec', result['msgs_per_sec'], base['msgs_per_sec'], True, 0),
+                ('peak_rss_mb', result['peak_rss_mb'], base['peak_rss_mb'], False, 0)]
+        for stage in STAGES:
+            for pct in ('p50', 'p95', 'p99'):
+                rows.append((f"{stage}.{pct}", result['stages'].get(stage, {}).get(pct),
+                             base['stages'].get(stage, {}).get(pct), False, min_delta_ms))
+        for metric, value, old, higher_is_better, min_delta in rows:
+            if value is None or not old:
+                continue
+            change = (value - old) / old
+            worse = -change if higher_is_better else change
+            flag = ' REGRESSION' if worse > tolerance and abs(value - old) >= min_delta else ''
+            print(f"{name:14} {metric:14} {old:10.3f} -> {value:10.3f} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append(f"{name} {metric}")
+    return regressions
+
+
+def print_results(results):
+    for name, result in results.items():
+        print(f"\n{name}: {result['messages']} messages, {result['deliveries']} deliveries, "
+              f"{result['msgs_per_sec']:.1f} msgs/s, peak RSS {result['peak_rss_mb']:.1f} MB")
+        if result['missing_deliveries']:
+            print(f"  {result['missing_deliveries']} deliveries missing")
+        for stage, stats in result['stages'].items():
+            if stats['count']:
+                print(f"  {stage:7} p50 {stats['p50']:9.3f}  p95 {stats['p95']:9.3f}  "
+                      f"p99 {stats['p99']:9.3f} ms  (n={stats['count']})")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('-o', '--output', help='write results JSON here')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='relative change counted as a regression (default 0.15)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                        help='ignore latency changes smaller than this (default 1.0)')
+    parser.add_argument('--send-latency', type=float, help='fake Telegram round trip in seconds')
+    parser.add_argument('--fetch-latency', type=float, help='simulated poll time in seconds')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    logging.basicConfig(level=logging.WARNING)
+    overrides = {}
+    if args.send_latency is not None:
+        overrides['send_latency'] = args.send_latency
+    if args.fetch_latency is not None:
+        overrides['fetch_latency'] = args.fetch_latency
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(name, {**SCENARIOS[name], **overrides})
+    print_results(results)
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0], 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with baseline from {baseline.get('created')}:")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regressions over {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 from src.telegram_handler import TelegramHandler
 from src.eitaa_login import EitaaLogin
 from src.message_processor import MessageProcessor
+from src.media_store import MediaStore
+from src.metrics import MetricsServer
+from src.poll_scheduler import PollScheduler
 from src.logger import setup_logger
 
 def parse_arguments():
@@ -44,10 +47,14 @@ def run_scraper(config, args, info_logger, error_logger, base_dir):
     """Run the scraper"""
     telegram_handler = None
     eitaa_login = None
+    message_processor = None
+    metrics_server = MetricsServer(config, info_logger=info_logger, error_logger=error_logger)
     
     try:
-        telegram_handler = TelegramHandler(config, args['telegram_targets'], info_logger, error_logger)
-        eitaa_login = EitaaLogin(config, args['show_browser'], info_logger, error_logger)
+        metrics_server.start()
+        media_store = MediaStore(config, info_logger, error_logger)
+        telegram_handler = TelegramHandler(config, args['telegram_targets'], info_logger, error_logger, media_store)
+        eitaa_login = EitaaLogin(config, args['show_browser'], info_logger, error_logger, media_store)
         message_processor = MessageProcessor(config, telegram_handler, info_logger, error_logger)
 
         # Initialize components
@@ -61,8 +68,10 @@ def run_scraper(config, args, info_logger, error_logger, base_dir):
             return False
 
         channels = config['eitaa']['channels']  # لیست کانال‌ها از کانفیگ
+        config_path = os.path.join(base_dir, 'config', 'config.json')
         last_check_time = time.time()
         channel_last_messages = {}  # ذخیره آخرین پیام هر کانال
+        scheduler = PollScheduler(config, info_logger, error_logger)
         
         # بارگذاری آخرین پیام‌های ذخیره شده برای هر کانال
         for channel in channels:
@@ -74,6 +83,45 @@ def run_scraper(config, args, info_logger, error_logger, base_dir):
             else:
                 info_logger.info(f"Channel {channel_id}: Starting fresh")
 
+        def commit_progress():
+            # اول پیام‌های صف شده روی دیسک ثبت می‌شوند، بعد آخرین پیام‌ها ذخیره می‌شوند
+            telegram_handler.flush_outbox()
+            message_processor.flush_last_message_ids()
+
+        def process_channel(channel, page=None):
+            """Poll one channel, return (had_new, ok); ok is False when the poll failed"""
+            channel_id = channel['id']
+            channel_name = channel.get('name', str(channel_id))
+            info_logger.info(f"Checking channel: {channel_name}")
+            
+            try:
+                telegram_targets = channel.get('telegram_targets', config['telegram']['default_targets'])
+                current_id, ok = eitaa_login.process_messages(
+                    message_processor,
+                    channel_id,
+                    channel_last_messages[channel_id],
+                    telegram_targets,
+                    page
+                )
+                
+                if current_id != channel_last_messages[channel_id]:
+                    info_logger.info(f"Channel {channel_name}: Updated last message ID: {current_id}")
+                    message_processor.save_last_message_id(channel_id, current_id)
+                    channel_last_messages[channel_id] = current_id
+                    return True, ok
+                return False, ok
+                    
+            except Exception as e:
+                error_logger.error(f"Error processing channel {channel_name}: {e}")
+                # اطلاع‌رسانی به ادمین
+                error_msg = f"⚠️ خطا در کانال {channel_name}:\n{str(e)}\n\nکانال غیرفعال شد."
+                message_processor.telegram_handler.queue_message(error_msg)
+                # تغییر وضعیت کانال به error
+                channel['status'] = 'error'
+                # ذخیره تغییرات در فایل کانفیگ
+                save_config(config, config_path)
+            return False, False
+
         # Main processing loop
         while True:
             try:
@@ -88,53 +136,83 @@ def run_scraper(config, args, info_logger, error_logger, base_dir):
                     last_check_time = current_time
 
                 # پردازش همه کانال‌ها
+                active_channels = []
                 for channel in channels:
-                    channel_id = channel['id']
-                    channel_name = channel.get('name', str(channel_id))
                     channel_status = channel.get('status', 'active')
-                    
                     if channel_status != 'active':
-                        info_logger.info(f"Skipping channel {channel_name} (status: {channel_status})")
+                        info_logger.info(f"Skipping channel {channel.get('name', str(channel['id']))} (status: {channel_status})")
                         continue
-                    
-                    info_logger.info(f"Checking channel: {channel_name}")
-                    
-                    try:
-                        telegram_targets = channel.get('telegram_targets', config['telegram']['default_targets'])
-                        current_id = eitaa_login.process_messages(
-                            message_processor,
-                            channel_id,
-                            channel_last_messages[channel_id],
-                            telegram_targets
-                        )
-                        
-                        if current_id != channel_last_messages[channel_id]:
-                            info_logger.info(f"Channel {channel_name}: Updated last message ID: {current_id}")
-                            message_processor.save_last_message_id(channel_id, current_id)
-                            channel_last_messages[channel_id] = current_id
-                            
-                    except Exception as e:
-                        error_logger.error(f"Error processing channel {channel_name}: {e}")
-                        # اطلاع‌رسانی به ادمین
-                        error_msg = f"⚠️ خطا در کانال {channel_name}:\n{str(e)}\n\nکانال غیرفعال شد."
-                        message_processor.telegram_handler.queue_message(error_msg)
-                        # تغییر وضعیت کانال به error
-                        channel['status'] = 'error'
-                        # ذخیره تغییرات در فایل کانفیگ
-                        save_config(config, config_path)
+                    active_channels.append(channel)
+
+                # فقط کانال‌هایی که نوبت بررسی‌شان رسیده و در لیست چت تغییر کرده‌اند
+                due_ids = scheduler.due([c['id'] for c in active_channels])
+                changed_ids = set(eitaa_login.changed_channels(message_processor, due_ids))
+                for channel_id in due_ids:
+                    if channel_id not in changed_ids:
+                        scheduler.record(channel_id, False)
+                due_channels = [c for c in active_channels if c['id'] in changed_ids]
+
+                push_mode = eitaa_login.message_watcher is not None
+                if push_mode or config['eitaa'].get('page_pool', {}).get('enabled', False):
+                    # هر کانال در صفحه مخصوص خودش باز می‌ماند
+                    eitaa_login.get_page_pool().check_capacity(len(active_channels))
+                    for batch in eitaa_login.get_page_pool().batches(due_channels):
+                        pages = eitaa_login.open_channels(message_processor, [c['id'] for c in batch])
+                        for channel in batch:
+                            had_new = False
+                            if channel['id'] in pages:
+                                had_new, ok = process_channel(channel, pages[channel['id']])
+                                # باز کردن چت نشان خوانده‌نشده را پاک کرده، پس فقط بررسی موفق ثبت می‌شود
+                                if ok:
+                                    eitaa_login.chatlist_scanner.mark_seen(channel['id'])
+                            scheduler.record(channel['id'], had_new)
+                else:
+                    for channel in due_channels:
+                        had_new, ok = process_channel(channel)
+                        scheduler.record(channel['id'], had_new)
+                        if ok:
+                            eitaa_login.chatlist_scanner.mark_seen(channel['id'])
 
-                # منتظر خالی شدن صف پیام‌ها
-                while not telegram_handler.message_queue.empty():
-                    info_logger.info("Waiting for messages to be sent...")
-                    time.sleep(0.5)
+                commit_progress()
+                scheduler.log_summary()
+                eitaa_login.readiness.log_summary()
+                eitaa_login.resource_policy.log_summary()
+
+                # صف روی دیسک پایدار است، پس فقط مدت محدودی منتظر ارسال می‌ماند؛
+                # تارگتی که FloodWait طولانی دارد نباید بررسی کانال‌ها را متوقف کند
+                info_logger.info("Waiting for messages to be sent...")
+                drain_timeout = config['telegram'].get('drain_timeout', 30)  # پیش‌فرض 30 ثانیه
+                # در اجرای یک‌باره بررسی بعدی وجود ندارد، پس تا ارسال همه پیام‌ها صبر می‌شود
+                if not telegram_handler.drain(timeout=None if args['one_time'] else drain_timeout):
+                    info_logger.info("Messages still sending, continuing with the next check")
+                telegram_handler.flush_outbox()
+
+                # پاک‌سازی کش عکس‌ها؛ فایل پیام‌هایی که هنوز در صف هستند نگه داشته می‌شوند
+                media_store.evict(keep=telegram_handler.queued_files())
+                media_store.flush()
 
                 if args['one_time']:
                     info_logger.info("One-time check completed")
                     return True
                     
-                # تاخیر بین چک‌ها
-                check_interval = config['eitaa'].get('check_interval', 60)  # پیش‌فرض 60 ثانیه (1 دقیقه)
-                time.sleep(check_interval)
+                # تاخیر بین چک‌ها تا نوبت کانال بعدی
+                check_interval = scheduler.seconds_until_next()
+                if push_mode:
+                    # در حالت push فقط کانال‌هایی که پیام جدید گزارش کرده‌اند بررسی می‌شوند
+                    wait_until = time.time() + check_interval
+                    while time.time() < wait_until:
+                        pushed = eitaa_login.message_watcher.wait(wait_until - time.time())
+                        for channel in active_channels:
+                            page = eitaa_login.page_pool.pages.get(channel['id'])
+                            if channel['id'] in pushed and page and channel.get('status', 'active') == 'active':
+                                had_new, ok = process_channel(channel, page)
+                                scheduler.record(channel['id'], had_new)
+                                if ok:
+                                    eitaa_login.chatlist_scanner.mark_seen(channel['id'])
+                        if pushed:
+                            commit_progress()
+                else:
+                    time.sleep(check_interval)
 
             except KeyboardInterrupt:
                 info_logger.info("Received keyboard interrupt, cleaning up...")
@@ -148,10 +226,19 @@ def run_scraper(config, args, info_logger, error_logger, base_dir):
         return False
     finally:
         info_logger.info("Cleanup started...")
+        if message_processor:
+            telegram_handler.flush_outbox()
+            message_processor.flush_last_message_ids()
         if telegram_handler:
-            telegram_handler._running = False
+            telegram_handler.stop()
         if eitaa_login:
             eitaa_login.close()
+        metrics_server.stop()
+
+def save_config(config, config_path):
+    """Write config back to disk"""
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
 
 def initialize_json_file(file_path, default_content=None):
     """Initialize JSON file with default content if empty or invalid"""
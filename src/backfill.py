@@ -0,0 +1,131 @@
+from .message_extractor import ACTIVE_BUBBLES_JS, extract_messages
+
+# کوچک‌ترین و بزرگ‌ترین mid که الان در چت همین peer رندر شده
+RANGE_SCRIPT = """(peerId) => {
+    """ + ACTIVE_BUBBLES_JS + """
+    let oldest = null;
+    let newest = null;
+    for (const bubble of activeBubbles(peerId)) {
+        const mid = Number(bubble.getAttribute('data-mid'));
+        if (!Number.isInteger(mid)) {
+            continue;
+        }
+        oldest = oldest === null || mid < oldest ? mid : oldest;
+        newest = newest === null || mid > newest ? mid : newest;
+    }
+    return {oldest, newest};
+}"""
+
+# لیست پیام‌ها یک صفحه به بالا یا پایین اسکرول می‌شود (direction صفر فقط وضعیت را می‌خواند)
+SCROLL_SCRIPT = """(direction) => {
+    const scrollable = document.querySelector(
+        '#column-center .bubbles .scrollable-y, #column-center .scrollable-y, .bubbles .scrollable'
+    );
+    if (!scrollable) {
+        return null;
+    }
+    const before = scrollable.scrollTop;
+    if (direction !== 0) {
+        scrollable.scrollTop = direction < 0
+            ? Math.max(0, before - scrollable.clientHeight)
+            : before + scrollable.clientHeight;
+        scrollable.dispatchEvent(new Event('scroll'));
+    }
+    return {
+        moved: scrollable.scrollTop !== before,
+        atBottom: scrollable.scrollTop + scrollable.clientHeight >= scrollable.scrollHeight - 2
+    };
+}"""
+
+# بعد از اسکرول، صبر تا پیام قدیمی‌تر یا جدیدتری رندر شود
+RENDERED_SCRIPT = """([peerId, direction, mid]) => {
+    """ + ACTIVE_BUBBLES_JS + """
+    for (const bubble of activeBubbles(peerId)) {
+        const value = Number(bubble.getAttribute('data-mid'));
+        if (Number.isInteger(value) && (direction < 0 ? value < mid : value > mid)) {
+            return true;
+        }
+    }
+    return false;
+}"""
+
+
+class ScrollBackfill:
+    """Recover messages older than the rendered bubbles by scrolling back
+
+    When every rendered bubble is newer than the last processed message,
+    the history is scrolled up until that message is rendered, then read
+    forward again one viewport at a time. Bubbles are yielded oldest
+    first in batches of at most batch_size, so only one viewport of
+    bubbles is held at once however long the gap is.
+    """
+
+    def __init__(self, config, readiness, info_logger=None, error_logger=None):
+        self.readiness = readiness
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        backfill_config = config['eitaa'].get('backfill', {})
+        self.enabled = backfill_config.get('enabled', False)
+        self.batch_size = max(1, backfill_config.get('batch_size', 20))  # پیش‌فرض 20 پیام در هر دسته
+        self.max_scrolls = backfill_config.get('max_scrolls', 200)
+        self.scroll_timeout = backfill_config.get('scroll_timeout', 5)
+
+    def has_gap(self, page, peer_id, last_message_id):
+        """True when messages between last_message_id and the oldest bubble of peer_id are not rendered"""
+        if not self.enabled or not last_message_id or not str(last_message_id).isdigit():
+            return False
+        rendered = page.evaluate(RANGE_SCRIPT, str(peer_id))
+        return rendered['oldest'] is not None and rendered['oldest'] > int(last_message_id)
+
+    def _scroll(self, page, peer_id, direction, mid):
+        """Scroll one viewport and wait for a bubble beyond mid, return the scroll state
+
+        Scrolling up only waits once the top is reached, where older
+        messages are loaded.
+        """
+        state = page.evaluate(SCROLL_SCRIPT, direction)
+        if state is None or (direction < 0 and state['moved']):
+            return state
+        # در بالای لیست، ایتا پیام‌های قدیمی‌تر را با تاخیر لود می‌کند
+        self.readiness.wait(
+            'backfill_scroll',
+            lambda ms: page.wait_for_function(RENDERED_SCRIPT, arg=[str(peer_id), direction, mid], timeout=ms),
+            self.scroll_timeout
+        )
+        return state
+
+    def _rewind(self, page, peer_id, last_id):
+        """Scroll up until last_id (or anything older) is rendered"""
+        for _ in range(self.max_scrolls):
+            oldest = page.evaluate(RANGE_SCRIPT, str(peer_id))['oldest']
+            if oldest is None or oldest <= last_id:
+                return True
+            state = self._scroll(page, peer_id, -1, oldest)
+            if state is None:
+                break
+            if not state['moved'] and page.evaluate(RANGE_SCRIPT, str(peer_id))['oldest'] == oldest:
+                # در بالای لیست هستیم و چیزی قدیمی‌تر لود نشد، به ابتدای تاریخچه رسیده‌ایم
+                break
+        return False
+
+    def batches(self, page, peer_id, last_message_id):
+        """Yield lists of peer_id's bubbles newer than last_message_id, oldest first"""
+        cursor = int(last_message_id)
+        if not self._rewind(page, peer_id, cursor):
+            self.info_logger.warning(
+                f"Backfill could not reach message {cursor}, starting from the oldest loaded message"
+            )
+
+        for _ in range(self.max_scrolls):
+            _, bubbles = extract_messages(page, peer_id, str(cursor))
+            bubbles.sort(key=lambda bubble: int(bubble['mid']))
+            for i in range(0, len(bubbles), self.batch_size):
+                batch = bubbles[i:i + self.batch_size]
+                yield batch
+                cursor = int(batch[-1]['mid'])
+            # همه پیام‌های رندر شده خوانده شدند؛ اگر پایین لیست هستیم کار تمام است
+            state = page.evaluate(SCROLL_SCRIPT, 0)
+            if state is None or state['atBottom']:
+                return
+            self._scroll(page, peer_id, 1, cursor)
+        self.error_logger.error(f"Backfill stopped after {self.max_scrolls} scrolls at message {cursor}")
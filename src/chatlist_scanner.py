@@ -0,0 +1,81 @@
+# وضعیت همه ردیف‌های لیست چت در یک رفت‌وبرگشت خوانده می‌شود
+SCAN_SCRIPT = """() => {
+    const rows = {};
+    for (const row of document.querySelectorAll('.chatlist-container li.chatlist-chat[data-peer-id]')) {
+        const text = (selector) => {
+            const element = row.querySelector(selector);
+            return element ? element.textContent.trim() : '';
+        };
+        const badge = text('.dialog-subtitle-badge, .badge-unread, .badge');
+        rows[row.getAttribute('data-peer-id')] = {
+            mid: row.getAttribute('data-mid') || row.getAttribute('data-last-mid') || '',
+            unread: /^\\d+$/.test(badge) ? Number(badge) : (badge ? 1 : 0),
+            time: text('.message-time, .dialog-title-details'),
+            preview: text('.dialog-subtitle, .user-last-message')
+        };
+    }
+    return rows;
+}"""
+
+
+class ChatlistScanner:
+    """Decide which channels to open from one read of the chat list
+
+    A channel is opened when it has an unread badge or its last message
+    (data-mid, or the preview and time when there is none) differs from
+    what was seen the last time it was processed. Channels never seen, or
+    not rendered in the list, are opened too, and every full_poll_every
+    cycles all channels are opened as a safety net.
+    """
+
+    def __init__(self, config, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        scan_config = config['eitaa'].get('chatlist_scan', {})
+        self.enabled = scan_config.get('enabled', False)
+        self.full_poll_every = scan_config.get('full_poll_every', 10)  # پیش‌فرض هر 10 دور همه کانال‌ها
+        self.cycle = 0
+        # channel_id -> امضای آخرین پیامی که پردازش شده
+        self.seen = {}
+        self.current = {}
+
+    @staticmethod
+    def signature(row):
+        if row['mid']:
+            return row['mid']
+        return f"{row['time']}|{row['preview']}"
+
+    def changed(self, page, channel_ids):
+        """Return the channel_ids that need to be opened this cycle"""
+        if not self.enabled:
+            return list(channel_ids)
+        self.cycle += 1
+        try:
+            rows = page.evaluate(SCAN_SCRIPT)
+        except Exception as e:
+            self.error_logger.error(f"Error scanning chat list, opening every channel: {e}")
+            return list(channel_ids)
+
+        self.current = {}
+        full_poll = self.full_poll_every and (self.cycle - 1) % self.full_poll_every == 0
+        selected = []
+        for channel_id in channel_ids:
+            row = rows.get(str(channel_id))
+            if row is None:
+                # ردیف رندر نشده؛ کانال‌های تازه‌فعال بالای لیست می‌آیند
+                if full_poll or channel_id not in self.seen:
+                    selected.append(channel_id)
+                continue
+            self.current[channel_id] = self.signature(row)
+            if full_poll or row['unread'] or self.seen.get(channel_id) != self.current[channel_id]:
+                selected.append(channel_id)
+
+        self.info_logger.info(f"Chat list scan: {len(selected)} of {len(channel_ids)} channels changed")
+        return selected
+
+    def mark_seen(self, channel_id):
+        """Remember the scanned state of a channel after it was processed"""
+        if channel_id in self.current:
+            self.seen[channel_id] = self.current[channel_id]
+        else:
+            self.seen.setdefault(channel_id, None)
@@ -0,0 +1,99 @@
+import json
+import os
+import sqlite3
+
+
+class JsonCheckpointStore:
+    """All channel cursors in memory, flushed to one JSON file atomically"""
+
+    def __init__(self, file_path, info_logger=None, error_logger=None):
+        self.file_path = file_path
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        self.cursors = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        """Read the file once at startup"""
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if not os.path.exists(self.file_path):
+            self.info_logger.info(f"Creating new {os.path.basename(self.file_path)} file...")
+            self._dirty = True
+            self.flush()
+            return
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self.cursors = json.load(f)
+        except json.JSONDecodeError:
+            self.error_logger.warning("Invalid JSON file, creating new one...")
+            self.cursors = {}
+            self._dirty = True
+            self.flush()
+
+    def get(self, channel_id):
+        return self.cursors.get(channel_id)
+
+    def set(self, channel_id, message_id):
+        if self.cursors.get(channel_id) != message_id:
+            self.cursors[channel_id] = message_id
+            self._dirty = True
+
+    def flush(self):
+        """Write temp file, fsync, then rename over the old one"""
+        if not self._dirty:
+            return
+        tmp_file = self.file_path + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.cursors, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.file_path)
+        self._dirty = False
+
+
+class SqliteCheckpointStore:
+    """Channel cursors in SQLite; only changed rows are written on flush"""
+
+    def __init__(self, file_path, info_logger=None, error_logger=None):
+        self.file_path = file_path
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        self.conn = sqlite3.connect(file_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS cursors (channel_id TEXT PRIMARY KEY, message_id TEXT)'
+        )
+        self.conn.commit()
+        self.cursors = dict(self.conn.execute('SELECT channel_id, message_id FROM cursors'))
+        self.changed = {}
+
+    def get(self, channel_id):
+        return self.cursors.get(channel_id)
+
+    def set(self, channel_id, message_id):
+        if self.cursors.get(channel_id) != message_id:
+            self.cursors[channel_id] = message_id
+            self.changed[channel_id] = message_id
+
+    def flush(self):
+        """Write every changed cursor in one transaction"""
+        if not self.changed:
+            return
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cursors (channel_id, message_id) VALUES (?, ?)',
+                list(self.changed.items())
+            )
+        self.changed = {}
+
+
+def create_checkpoint_store(config, info_logger=None, error_logger=None):
+    """Build the checkpoint store selected by eitaa.checkpoint_backend"""
+    base_dir = os.path.dirname(os.path.dirname(__file__))
+    backend = config['eitaa'].get('checkpoint_backend', 'json')  # پیش‌فرض همان فایل json
+    if backend == 'sqlite':
+        db_file = os.path.join(base_dir, 'config', config['paths'].get('checkpoint_db', 'checkpoints.db'))
+        return SqliteCheckpointStore(db_file, info_logger, error_logger)
+    file_path = os.path.join(base_dir, 'config', config['paths']['last_message_file'])
+    return JsonCheckpointStore(file_path, info_logger, error_logger)
@@ -0,0 +1,209 @@
+import http.client
+import json
+import time
+from urllib.parse import urlencode, urlsplit
+
+from .message_record import MessageRecord
+
+
+class EitaaApiError(Exception):
+    """Raised when the history endpoint cannot be used; callers fall back to the browser"""
+
+
+def api_endpoint(config):
+    """Return (base_url, history_path) from eitaa.api
+
+    Neither has a default: Eitaa web itself talks MTProto, so the history
+    endpoint is whatever the deployment provides. Raises ValueError when
+    either is missing.
+    """
+    api_config = config['eitaa'].get('api', {})
+    missing = [key for key in ('base_url', 'history_path') if not api_config.get(key)]
+    if missing:
+        raise ValueError(f"eitaa.api is enabled but {' and '.join(missing)} not set")
+    return api_config['base_url'], api_config['history_path']
+
+
+class ApiCircuitBreaker:
+    """Stop calling the API for a channel that keeps falling back to the browser
+
+    After max_failures failed fetches in a row the channel is read in the
+    browser only, for cooldown seconds. After that the API is tried
+    again, and one more failure pauses it for another cooldown.
+    """
+
+    def __init__(self, max_failures=3, cooldown=600, info_logger=None):
+        self.max_failures = max(1, max_failures)
+        self.cooldown = cooldown
+        self.info_logger = info_logger
+        self.failures = {}
+        self.paused_until = {}
+
+    def allow(self, channel_id, now=None):
+        """True when the API may be used for channel_id now"""
+        paused_until = self.paused_until.get(channel_id)
+        if paused_until is None:
+            return True
+        if (now or time.time()) < paused_until:
+            return False
+        del self.paused_until[channel_id]
+        self.failures[channel_id] = self.max_failures - 1
+        return True
+
+    def success(self, channel_id):
+        self.failures.pop(channel_id, None)
+
+    def failure(self, channel_id, now=None):
+        """Count a fallback, return True when it paused the API for channel_id"""
+        self.failures[channel_id] = self.failures.get(channel_id, 0) + 1
+        if self.failures[channel_id] < self.max_failures:
+            return False
+        self.paused_until[channel_id] = (now or time.time()) + self.cooldown
+        self.info_logger.warning(
+            f"API failed {self.failures[channel_id]} times for channel {channel_id}, "
+            f"using the browser for {self.cooldown}s"
+        )
+        return True
+
+
+def api_message_to_record(message, channel_id=None):
+    """Map one API message to a MessageRecord
+
+    media is one {"url": ..., "type": ...} object, or a list of them
+    for an album; type is photo (the default), video, document, voice
+    or audio.
+    """
+    media = message.get('media') or []
+    if isinstance(media, dict):
+        media = [media]
+    time_sent = message.get('time')
+    if not time_sent and message.get('date'):
+        time_sent = time.strftime('%Y-%m-%d %H:%M', time.localtime(message['date']))
+    views = message.get('views')
+    return MessageRecord(
+        str(message['id']),
+        message.get('sender', ''),
+        time_sent or '',
+        str(views) if views is not None else None,
+        message.get('text', ''),
+        bool(media),
+        [item.get('url') for item in media],
+        channel_id,
+        group_id=message.get('grouped_id'),
+        media_kinds=[item.get('type') or 'photo' for item in media]
+    )
+
+
+class EitaaApiClient:
+    """Poll channel history over HTTP with the session saved in auth.json
+
+    The endpoint must be configured under eitaa.api (base_url,
+    history_path, see api_endpoint) and is expected to answer with JSON
+    like:
+
+        {"messages": [{"id": 123, "sender": "...", "time": "...",
+                       "views": 10, "text": "...", "media": {"url": "..."}}]}
+
+    Records are returned as MessageRecords, so process_messages can
+    treat them like parsed DOM bubbles. One keep-alive connection is
+    reused for every request.
+    """
+
+    def __init__(self, config, session_file, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        api_config = config['eitaa'].get('api', {})
+        self.base_url, self.history_path = api_endpoint(config)
+        self.timeout = api_config.get('timeout', 15)  # پیش‌فرض 15 ثانیه
+        self.limit = api_config.get('limit', 50)
+        self.token_key = api_config.get('token_key')
+        self.token_header = api_config.get('token_header', 'Authorization')
+
+        parts = urlsplit(self.base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.headers = self._session_headers(session_file)
+        self.conn = None
+
+    def _session_headers(self, session_file):
+        """Build Cookie and token headers from a Playwright storage_state file"""
+        headers = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+        try:
+            with open(session_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.error_logger.error(f"Error reading session for API client: {e}")
+            return headers
+
+        cookies = [
+            f"{c['name']}={c['value']}" for c in state.get('cookies', [])
+            if self.host.endswith(c.get('domain', '').lstrip('.'))
+        ]
+        if cookies:
+            headers['Cookie'] = '; '.join(cookies)
+
+        if self.token_key:
+            origin = f"{self.scheme}://{self.host}" + (f":{self.port}" if self.port else '')
+            for entry in state.get('origins', []):
+                if entry.get('origin') != origin:
+                    continue
+                for item in entry.get('localStorage', []):
+                    if item['name'] == self.token_key:
+                        headers[self.token_header] = item['value']
+        return headers
+
+    def _connection(self):
+        if self.conn is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            self.conn = connection_class(self.host, self.port, timeout=self.timeout)
+        return self.conn
+
+    def _get(self, path):
+        """GET path and return decoded JSON, retrying once on a stale connection"""
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.request('GET', path, headers=self.headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if attempt:
+                    raise EitaaApiError(f"Request failed: {e}")
+                continue
+            if response.status in (401, 403):
+                raise EitaaApiError(f"Session rejected by API (HTTP {response.status})")
+            if response.status != 200:
+                raise EitaaApiError(f"Unexpected HTTP {response.status}")
+            try:
+                return json.loads(body)
+            except ValueError as e:
+                raise EitaaApiError(f"Invalid JSON from API: {e}")
+
+    def fetch_history(self, channel_id, last_message_id=None):
+        """Return (newest_mid, records) for messages newer than last_message_id"""
+        query = {'limit': self.limit}
+        if last_message_id and str(last_message_id).isdigit():
+            query['after'] = last_message_id
+        path = self.history_path.format(channel_id=channel_id) + '?' + urlencode(query)
+        data = self._get(path)
+
+        records = []
+        newest = None
+        last_id = int(last_message_id) if last_message_id and str(last_message_id).isdigit() else None
+        for message in sorted(data.get('messages', []), key=lambda m: int(m['id'])):
+            mid = int(message['id'])
+            newest = mid if newest is None or mid > newest else newest
+            if last_id is not None and mid <= last_id:
+                continue
+            records.append(api_message_to_record(message, channel_id))
+        return (str(newest) if newest is not None else None), records
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
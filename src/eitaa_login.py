@@ -2,9 +2,20 @@ import os
 import json
 import time
 from playwright.sync_api import sync_playwright
+from .page_pool import ChannelPagePool
+from .message_watcher import MessageWatcher
+from .readiness import Readiness
+from .media_fetcher import MediaFetcher
+from .media_store import MediaStore
+from .resource_policy import ResourcePolicy
+from .eitaa_api import ApiCircuitBreaker, EitaaApiClient, EitaaApiError, api_endpoint
+from .fetch_backend import ApiBackend, BrowserBackend
+from .chatlist_scanner import ChatlistScanner
+from .backfill import ScrollBackfill
+from . import metrics
 
 class EitaaLogin:
-    def __init__(self, config, show_browser=False, info_logger=None, error_logger=None):
+    def __init__(self, config, show_browser=False, info_logger=None, error_logger=None, media_store=None):
         self.config = config
         self.show_browser = show_browser
         self.info_logger = info_logger
@@ -13,7 +24,33 @@ class EitaaLogin:
         self.browser = None
         self.context = None
         self.page = None
+        self.page_pool = None
+        self._page_fresh = False
+        self.message_watcher = None
+        self.media_store = media_store or MediaStore(config, info_logger, error_logger)
+        self.media_fetcher = MediaFetcher(config, self.media_store, info_logger, error_logger)
+        self.resource_policy = ResourcePolicy(config, info_logger, error_logger)
+        self.api_client = None
+        api_config = config['eitaa'].get('api', {})
+        if api_config.get('enabled', False):
+            # تنظیمات ناقص API همان ابتدا خطا می‌دهد، نه در هر بررسی کانال
+            api_endpoint(config)
+        self.api_breaker = ApiCircuitBreaker(
+            api_config.get('max_failures', 3),  # پیش‌فرض 3 خطای پشت سر هم
+            api_config.get('cooldown', 600),  # پیش‌فرض 10 دقیقه فقط مرورگر
+            info_logger
+        )
+        self.chatlist_scanner = ChatlistScanner(config, info_logger, error_logger)
+        self.readiness = Readiness(
+            self.config['eitaa'].get('readiness_timeout', 10),  # پیش‌فرض 10 ثانیه
+            info_logger,
+            error_logger
+        )
+        self.backfill = ScrollBackfill(config, self.readiness, info_logger, error_logger)
+        if self.config['eitaa'].get('push_mode', {}).get('enabled', False):
+            self.message_watcher = MessageWatcher(info_logger, error_logger)
         self.error_count = 0
+        metrics.CONSECUTIVE_ERRORS.set_function(lambda: self.error_count)
         self.error_count_file = os.path.join(
             os.path.dirname(os.path.dirname(__file__)), 
             'config', 
@@ -23,36 +60,66 @@ class EitaaLogin:
 
     def initialize(self):
         """Initialize browser"""
+        start_time = time.time()
         self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(
-            headless=not self.show_browser,
-            args=[
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-accelerated-2d-canvas',
-                '--disable-gpu'
-            ]
-        )
+        launch_args = [
+            '--no-sandbox',
+            '--disable-setuid-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-accelerated-2d-canvas',
+            '--disable-gpu'
+        ]
         
         # چک کردن وجود فایل auth
         base_dir = os.path.dirname(os.path.dirname(__file__))
         session_file = os.path.join(base_dir, 'config', self.config['paths']['session_file'])
         
-        # ساخت context با storage_state اگر وجود داشت
-        if os.path.exists(session_file):
-            self.context = self.browser.new_context(
-                storage_state=session_file,
-                viewport={'width': 1920, 'height': 1080}
+        profile_config = self.config['eitaa'].get('persistent_profile', {})
+        if profile_config.get('enabled', False):
+            # پروفایل مرورگر روی دیسک می‌ماند، پس کش و IndexedDB و سشن بعد از ری‌استارت حفظ می‌شوند
+            user_data_dir = os.path.join(base_dir, 'config', profile_config.get('user_data_dir', 'browser_profile'))
+            fresh_profile = not os.path.exists(user_data_dir)
+            self.context = self.playwright.chromium.launch_persistent_context(
+                user_data_dir,
+                headless=not self.show_browser,
+                args=launch_args,
+                **self.resource_policy.context_options()
             )
+            self.resource_policy.install(self.context)
+            self.page = self.context.pages[0] if self.context.pages else self.context.new_page()
+            if fresh_profile and os.path.exists(session_file):
+                self._seed_profile(session_file)
+            self.page.goto('https://web.eitaa.com/')
+            if fresh_profile:
+                self._extend_session()
         else:
-            self.context = self.browser.new_context(
-                viewport={'width': 1920, 'height': 1080}
+            self.browser = self.playwright.chromium.launch(
+                headless=not self.show_browser,
+                args=launch_args
             )
-        
-        self.page = self.context.new_page()
-        self.page.goto('https://web.eitaa.com/')
-        
+            
+            # ساخت context با storage_state اگر وجود داشت
+            if os.path.exists(session_file):
+                self.context = self.browser.new_context(
+                    storage_state=session_file,
+                    **self.resource_policy.context_options()
+                )
+            else:
+                self.context = self.browser.new_context(
+                    **self.resource_policy.context_options()
+                )
+            self.resource_policy.install(self.context)
+            
+            self.page = self.context.new_page()
+            self.page.goto('https://web.eitaa.com/')
+            self._extend_session()
+
+        # login() دوباره goto نمی‌کند چون صفحه همین الان باز شده
+        self._page_fresh = True
+        self.info_logger.info(f"Browser ready in {time.time() - start_time:.2f}s")
+
+    def _extend_session(self):
+        """Set localStorage flags that keep the Eitaa session alive"""
         # تنظیم localStorage برای افزایش مدت سشن
         self.page.evaluate("""() => {
             localStorage.setItem('sessionDuration', '31536000000');  // یک سال
@@ -62,6 +129,25 @@ class EitaaLogin:
             sessionStorage.setItem('sessionPersist', 'true');
         }""")
 
+    def _seed_profile(self, session_file):
+        """Copy cookies and localStorage from auth.json into a new profile"""
+        try:
+            with open(session_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('cookies'):
+                self.context.add_cookies(state['cookies'])
+            for origin in state.get('origins', []):
+                if not origin.get('localStorage'):
+                    continue
+                self.page.goto(origin['origin'])
+                self.page.evaluate(
+                    """(items) => items.forEach(({name, value}) => localStorage.setItem(name, value))""",
+                    origin['localStorage']
+                )
+            self.info_logger.info("Seeded new browser profile from auth file")
+        except Exception as e:
+            self.error_logger.error(f"Error seeding browser profile: {e}")
+
     def login(self):
         """Handle login process"""
         try:
@@ -87,8 +173,10 @@ class EitaaLogin:
         try:
             self.info_logger.info("Loading saved session...")
             self.context.storage_state(path=session_file)
-            self.page.goto('https://web.eitaa.com/')
-            time.sleep(2)
+            if not self._page_fresh:
+                self.page.goto('https://web.eitaa.com/')
+            self._page_fresh = False
+            self.readiness.login_state_known(self.page)
             
             if self.is_logged_in():
                 return True
@@ -115,7 +203,6 @@ class EitaaLogin:
         try:
             # استفاده از صفحه موجود
             self.page.goto('https://web.eitaa.com/')
-            time.sleep(2)
 
             # Wait for phone input field
             phone_input_selector = '.input-field-input[data-left-pattern=" ‒‒‒ ‒‒‒ ‒‒‒‒"]'
@@ -144,17 +231,21 @@ class EitaaLogin:
 
             # Enter verification code
             self.page.fill(code_input, code)
-            time.sleep(5)
 
             # Handle password if needed
             try:
                 pwd_input = 'input[type="password"].input-field-input'
-                pwd_field = self.page.wait_for_selector(pwd_input, timeout=5000)
+                # صبر تا لیست چت یا فیلد رمز ظاهر شود
+                self.readiness.wait(
+                    'code_accepted',
+                    lambda ms: self.page.wait_for_selector(f'.chatlist-container, {pwd_input}', timeout=ms)
+                )
+                pwd_field = self.page.query_selector(pwd_input)
                 if pwd_field:
                     pwd = input("\nEnter Eitaa password: ")
                     self.page.fill(pwd_input, pwd)
                     self.page.click('button.btn-primary')
-                    time.sleep(5)
+                    self.readiness.login_state_known(self.page)
             except:
                 pass
 
@@ -207,6 +298,10 @@ class EitaaLogin:
     def close(self):
         """Close browser and cleanup"""
         try:
+            if self.api_client:
+                self.api_client.close()
+            if self.page_pool:
+                self.page_pool.close()
             if self.context:
                 self.context.close()
             if self.browser:
@@ -234,211 +329,272 @@ class EitaaLogin:
         except Exception as e:
             self.error_logger.error(f"Error saving error count: {e}")
 
-    def process_messages(self, message_processor, channel_id, last_message_id=None, telegram_targets=None):
-        """Process messages from channel"""
-        try:
-            # تغییر مسیر ذخیره عکس‌ها به پوشه config
+    def _wait_for_chatlist(self, page, message_processor):
+        """Wait for chat list and make sure the session is still valid"""
+        # صبر برای لود شدن کامل صفحه
+        page.wait_for_load_state('networkidle')
+        page.wait_for_selector('.chatlist-container', timeout=30000)  # 30 ثانیه صبر برای لود لیست چت‌ها
+        self.readiness.chatlist_ready(page)
+
+        # بررسی دقیق وضعیت لاگین قبل از ادامه
+        login_page = page.query_selector('.tabs-tab.page-sign.active')
+        if login_page:
+            # فقط در این حالت که واقعاً صفحه لاگین نمایش داده شده، سشن را پاک می‌کنیم
+            error_msg = (
+                "⚠️ خطای دسترسی به ایتا\n\n"
+                "❌ سشن معتبر نیست\n"
+                "🔑 نیاز به لاگین مجدد"
+            )
+            message_processor.telegram_handler.queue_message(error_msg)
+            
+            # پاک کردن فایل auth.json
             base_dir = os.path.dirname(os.path.dirname(__file__))
-            images_dir = os.path.join(base_dir, 'config', self.config['paths']['images_dir'])
-            if not os.path.exists(images_dir):
-                os.makedirs(images_dir)
-            
-            # Add download event listener
-            current_message_text = None
-            
-            def handle_download(download):
-                file_path = os.path.join(images_dir, download.suggested_filename)
-                self.info_logger.info(f"Starting download of file: {download.suggested_filename}")
-                self.info_logger.info(f"Saving to path: {file_path}")
-                download.save_as(file_path)
-                self.info_logger.info(f"File downloaded successfully to: {file_path}")
-                
-                # ارسال فوری به تلگرام با تارگت‌های مشخص شده
-                if current_message_text:
-                    message_processor.telegram_handler.queue_message(current_message_text, file_path, telegram_targets)
-                    self.info_logger.info(f"Message and image queued for Telegram: {file_path}")
+            session_file = os.path.join(base_dir, 'config', self.config['paths']['session_file'])
+            if os.path.exists(session_file):
+                os.remove(session_file)
+                self.info_logger.info("Removed expired auth file")
             
-            self.page.on("download", handle_download)
+            # برنامه باید بسته شود
+            raise Exception("Session expired, login required")
 
-            # صبر برای لود شدن کامل صفحه
-            self.page.wait_for_load_state('networkidle')
-            self.page.wait_for_selector('.chatlist-container', timeout=30000)  # 30 ثانیه صبر برای لود لیست چت‌ها
-            time.sleep(5)  # افزایش از 2 به 5 ثانیه برای اطمینان از لود کامل
+    def _click_channel(self, page, message_processor, channel_id):
+        """Click channel in chat list, disable it if missing"""
+        channel_selector = f'li.chatlist-chat[data-peer-id="{channel_id}"]'
+        channel = page.query_selector(channel_selector)
+        
+        if not channel:
+            # در این حالت کانال پیدا نشده، اما لاگین هستیم
+            error_msg = f"⚠️ کانال {channel_id} پیدا نشد\n\nکانال غیرفعال شد."
+            message_processor.telegram_handler.queue_message(error_msg)
+            # تغییر وضعیت کانال به disabled
+            for ch in self.config['eitaa']['channels']:
+                if ch['id'] == channel_id:
+                    ch['status'] = 'disabled'
+                    break
+            # ذخیره تغییرات در کانفیگ
+            base_dir = os.path.dirname(os.path.dirname(__file__))
+            config_path = os.path.join(base_dir, 'config', 'config.json')
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(self.config, f, indent=4, ensure_ascii=False)
+            return False
 
-            # بررسی دقیق وضعیت لاگین قبل از ادامه
-            login_page = self.page.query_selector('.tabs-tab.page-sign.active')
-            if login_page:
-                # فقط در این حالت که واقعاً صفحه لاگین نمایش داده شده، سشن را پاک می‌کنیم
-                error_msg = (
-                    "⚠️ خطای دسترسی به ایتا\n\n"
-                    "❌ سشن معتبر نیست\n"
-                    "🔑 نیاز به لاگین مجدد"
+        channel.click()
+        return True
+
+    def changed_channels(self, message_processor, channel_ids):
+        """Return the channels worth opening, from one scan of the chat list"""
+        if not self.chatlist_scanner.enabled or not channel_ids:
+            return list(channel_ids)
+        self._wait_for_chatlist(self.page, message_processor)
+        return self.chatlist_scanner.changed(self.page, channel_ids)
+
+    def get_page_pool(self):
+        """Create the channel page pool on first use"""
+        if self.page_pool is None:
+            max_pages = self.config['eitaa'].get('page_pool', {}).get('max_pages', 3)  # پیش‌فرض 3 صفحه
+            self.page_pool = ChannelPagePool(
+                self.context, max_pages, self.page, self.info_logger, self.error_logger
+            )
+        return self.page_pool
+
+    def _get_api_client(self):
+        """Create the direct API client on first use when eitaa.api is enabled"""
+        if self.api_client is None and self.config['eitaa'].get('api', {}).get('enabled', False):
+            base_dir = os.path.dirname(os.path.dirname(__file__))
+            session_file = os.path.join(base_dir, 'config', self.config['paths']['session_file'])
+            self.api_client = EitaaApiClient(self.config, session_file, self.info_logger, self.error_logger)
+        return self.api_client
+
+    def _release_page(self, channel_id):
+        """Unpin channel from its page and stop watching it"""
+        page = self.page_pool.pages.get(channel_id)
+        if page and self.message_watcher:
+            self.message_watcher.unwatch(page)
+        self.page_pool.release(channel_id)
+
+    def open_channels(self, message_processor, channel_ids):
+        """Open a batch of channels, each in its own pooled page
+
+        Pages already pinned to a channel are left as they are, so the
+        settle wait is paid once per batch instead of once per channel.
+        Returns channel_id -> page for the channels that could be opened.
+        """
+        page_pool = self.get_page_pool()
+        opened = {}
+        clicked = []
+        for channel_id in channel_ids:
+            try:
+                page, needs_open = page_pool.acquire(channel_id)
+                if needs_open:
+                    self._wait_for_chatlist(page, message_processor)
+                    if not self._click_channel(page, message_processor, channel_id):
+                        self._release_page(channel_id)
+                        continue
+                    clicked.append(channel_id)
+                    if self.message_watcher:
+                        self.message_watcher.watch(page, channel_id)
+                opened[channel_id] = page
+            except Exception as e:
+                self.error_logger.error(f"Error opening channel {channel_id}: {e}")
+                self._release_page(channel_id)
+                if "Session expired" in str(e):
+                    raise
+
+        # صفحه‌ها هم‌زمان لود می‌شوند، پس انتظار هر کدام از بقیه کم می‌کند
+        for channel_id in clicked:
+            self.readiness.chat_opened(opened[channel_id], channel_id)
+        return opened
+
+    def _download_with_viewer(self, page, msg_id, images_dir, media_key=None):
+        """Download a bubble's image through the media viewer, return its path"""
+        if media_key:
+            cached = self.media_store.lookup(media_key)
+            if cached:
+                return cached
+
+        # mid ها بین کانال‌ها یکتا نیستند، پس فقط در چت فعال جستجو می‌شود
+        media_container = page.query_selector(f'.chat.active div.bubble[data-mid="{msg_id}"] div.media-container')
+        if not media_container:
+            return None
+        
+        file_path = None
+        try:
+            media_container.click()
+            self.info_logger.info(f"Opening image in message: {msg_id}")
+            
+            download_button = page.wait_for_selector('.btn-icon.tgico-download', timeout=5000)
+            if download_button:
+                self.info_logger.info(f"Found download button for message: {msg_id}")
+                with metrics.MEDIA_DOWNLOAD_SECONDS.time('viewer'):
+                    download = self.readiness.download(page, download_button.click)
+                if download:
+                    download_path = os.path.join(images_dir, download.suggested_filename)
+                    download.save_as(download_path)
+                    file_path = self.media_store.put_file(download_path, media_key)
+                    self.info_logger.info(f"Download saved to path: {file_path}")
+            
+            page.keyboard.press('Escape')
+            self.readiness.viewer_closed(page)
+            
+        except Exception as img_error:
+            self.error_logger.error(f"Error with image in message {msg_id}: {str(img_error)}")
+            try:
+                page.keyboard.press('Escape')
+            except:
+                pass
+        return file_path
+
+    def _backend_for(self, message_processor, channel_id, last_message_id, page, opened):
+        """Fetch with the API backend when enabled, else read the channel in the browser"""
+        # در حالت API کانال اصلا در مرورگر باز نمی‌شود
+        api_client = self._get_api_client()
+        if api_client and self.api_breaker.allow(channel_id):
+            backend = ApiBackend(api_client, self.media_fetcher, page)
+            try:
+                result = backend, backend.fetch(channel_id, last_message_id)
+                self.api_breaker.success(channel_id)
+                return result
+            except EitaaApiError as e:
+                self.error_logger.error(f"API fetch failed for channel {channel_id}, using browser: {e}")
+                self.api_breaker.failure(channel_id)
+                if 'Session rejected' in str(e):
+                    # بعد از لاگین دوباره، کلاینت با auth.json جدید ساخته می‌شود
+                    api_client.close()
+                    self.api_client = None
+
+        backend = BrowserBackend(self, message_processor, page, opened)
+        return backend, backend.fetch(channel_id, last_message_id)
+
+    def _backfill(self, message_processor, backend, channel_id, last_message_id, telegram_targets):
+        """Forward a gap larger than one read in batches, return (last forwarded id, completed)
+
+        Progress is committed after every batch, so a restart resumes
+        from the last batch instead of the start of the gap.
+        """
+        self.info_logger.info(f"Channel {channel_id}: gap after message {last_message_id}, backfilling")
+        cursor = last_message_id
+        recovered = 0
+        completed = True
+        try:
+            for records in backend.backfill_batches(channel_id, last_message_id):
+                fetched_media = backend.fetch_media(records, channel_id)
+                message_processor.forward_records(
+                    records,
+                    fetched_media,
+                    telegram_targets,
+                    lambda mid: backend.media_fallback(channel_id, mid)
                 )
-                message_processor.telegram_handler.queue_message(error_msg)
-                
-                # پاک کردن فایل auth.json
-                session_file = os.path.join(base_dir, 'config', self.config['paths']['session_file'])
-                if os.path.exists(session_file):
-                    os.remove(session_file)
-                    self.info_logger.info("Removed expired auth file")
-                
-                # برنامه باید بسته شود
-                raise Exception("Session expired, login required")
+                cursor = records[-1].mid
+                recovered += len(records)
+                message_processor.save_last_message_id(channel_id, cursor)
+                message_processor.telegram_handler.flush_outbox()
+                message_processor.flush_last_message_ids()
+        except Exception as e:
+            # پیشرفت تا آخرین دسته ثبت شده، پس همان برگردانده می‌شود
+            self.error_logger.error(f"Backfill of channel {channel_id} stopped at {cursor}: {e}")
+            completed = False
+        metrics.MESSAGES_BACKFILLED.inc(channel_id, amount=recovered)
+        self.info_logger.info(f"Channel {channel_id}: backfill recovered {recovered} messages up to {cursor}")
+        return cursor, completed
+
+    def process_messages(self, message_processor, channel_id, last_message_id=None, telegram_targets=None, page=None):
+        """Process messages from channel, return (last message id, ok)
+
+        ok is False when the channel could not be read or the poll failed,
+        so the caller does not treat the channel as checked. When page is
+        given the channel is expected to be open on it already (see
+        open_channels), otherwise the channel is opened on self.page.
+        """
+        opened = page is not None
+        page = page or self.page
+        poll_start = time.monotonic()
+        try:
+            backend, result = self._backend_for(message_processor, channel_id, last_message_id, page, opened)
+            if result is None:
+                return last_message_id, False
+            newest_id, messages = result
+
+            if backend.gap:
+                newest_id, completed = self._backfill(
+                    message_processor, backend, channel_id, last_message_id, telegram_targets
+                )
+                self.error_count = 0
+                self._save_error_count()
+                return newest_id, completed
 
-            # Click on the channel
-            channel_selector = f'li.chatlist-chat[data-peer-id="{channel_id}"]'
-            channel = self.page.query_selector(channel_selector)
-            
-            if not channel:
-                # در این حالت کانال پیدا نشده، اما لاگین هستیم
-                error_msg = f"⚠️ کانال {channel_id} پیدا نشد\n\nکانال غیرفعال شد."
-                message_processor.telegram_handler.queue_message(error_msg)
-                # تغییر وضعیت کانال به disabled
-                for ch in self.config['eitaa']['channels']:
-                    if ch['id'] == channel_id:
-                        ch['status'] = 'disabled'
-                        break
-                # ذخیره تغییرات در کانفیگ
-                config_path = os.path.join(base_dir, 'config', 'config.json')
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.config, f, indent=4, ensure_ascii=False)
-                return None
-            
-            else:
-                channel.click()
-                
-            time.sleep(5)  # افزایش از 2 به 5 ثانیه برای لود کامل پیام‌ها
-            
-            # Get messages
-            messages = self.page.query_selector_all('div.bubble')
-            if not messages:
-                return last_message_id
-            
-            # Get the newest message ID
-            newest_id = None
-            valid_messages = []
-            
-            for message in messages:
-                try:
-                    msg_id = message.get_attribute('data-mid')
-                    if msg_id:  # Check if msg_id is not None
-                        msg_id = int(msg_id)
-                        if newest_id is None or msg_id > newest_id:
-                            newest_id = msg_id
-                        valid_messages.append(message)
-                except:
-                    continue
-            
             if newest_id is None:
-                return last_message_id
+                return last_message_id, True
             
-            # If we have a last message ID, only process newer messages
             if last_message_id and last_message_id.isdigit():
-                last_id = int(last_message_id)
-                messages = []
-                for m in valid_messages:
-                    try:
-                        current_id = int(m.get_attribute('data-mid'))
-                        if current_id > last_id:
-                            messages.append(m)
-                            self.info_logger.info(f"Found new message with ID: {current_id}")
-                    except:
-                        continue
+                for message in messages:
+                    self.info_logger.info(f"Found new message with ID: {message.mid}")
             else:
-                messages = valid_messages
                 self.info_logger.info("Processing all messages (no last message ID found)")
             
             if not messages:
                 self.info_logger.info(f"No new messages found (all message IDs are <= {last_message_id})")
-                return str(newest_id)
+                return newest_id, True
             
             self.info_logger.info(f"Processing {len(messages)} new messages")
-            
-            for message in messages:
-                try:
-                    msg_id = message.get_attribute('data-mid')
-                    
-                    # Get message text
-                    text_element = message.query_selector('div.message')
-                    if text_element:
-                        full_text = text_element.inner_text()
-                        lines = full_text.splitlines()
-                        lines = [line for line in lines if line.strip()]
-                        
-                        # جدا کردن sender و time قبل از پردازش متن
-                        sender = ""
-                        time_sent = ""
-                        
-                        for line in reversed(lines):
-                            line = line.strip()
-                            if not time_sent and ("بعدازظهر" in line or "قبل‌ازظهر" in line):
-                                time_sent = line
-                            elif not sender and line and not any(x in line for x in ["بعدازظهر", "قبل‌ازظهر"]):
-                                sender = line.rstrip(',').strip()
-                        
-                        # جدا کردن عدد ویو از آخر متن
-                        views_count = None
-                        remaining_lines = []
-                        for line in lines:
-                            if line != sender and line != time_sent:
-                                if line.strip().isdigit() and not views_count:
-                                    views_count = line.strip()
-                                elif not line.strip().endswith(','):
-                                    remaining_lines.append(line)
-                        
-                        # ساخت متن اصلی پیام
-                        message_text = '\n'.join(remaining_lines)
-                        
-                        # Format message
-                        current_message_text = f"Message from Eitaa:\n\n"
-                        current_message_text += f"Sender: {sender}\n"
-                        current_message_text += f"Time: {time_sent}\n"
-                        current_message_text += f"Text:\n{message_text}"
-                        if views_count:
-                            current_message_text += f"\nViews: {views_count}"
-                    
-                    # Process image if exists
-                    media_container = message.query_selector('div.media-container')
-                    if media_container:
-                        try:
-                            media_container.click()
-                            self.info_logger.info(f"Opening image in message: {msg_id}")
-                            
-                            download_button = self.page.wait_for_selector('.btn-icon.tgico-download', timeout=5000)
-                            if download_button:
-                                self.info_logger.info(f"Found download button for message: {msg_id}")
-                                download_button.click()
-                                time.sleep(1)  # Wait for download
-                            
-                            self.page.keyboard.press('Escape')
-                            time.sleep(0.5)
-                            
-                        except Exception as img_error:
-                            self.error_logger.error(f"Error with image in message {msg_id}: {str(img_error)}")
-                            try:
-                                self.page.keyboard.press('Escape')
-                            except:
-                                pass
-                            # اگر عکس با خطا مواجه شد، فقط متن را ارسال می‌کنیم
-                            if current_message_text:
-                                message_processor.telegram_handler.queue_message(current_message_text)
-                    else:
-                        # اگر پیام عکس ندارد، فقط متن را ارسال می‌کنیم
-                        if current_message_text:
-                            message_processor.telegram_handler.queue_message(current_message_text)
-                    
-                except Exception as e:
-                    self.error_logger.error(f"Error processing message: {str(e)}")
-                    continue
+            metrics.MESSAGES_FETCHED.inc(channel_id, amount=len(messages))
+
+            fetched_media = backend.fetch_media(messages, channel_id)
+            message_processor.forward_records(
+                messages,
+                fetched_media,
+                telegram_targets,
+                lambda mid: backend.media_fallback(channel_id, mid)
+            )
             
             # اگر موفق بود، شمارنده صفر میشه
             self.error_count = 0
             self._save_error_count()
             
-            return str(newest_id)
+            return newest_id, True
             
         except Exception as e:
             error_str = str(e)
+            metrics.POLL_ERRORS.inc(channel_id)
             self.error_count += 1
             self._save_error_count()
             
@@ -461,14 +617,17 @@ class EitaaLogin:
                 message_processor.telegram_handler.queue_message(error_msg)
                 self.error_logger.error(f"Max errors reached ({max_errors}). Last error: {e}")
                 
-                time.sleep(5)  # صبر برای ارسال پیام
-                return last_message_id
+                message_processor.telegram_handler.drain(timeout=5)  # صبر برای ارسال پیام
+                return last_message_id, False
                 
             else:
                 # فقط لاگ خطا، بدون ارسال پیام
                 self.error_logger.error(f"Error {self.error_count} of {max_errors}: {e}")
             
-            return last_message_id
+            return last_message_id, False
+
+        finally:
+            metrics.CHANNEL_POLL_SECONDS.observe(time.monotonic() - poll_start, channel_id)
 
     def _save_cookies(self):
         """Save cookies after successful login"""
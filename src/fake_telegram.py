@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+
+
+class FakeUploadedFile:
+    """Stands in for the InputFile returned by upload_file"""
+
+    def __init__(self, file_path, size):
+        self.file_path = file_path
+        self.size = size
+
+
+class FakeSentMessage:
+    """Result of a fake send; carries no photo/document so no refs are saved"""
+
+    def __init__(self, message_id, target):
+        self.id = message_id
+        self.chat_id = target
+        self.photo = None
+        self.document = None
+
+
+class FakeTelegramClient:
+    """Local stand-in for TelegramClient used by tests and benchmarks
+
+    Implements the calls TelegramHandler makes and records every send in
+    self.sent as (monotonic time, target, caption, file). latency is slept
+    per request to simulate a round trip to Telegram.
+    """
+
+    def __init__(self, latency=0.0, upload_latency=None):
+        self.latency = latency
+        self.upload_latency = latency if upload_latency is None else upload_latency
+        self.sent = []
+        self.uploads = []
+        self.connected = False
+        self._next_id = 1
+
+    async def connect(self):
+        self.connected = True
+
+    async def start(self):
+        return self
+
+    async def disconnect(self):
+        self.connected = False
+
+    async def _request(self, latency):
+        if latency:
+            await asyncio.sleep(latency)
+
+    def _sent(self, target, text, media):
+        sent = FakeSentMessage(self._next_id, target)
+        self._next_id += 1
+        self.sent.append((time.monotonic(), target, text, media))
+        return sent
+
+    async def upload_file(self, file_path):
+        await self._request(self.upload_latency)
+        uploaded = FakeUploadedFile(file_path, os.path.getsize(file_path))
+        self.uploads.append(uploaded)
+        return uploaded
+
+    async def send_message(self, target, message, **options):
+        await self._request(self.latency)
+        return self._sent(target, message, None)
+
+    async def send_file(self, target, file, caption=None, **options):
+        await self._request(self.latency)
+        if isinstance(file, list):
+            # آلبوم: یک درخواست، یک ثبت، یک پیام برای هر فایل
+            sent = [self._sent(target, caption, file)]
+            for _ in file[1:]:
+                sent.append(FakeSentMessage(self._next_id, target))
+                self._next_id += 1
+            return sent
+        return self._sent(target, caption, file)
@@ -0,0 +1,290 @@
+import json
+import mimetypes
+import os
+import time
+from html.parser import HTMLParser
+
+from .eitaa_api import api_message_to_record
+from .message_extractor import extract_messages
+from .message_parser import parse_message_text
+from .message_record import MessageRecord
+
+
+def bubble_to_record(bubble, channel_id=None):
+    """Turn an extracted bubble {mid, text, has_media, media_srcs, media_kinds, group_id} into a MessageRecord
+
+    content is None when the bubble had no text element at all.
+    """
+    if bubble['text'] is None:
+        sender, time_sent, views, content = '', '', None, None
+    else:
+        sender, time_sent, views, content = parse_message_text(bubble['text'])
+    return MessageRecord(
+        bubble['mid'], sender, time_sent, views, content, bubble['has_media'], bubble['media_srcs'], channel_id,
+        group_id=bubble.get('group_id'), media_kinds=bubble.get('media_kinds')
+    )
+
+
+class FetchBackend:
+    """Source of new channel messages
+
+    fetch() returns (newest_mid, records) where records are
+    MessageRecords, oldest first. It returns None when the channel cannot be read at all.
+    fetch_media() returns media key (see MessageRecord.media_items) ->
+    local file path for records with media.
+    gap is set by fetch() when older unread messages were not reachable
+    in one read and the caller should use backfill_batches() instead.
+    """
+
+    gap = False
+
+    def fetch(self, channel_id, last_message_id=None):
+        raise NotImplementedError
+
+    def fetch_media(self, records, channel_id):
+        return {}
+
+    def media_fallback(self, channel_id, mid):
+        """Last-resort media download for one message, or None"""
+        return None
+
+    def backfill_batches(self, channel_id, last_message_id):
+        """Yield record lists newer than last_message_id, oldest first"""
+        return iter(())
+
+
+class BrowserBackend(FetchBackend):
+    """Read messages from the channel's DOM in a Playwright page"""
+
+    def __init__(self, eitaa_login, message_processor, page, opened=False):
+        self.eitaa_login = eitaa_login
+        self.message_processor = message_processor
+        self.page = page
+        self.opened = opened
+        self.gap = False
+
+    def fetch(self, channel_id, last_message_id=None):
+        if not self.opened:
+            self.eitaa_login._wait_for_chatlist(self.page, self.message_processor)
+
+            # Click on the channel
+            if not self.eitaa_login._click_channel(self.page, self.message_processor, channel_id):
+                return None
+
+            self.eitaa_login.readiness.chat_opened(self.page, channel_id)
+
+        newest_id, bubbles = extract_messages(self.page, channel_id, last_message_id)
+        self.gap = self.eitaa_login.backfill.has_gap(self.page, channel_id, last_message_id)
+        return newest_id, [bubble_to_record(bubble, channel_id) for bubble in bubbles]
+
+    def backfill_batches(self, channel_id, last_message_id):
+        for bubbles in self.eitaa_login.backfill.batches(self.page, channel_id, last_message_id):
+            yield [bubble_to_record(bubble, channel_id) for bubble in bubbles]
+
+    def fetch_media(self, records, channel_id):
+        # دانلود مستقیم همه عکس‌ها قبل از پردازش پیام‌ها
+        if not self.eitaa_login.config['eitaa'].get('media', {}).get('direct_fetch', True):
+            return {}
+        return self.eitaa_login.media_fetcher.fetch_all(
+            self.page,
+            [item for r in records for item in r.media_items()],
+            channel_id
+        )
+
+    def media_fallback(self, channel_id, mid):
+        # اگر دانلود مستقیم نشد، از نمایشگر عکس استفاده می‌شود
+        return self.eitaa_login._download_with_viewer(
+            self.page, mid, self.eitaa_login.media_store.images_dir, f"{channel_id}:{mid}"
+        )
+
+
+class ApiBackend(FetchBackend):
+    """Read messages from the HTTP history endpoint"""
+
+    def __init__(self, api_client, media_fetcher, page):
+        self.api_client = api_client
+        self.media_fetcher = media_fetcher
+        self.page = page
+
+    def fetch(self, channel_id, last_message_id=None):
+        return self.api_client.fetch_history(channel_id, last_message_id)
+
+    def fetch_media(self, records, channel_id):
+        return self.media_fetcher.fetch_all(
+            self.page,
+            [item for r in records for item in r.media_items()],
+            channel_id
+        )
+
+
+class _BubbleHTMLParser(HTMLParser):
+    """Collect div.bubble[data-mid] from a saved page like the in-page extractor does"""
+
+    BLOCK_TAGS = {'div', 'p', 'li'}
+
+    def __init__(self):
+        super().__init__()
+        self.bubbles = []
+        self.depth = 0
+        self.bubble_depth = None
+        self.message_depth = None
+        self.media_depth = None
+        self.media_slot = None
+        self.text_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('br', 'img', 'source', 'input', 'hr', 'meta', 'link'):
+            self._void(tag, dict(attrs))
+            return
+        self.depth += 1
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'div' and 'bubble' in classes and attrs.get('data-mid') and self.bubble_depth is None:
+            self.bubble_depth = self.depth
+            self.bubbles.append({
+                'mid': attrs['data-mid'], 'text': None, 'has_media': False, 'media_srcs': [], 'media_kinds': [],
+                'group_id': attrs.get('data-grouped-id') or attrs.get('data-group-id')
+            })
+        elif self.bubble_depth is not None:
+            if self.text_parts is not None and tag in self.BLOCK_TAGS:
+                # مثل innerText، عنصر بلوکی خط جدید شروع می‌کند
+                self.text_parts.append('\n')
+            if tag == 'div' and 'message' in classes and self.message_depth is None:
+                self.message_depth = self.depth
+                self.text_parts = []
+            elif 'album-item' in classes or (self.media_depth is None and (
+                    'media-container' in classes or 'document-container' in classes or tag == 'audio-element')):
+                # هر آیتم آلبوم (یا media-container، سند و صوت) یک فایل دارد، حتی اگر آلبوم داخل media-container باشد
+                self.media_depth = self.depth
+                self.media_slot = {
+                    'container': 'document' if 'document-container' in classes else
+                                 'audio' if tag == 'audio-element' else None,
+                    'voice': 'is-voice' in classes
+                }
+                self.bubbles[-1]['has_media'] = True
+            elif self.media_slot is not None:
+                self.media_slot['voice'] = self.media_slot['voice'] or 'is-voice' in classes
+                if tag in ('video', 'audio'):
+                    self.media_slot.setdefault(tag, attrs.get('src'))
+                    self.media_slot['open'] = tag
+                elif tag == 'a' and attrs.get('href'):
+                    self.media_slot.setdefault('a', attrs['href'])
+
+    def _void(self, tag, attrs):
+        if tag == 'br' and self.text_parts is not None:
+            self.text_parts.append('\n')
+        elif self.media_slot is not None:
+            if tag == 'img':
+                self.media_slot.setdefault('img', attrs.get('src'))
+            elif tag == 'source' and self.media_slot.get('open') and not self.media_slot[self.media_slot['open']]:
+                # مثل currentSrc، اولین source وقتی video یا audio خودش src ندارد
+                self.media_slot[self.media_slot['open']] = attrs.get('src')
+
+    def _close_media(self):
+        """Record the slot's kind and src with the same priority as the extractor"""
+        slot = self.media_slot
+        if 'video' in slot:
+            kind, src = 'video', slot['video']
+        elif 'audio' in slot or slot['container'] == 'audio':
+            kind, src = 'voice' if slot['voice'] else 'audio', slot.get('audio')
+        elif slot['container'] == 'document':
+            kind, src = 'document', slot.get('a')
+        else:
+            kind, src = 'photo', slot.get('img')
+        self.bubbles[-1]['media_srcs'].append(src)
+        self.bubbles[-1]['media_kinds'].append(kind)
+        self.media_slot = None
+
+    def handle_startendtag(self, tag, attrs):
+        self._void(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        if tag in ('br', 'img', 'source', 'input', 'hr', 'meta', 'link'):
+            return
+        if self.text_parts is not None and tag in self.BLOCK_TAGS:
+            self.text_parts.append('\n')
+        if self.depth == self.message_depth:
+            self.bubbles[-1]['text'] = ''.join(self.text_parts).strip('\n')
+            self.message_depth = None
+            self.text_parts = None
+        if self.depth == self.media_depth:
+            self._close_media()
+            self.media_depth = None
+        if self.depth == self.bubble_depth:
+            self.bubble_depth = None
+        self.depth -= 1
+
+    def handle_data(self, data):
+        if self.text_parts is not None:
+            self.text_parts.append(data)
+
+
+class FixtureBackend(FetchBackend):
+    """Serve recorded channel snapshots for offline tests and benchmarks
+
+    Each channel is a file in snapshot_dir: <channel_id>.json in the
+    history API format, or <channel_id>.html saved from the channel
+    page. Relative media paths are resolved against snapshot_dir.
+    latency simulates the time one fetch would take. With a media_store
+    the media files are copied into it like downloaded media would be.
+    """
+
+    def __init__(self, snapshot_dir, latency=0.0, media_store=None):
+        self.snapshot_dir = snapshot_dir
+        self.latency = latency
+        self.media_store = media_store
+        self._cache = {}
+
+    def _load(self, channel_id):
+        """Return (to_record, raw messages sorted by mid) or None
+
+        Only reading the file is cached; messages are turned into records
+        on every fetch, like bubbles read from a live page.
+        """
+        if channel_id not in self._cache:
+            base = os.path.join(self.snapshot_dir, str(channel_id))
+            if os.path.exists(base + '.json'):
+                with open(base + '.json', 'r', encoding='utf-8') as f:
+                    raw = [(int(m['id']), m) for m in json.load(f).get('messages', [])]
+                loaded = (api_message_to_record, raw)
+            elif os.path.exists(base + '.html'):
+                parser = _BubbleHTMLParser()
+                with open(base + '.html', 'r', encoding='utf-8') as f:
+                    parser.feed(f.read())
+                raw = [(int(b['mid']), b) for b in parser.bubbles if b['mid'].isdigit()]
+                loaded = (bubble_to_record, raw)
+            else:
+                loaded = None
+            if loaded is not None:
+                raw.sort(key=lambda item: item[0])
+            self._cache[channel_id] = loaded
+        return self._cache[channel_id]
+
+    def fetch(self, channel_id, last_message_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        loaded = self._load(channel_id)
+        if loaded is None:
+            return None
+        to_record, raw = loaded
+        if not raw:
+            return None, []
+        last_id = int(last_message_id) if last_message_id and str(last_message_id).isdigit() else None
+        newer = [to_record(m, channel_id) for mid, m in raw if last_id is None or mid > last_id]
+        return str(raw[-1][0]), newer
+
+    def fetch_media(self, records, channel_id):
+        media = {}
+        for record in records:
+            for key, src, _ in record.media_items():
+                if src.startswith(('http', 'blob:', 'data:')):
+                    continue
+                path = os.path.join(self.snapshot_dir, src)
+                if not os.path.exists(path):
+                    continue
+                if self.media_store:
+                    content_type = mimetypes.guess_type(path)[0] or 'image/jpeg'
+                    with open(path, 'rb') as f:
+                        path = self.media_store.put(f.read(), content_type, f"{channel_id}:{key}")
+                media[key] = path
+        return media
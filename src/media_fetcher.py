@@ -0,0 +1,218 @@
+import base64
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from . import metrics
+from .media_stream import STREAMED_KINDS, PageMediaStream
+
+# چند فایل را هم‌زمان داخل صفحه دانلود می‌کند و base64 برمی‌گرداند
+FETCH_SCRIPT = """async (items) => {
+    const toBase64 = (buffer) => {
+        const bytes = new Uint8Array(buffer);
+        let binary = '';
+        for (let i = 0; i < bytes.length; i += 0x8000) {
+            binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+        }
+        return btoa(binary);
+    };
+    return Promise.all(items.map(async ({mid, src}) => {
+        try {
+            const response = await fetch(src, {credentials: 'include'});
+            if (!response.ok) {
+                return {mid, error: `HTTP ${response.status}`};
+            }
+            const type = response.headers.get('content-type') || '';
+            return {mid, type, data: toBase64(await response.arrayBuffer())};
+        } catch (e) {
+            return {mid, error: String(e)};
+        }
+    }));
+}"""
+
+# فشرده‌سازی با ffmpeg از stdin؛ ویدیو به 720p و صدا به opus
+COMPRESS_ARGS = {
+    'video': ('.mp4', ['-vf', 'scale=-2:min(720\\,ih)', '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+                       '-c:a', 'aac', '-b:a', '96k', '-movflags', '+faststart']),
+    'voice': ('.ogg', ['-vn', '-c:a', 'libopus', '-b:a', '32k']),
+    'audio': ('.ogg', ['-vn', '-c:a', 'libopus', '-b:a', '64k']),
+}
+
+
+class MediaFetcher:
+    """Fetch bubble media directly instead of going through the viewer"""
+
+    def __init__(self, config, media_store, info_logger=None, error_logger=None):
+        self.config = config
+        self.media_store = media_store
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        media_config = config['eitaa'].get('media', {})
+        self.max_concurrent = max(1, media_config.get('max_concurrent', 4))  # پیش‌فرض 4 دانلود هم‌زمان
+        # اندازه هر تکه‌ای که از صفحه خوانده و روی دیسک نوشته می‌شود
+        self.chunk_size = max(1, media_config.get('stream_chunk_kb', 512)) * 1024  # پیش‌فرض 512 کیلوبایت
+        self.max_upload_bytes = media_config.get('max_upload_mb', 200) * 1024 * 1024  # پیش‌فرض 200 مگابایت
+        self.oversize_action = media_config.get('oversize_action', 'skip')  # پیش‌فرض skip؛ یا compress
+
+    def media_key(self, channel_id, mid, src):
+        """Stable cache key: the URL itself, or channel:mid for blob URLs"""
+        if src and src.startswith('http'):
+            return src
+        return f"{channel_id}:{mid}"
+
+    def fetch_all(self, page, items, channel_id):
+        """Download (key, src, kind) items, return key -> file path or stream
+
+        Keys are message ids, or MessageRecord media keys for albums.
+        Everything goes into the media store and items already in it are
+        not fetched again. Photos are fetched inside the page in groups of
+        max_concurrent so blob: URLs work and at most one group is held
+        in memory at once; video, documents, voice and audio are copied
+        chunk by chunk instead, see spool(). Anything that fails or is
+        skipped is left out so the caller can fall back.
+        """
+        results = {}
+        pending = []
+        for mid, src, kind in items:
+            if not src:
+                continue
+            cached = self.media_store.lookup(self.media_key(channel_id, mid, src))
+            if cached:
+                results[mid] = cached
+            elif kind in STREAMED_KINDS:
+                path = self.spool(page, mid, src, kind, channel_id)
+                if path:
+                    results[mid] = path
+            else:
+                pending.append({'mid': mid, 'src': src})
+
+        items = pending
+        start = time.monotonic()
+        for i in range(0, len(items), self.max_concurrent):
+            group = items[i:i + self.max_concurrent]
+            try:
+                fetched = page.evaluate(FETCH_SCRIPT, group)
+            except Exception as e:
+                self.error_logger.error(f"Error fetching media in page: {e}")
+                fetched = [{'mid': item['mid'], 'error': str(e)} for item in group]
+
+            sources = {item['mid']: item['src'] for item in group}
+            for entry in fetched:
+                mid = entry['mid']
+                file_path = None
+                key = self.media_key(channel_id, mid, sources[mid])
+                if 'data' in entry:
+                    file_path = self.media_store.put(base64.b64decode(entry['data']), entry['type'], key)
+                elif sources[mid].startswith('http'):
+                    # fetch داخل صفحه ممکن است به‌خاطر CORS رد شود
+                    file_path = self._fetch_with_request(page, mid, sources[mid], key)
+                else:
+                    self.error_logger.error(f"Error fetching media for message {mid}: {entry['error']}")
+                if file_path:
+                    results[mid] = file_path
+        if items:
+            metrics.MEDIA_DOWNLOAD_SECONDS.observe(time.monotonic() - start, 'direct')
+        return results
+
+    def _fetch_with_request(self, page, mid, src, key):
+        """Fetch an http(s) media URL through the context's request API"""
+        try:
+            response = page.context.request.get(src)
+            if not response.ok:
+                self.error_logger.error(f"Error fetching media for message {mid}: HTTP {response.status}")
+                return None
+            content_type = response.headers.get('content-type', '')
+            return self.media_store.put(response.body(), content_type, key)
+        except Exception as e:
+            self.error_logger.error(f"Error fetching media for message {mid}: {e}")
+            return None
+
+    def spool(self, page, mid, src, kind, channel_id):
+        """Copy a large media item from the page into the media store
+
+        The file is read in chunk_size parts and written to disk as they
+        arrive, so it is never fully in memory, and the queued message
+        gets a path that survives a restart and can be uploaded again
+        when a send is retried. Files over max_upload_mb are skipped, or
+        with oversize_action "compress" re-encoded with ffmpeg. A file of
+        unknown size is dropped once it passes the limit. Returns the
+        stored path or None.
+        """
+        stream = PageMediaStream(page, self.media_key(channel_id, mid, src), src, kind, self.chunk_size)
+        try:
+            error = stream.open()
+        except Exception as e:
+            error = str(e)
+        if error:
+            self.error_logger.error(f"Error fetching {kind} for message {mid}: {error}")
+            return None
+
+        if stream.file_size is not None and stream.file_size > self.max_upload_bytes:
+            if self.oversize_action == 'compress' and kind in COMPRESS_ARGS:
+                return self._compress(stream, mid)
+            self.info_logger.info(
+                f"Skipping {kind} of message {mid}: {stream.file_size // (1024 * 1024)} MB is over the upload limit"
+            )
+            stream.close()
+            return None
+
+        start = time.monotonic()
+        try:
+            path = self.media_store.put_chunks(self._within_limit(stream), stream.extension, stream.key)
+        except Exception as e:
+            self.error_logger.error(f"Error fetching {kind} for message {mid}: {e}")
+            return None
+        finally:
+            stream.close()
+        metrics.MEDIA_DOWNLOAD_SECONDS.observe(time.monotonic() - start, 'stream')
+        return path
+
+    def _within_limit(self, stream):
+        """Yield the stream's chunks, failing once they pass max_upload_mb"""
+        size = 0
+        for chunk in stream.chunks():
+            size += len(chunk)
+            if size > self.max_upload_bytes:
+                raise ValueError('over the upload limit')
+            yield chunk
+
+    def _compress(self, stream, mid):
+        """Pipe a stream through ffmpeg into the media store, return the path or None"""
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg:
+            self.error_logger.error(f"Cannot compress {stream.kind} of message {mid}: ffmpeg not found, skipping")
+            stream.close()
+            return None
+        extension, args = COMPRESS_ARGS[stream.kind]
+        handle, output_path = tempfile.mkstemp(suffix=extension, dir=self.media_store.images_dir)
+        os.close(handle)
+        start = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                [ffmpeg, '-loglevel', 'error', '-y', '-i', 'pipe:0', *args, output_path],
+                stdin=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            try:
+                for chunk in stream.chunks():
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+            stderr = process.stderr.read()
+            if process.wait() != 0:
+                # ورودی‌هایی که moov آخر فایل دارند از pipe قابل خواندن نیستند
+                raise RuntimeError(stderr.decode(errors='replace').strip()[-200:] or f"exit {process.returncode}")
+            if os.path.getsize(output_path) > self.max_upload_bytes:
+                raise RuntimeError('still over the upload limit')
+            metrics.MEDIA_DOWNLOAD_SECONDS.observe(time.monotonic() - start, 'compress')
+            self.info_logger.info(f"Compressed {stream.kind} of message {mid} to {os.path.getsize(output_path)} bytes")
+            return self.media_store.put_file(output_path, stream.key)
+        except Exception as e:
+            self.error_logger.error(f"Cannot compress {stream.kind} of message {mid}, skipping: {e}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        finally:
+            stream.close()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+class MediaStore:
+    """Content-addressed media cache with a size and age budget
+
+    Files are stored as <sha256><ext> in the images directory, so the same
+    image is kept once however many channels post it. An index next to the
+    files maps media keys (source URL or channel:mid) to hashes and keeps
+    per-hash Telegram file references for later re-sends.
+    """
+
+    def __init__(self, config, info_logger=None, error_logger=None):
+        self.config = config
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        base_dir = os.path.dirname(os.path.dirname(__file__))
+        self.images_dir = os.path.join(base_dir, 'config', config['paths']['images_dir'])
+        os.makedirs(self.images_dir, exist_ok=True)
+        self.index_file = os.path.join(self.images_dir, 'media_index.json')
+
+        media_config = config['eitaa'].get('media', {})
+        self.max_bytes = media_config.get('cache_max_mb', 200) * 1024 * 1024  # پیش‌فرض 200 مگابایت
+        self.max_age = media_config.get('cache_max_age_days', 7) * 86400  # پیش‌فرض 7 روز
+
+        # پیام‌های تلگرام از ترد دیگری رفرنس‌ها را ثبت می‌کنند
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.files = {}
+        self.keys = {}
+        # hash -> کلیدهایی که به آن اشاره می‌کنند، تا حذف یک فایل کل keys را نگردد
+        self.keys_by_hash = {}
+        self._load_index()
+
+    def _load_index(self):
+        """Load index from disk"""
+        try:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.files = data.get('files', {})
+                self.keys = data.get('keys', {})
+        except Exception as e:
+            self.error_logger.error(f"Error loading media index, starting empty: {e}")
+            self.files = {}
+            self.keys = {}
+        self.keys_by_hash = {}
+        for key, file_hash in self.keys.items():
+            self.keys_by_hash.setdefault(file_hash, set()).add(key)
+
+    def path_for(self, file_hash):
+        """Return absolute path for a stored hash"""
+        return os.path.join(self.images_dir, self.files[file_hash]['name'])
+
+    def lookup(self, key):
+        """Return stored path for a media key, or None"""
+        with self._lock:
+            file_hash = self.keys.get(key)
+            if file_hash not in self.files:
+                return None
+            path = self.path_for(file_hash)
+            if not os.path.exists(path):
+                self._forget(file_hash)
+                return None
+            self.files[file_hash]['last_used'] = time.time()
+            self._dirty = True
+            return path
+
+    def put(self, data, content_type='', key=None):
+        """Store bytes and return the file path"""
+        file_hash = hashlib.sha256(data).hexdigest()
+        extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) or '.jpg'
+        with self._lock:
+            if file_hash not in self.files or not os.path.exists(self.path_for(file_hash)):
+                name = file_hash + extension
+                tmp_path = os.path.join(self.images_dir, name + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, os.path.join(self.images_dir, name))
+                self.files[file_hash] = {'name': name, 'size': len(data), 'telegram': None}
+            return self._register(file_hash, key)
+
+    def put_file(self, source_path, key=None):
+        """Move an already downloaded file into the store and return its path"""
+        sha = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return self._adopt(source_path, sha.hexdigest(), os.path.splitext(source_path)[1] or '.jpg', key)
+
+    def put_chunks(self, chunks, extension, key=None):
+        """Write byte chunks into the store as they come and return the path
+
+        Only one chunk is in memory at a time and the hash is computed
+        while writing. If chunks raises, the partial file is removed.
+        """
+        sha = hashlib.sha256()
+        handle, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.images_dir)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self._adopt(tmp_path, sha.hexdigest(), extension, key)
+
+    def _adopt(self, source_path, file_hash, extension, key):
+        """Move a file with a known hash into the store, or drop it if stored"""
+        with self._lock:
+            if file_hash in self.files and os.path.exists(self.path_for(file_hash)):
+                os.remove(source_path)
+            else:
+                name = file_hash + extension
+                size = os.path.getsize(source_path)
+                shutil.move(source_path, os.path.join(self.images_dir, name))
+                self.files[file_hash] = {'name': name, 'size': size, 'telegram': None}
+            return self._register(file_hash, key)
+
+    def _register(self, file_hash, key):
+        """Mark hash as used and map key to it (lock held)"""
+        self.files[file_hash]['last_used'] = time.time()
+        if key:
+            previous = self.keys.get(key)
+            if previous is not None and previous != file_hash:
+                self.keys_by_hash.get(previous, set()).discard(key)
+            self.keys[key] = file_hash
+            self.keys_by_hash.setdefault(file_hash, set()).add(key)
+        self._dirty = True
+        return self.path_for(file_hash)
+
+    def hash_of(self, path):
+        """Return the hash for a stored path, or None if it is not in the store"""
+        name = os.path.basename(path)
+        file_hash = os.path.splitext(name)[0]
+        with self._lock:
+            entry = self.files.get(file_hash)
+            return file_hash if entry and entry['name'] == name else None
+
+    def get_telegram_ref(self, file_hash):
+        """Return the saved Telegram file reference for a hash"""
+        with self._lock:
+            entry = self.files.get(file_hash)
+            return entry.get('telegram') if entry else None
+
+    def set_telegram_ref(self, file_hash, ref):
+        """Remember the Telegram file reference of an uploaded hash"""
+        with self._lock:
+            if file_hash in self.files:
+                self.files[file_hash]['telegram'] = ref
+                self._dirty = True
+
+    def _forget(self, file_hash):
+        """Drop hash and every key pointing to it (lock held)"""
+        self.files.pop(file_hash, None)
+        for key in self.keys_by_hash.pop(file_hash, ()):
+            self.keys.pop(key, None)
+        self._dirty = True
+
+    def evict(self, keep=()):
+        """Remove files past max age, then least recently used over budget
+
+        Files whose path is in keep (still referenced by queued messages)
+        are never removed, even when that leaves the store over budget.
+        """
+        removed = 0
+        keep = set(keep)
+        with self._lock:
+            now = time.time()
+            by_age = sorted(self.files.items(), key=lambda item: item[1].get('last_used', 0))
+            total = sum(entry['size'] for _, entry in by_age)
+            for file_hash, entry in by_age:
+                if total <= self.max_bytes and now - entry.get('last_used', 0) <= self.max_age:
+                    break
+                if self.path_for(file_hash) in keep:
+                    continue
+                try:
+                    os.remove(self.path_for(file_hash))
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    self.error_logger.error(f"Error removing cached media {entry['name']}: {e}")
+                    continue
+                total -= entry['size']
+                self._forget(file_hash)
+                removed += 1
+        if removed:
+            self.info_logger.info(f"Evicted {removed} cached media files")
+        return removed
+
+    def flush(self):
+        """Write the index to disk if it changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = json.dumps({'files': self.files, 'keys': self.keys})
+            self._dirty = False
+        try:
+            tmp_file = self.index_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            self.error_logger.error(f"Error saving media index: {e}")
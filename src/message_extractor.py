@@ -0,0 +1,78 @@
+from . import metrics
+
+# فقط bubble های چت فعالی که هدرش همین peer است؛ صفحه‌ای که قبلا کانال دیگری را
+# نشان داده، تا وقتی چت جدید آماده نشده هنوز bubble های کانال قبلی را دارد
+ACTIVE_BUBBLES_JS = """const activeBubbles = (peerId) => {
+        const chat = document.querySelector('.chat.active');
+        if (!chat || !chat.querySelector(`.chat-info [data-peer-id="${peerId}"]`)) {
+            return [];
+        }
+        return chat.querySelectorAll('.bubbles div.bubble[data-mid]');
+    };"""
+
+# همه bubble های جدیدتر از lastId را در یک رفت‌وبرگشت جمع می‌کند
+EXTRACT_SCRIPT = """([peerId, lastId]) => {
+    """ + ACTIVE_BUBBLES_JS + """
+    let newest = null;
+    const messages = [];
+    for (const bubble of activeBubbles(peerId)) {
+        const mid = Number(bubble.getAttribute('data-mid'));
+        if (!Number.isInteger(mid)) {
+            continue;
+        }
+        if (newest === null || mid > newest) {
+            newest = mid;
+        }
+        if (lastId !== null && mid <= lastId) {
+            continue;
+        }
+        const textElement = bubble.querySelector('div.message');
+        // آلبوم: هر album-item یک عکس یا ویدیو است، وگرنه هر media-container، سند یا صوت
+        const albumItems = bubble.querySelectorAll('.album-item');
+        const containers = albumItems.length ? albumItems
+            : bubble.querySelectorAll('div.media-container, .document-container, audio-element');
+        const mediaSrcs = [];
+        const mediaKinds = [];
+        for (const container of containers) {
+            const video = container.querySelector('video');
+            const audio = container.querySelector('audio');
+            let kind = 'photo';
+            let element = container.querySelector('img');
+            if (video) {
+                kind = 'video';
+                element = video;
+            } else if (audio || container.matches('audio-element')) {
+                kind = container.matches('.is-voice') || container.querySelector('.is-voice') ? 'voice' : 'audio';
+                element = audio;
+            } else if (container.matches('.document-container')) {
+                kind = 'document';
+                element = container.querySelector('a[href]');
+            }
+            mediaSrcs.push(element ? (element.currentSrc || element.src || element.href || null) : null);
+            mediaKinds.push(kind);
+        }
+        messages.push({
+            mid: String(mid),
+            text: textElement ? textElement.innerText : null,
+            has_media: containers.length > 0,
+            media_srcs: mediaSrcs,
+            media_kinds: mediaKinds,
+            group_id: bubble.getAttribute('data-grouped-id') || bubble.getAttribute('data-group-id') || null
+        });
+    }
+    return {newest: newest === null ? null : String(newest), messages};
+}"""
+
+
+def extract_messages(page, peer_id, last_message_id=None):
+    """Return (newest_mid, messages) for every bubble of peer_id newer than last_message_id
+
+    Each message is a plain dict {mid, text, has_media, media_srcs,
+    media_kinds, group_id}. When last_message_id is missing every rendered
+    bubble is returned. Only the active chat showing peer_id is read, so
+    a page still showing another channel yields no messages at all.
+    """
+    last_id = int(last_message_id) if last_message_id and str(last_message_id).isdigit() else None
+    with metrics.DOM_EXTRACT_SECONDS.time():
+        result = page.evaluate(EXTRACT_SCRIPT, [str(peer_id), last_id])
+    return result['newest'], result['messages']
@@ -0,0 +1,153 @@
+import functools
+import html
+import string
+
+from telethon.extensions import html as telegram_html, markdown as telegram_markdown
+
+DEFAULT_TEMPLATE = "Message from Eitaa:\n\nSender: {sender}\nTime: {time}\nText:\n{content}\nViews: {views}"
+FIELDS = ('sender', 'time', 'views', 'content', 'channel', 'channel_id', 'mid')
+# نام‌های کانفیگ؛ text یعنی بدون قالب‌بندی و None یعنی parse_mode پیش‌فرض کلاینت
+PARSE_MODES = {'markdown': 'md', 'md': 'md', 'html': 'html', 'text': 'text', 'none': 'text'}
+
+
+class CompiledTemplate:
+    """A template split once into format strings, ready to render
+
+    parts is a list of (format string, fields) where a part with fields
+    is one template line dropped when any of those fields is empty.
+    Consecutive lines that are never dropped are merged into one part.
+    """
+    __slots__ = ('parts', 'parse_mode', 'link_preview')
+
+    def __init__(self, parts, parse_mode, link_preview):
+        self.parts = parts
+        self.parse_mode = parse_mode
+        self.link_preview = link_preview
+
+    def render(self, values):
+        if self.parse_mode == 'html':
+            values = {key: html.escape(value, quote=False) for key, value in values.items()}
+        lines = []
+        for text, optional in self.parts:
+            if optional and not all(values[field] for field in optional):
+                continue
+            lines.append(text.format_map(values))
+        return '\n'.join(lines)
+
+
+def markdown_to_html(line):
+    """Rewrite one markdown template line as HTML
+
+    Telethon's markdown has no escape syntax, so a * or _ in a field
+    value would start an entity. Markdown templates are sent as HTML
+    instead, where values are escaped; fields are left as {name}.
+    """
+    text, entities = telegram_markdown.parse(line)
+    return telegram_html.unparse(text, entities)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(template, omit=(), omit_empty=(), parse_mode=None, link_preview=True):
+    """Compile a template, cached so channels sharing settings share the result
+
+    Lines using a field in omit are removed; lines using a field in
+    omit_empty are kept only for messages where that field has a value.
+    Markdown templates are compiled to HTML line by line (see
+    markdown_to_html), so their markup cannot span lines.
+    Raises ValueError for unknown fields, parse modes or a bad template.
+    """
+    if parse_mode is not None and parse_mode not in PARSE_MODES:
+        raise ValueError(f"Unknown parse_mode: {parse_mode}")
+    mode = PARSE_MODES[parse_mode] if parse_mode is not None else None
+    parts = []
+    static = []
+    for line in template.split('\n'):
+        if mode == 'md':
+            line = markdown_to_html(line)
+        fields = {name for _, name, _, _ in string.Formatter().parse(line) if name is not None}
+        unknown = fields - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown template fields: {', '.join(sorted(unknown))}")
+        if fields & set(omit):
+            continue
+        optional = tuple(sorted(fields & set(omit_empty)))
+        if not optional:
+            static.append(line)
+            continue
+        if static:
+            parts.append(('\n'.join(static), ()))
+            static = []
+        parts.append((line, optional))
+    if static:
+        parts.append(('\n'.join(static), ()))
+    return CompiledTemplate(parts, 'html' if mode == 'md' else mode, link_preview)
+
+
+class MessageFormatter:
+    """Render MessageRecords with the template configured for their channel
+
+    telegram.format holds the defaults and eitaa.channels[].format
+    overrides any of them per channel:
+
+        {"template": "...{sender}...{content}...",
+         "parse_mode": "markdown" | "html" | "text",
+         "link_preview": true,
+         "omit": ["views"],          # lines with these fields are removed
+         "omit_empty": ["views"]}    # removed only when the field is empty
+
+    Template fields are sender, time, views, content, channel (the
+    channel name), channel_id and mid; literal braces are written {{ }}.
+    Every channel's template is compiled once, at startup.
+    """
+
+    def __init__(self, config, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        self.defaults = {
+            'template': DEFAULT_TEMPLATE,
+            'parse_mode': None,  # پیش‌فرض همان parse_mode کلاینت تلگرام
+            'link_preview': True,
+            'omit': [],
+            'omit_empty': ['views'],
+            **config.get('telegram', {}).get('format', {})
+        }
+        self.default = self._compile(self.defaults, None)
+        self.names = {}
+        self.templates = {}
+        for channel in config['eitaa'].get('channels', []):
+            self.names[channel['id']] = channel.get('name', str(channel['id']))
+            if channel.get('format'):
+                self.templates[channel['id']] = self._compile({**self.defaults, **channel['format']}, channel['id'])
+
+    def _compile(self, settings, channel_id):
+        try:
+            return compile_template(
+                settings['template'],
+                tuple(settings['omit']),
+                tuple(settings['omit_empty']),
+                settings['parse_mode'],
+                settings['link_preview']
+            )
+        except ValueError as e:
+            if channel_id is None:
+                self.error_logger.error(f"Invalid telegram.format, using the built-in template: {e}")
+                return compile_template(DEFAULT_TEMPLATE, omit_empty=('views',), parse_mode=None)
+            self.error_logger.error(f"Invalid format for channel {channel_id}, using the default: {e}")
+            return self.default
+
+    def format(self, record):
+        """Set record.text and its send options from the channel's template"""
+        template = self.templates.get(record.channel_id, self.default)
+        values = {
+            'sender': record.sender or '',
+            'time': record.time or '',
+            'views': record.views or '',
+            'content': record.content or '',
+            'channel': self.names.get(record.channel_id, str(record.channel_id or '')),
+            'channel_id': str(record.channel_id or ''),
+            'mid': str(record.mid or ''),
+        }
+        record.text = template.render(values)
+        record.parse_mode = template.parse_mode
+        record.link_preview = template.link_preview
+        return record.text
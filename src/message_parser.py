@@ -0,0 +1,189 @@
+import datetime
+import re
+
+AM_MARKERS = ('قبل‌ازظهر', 'قبل از ظهر', 'ق.ظ')
+PM_MARKERS = ('بعدازظهر', 'بعد از ظهر', 'ب.ظ')
+JALALI_MONTHS = (
+    'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+    'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند'
+)
+GREGORIAN_MONTHS = (
+    'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december'
+)
+
+# ارقام فارسی و عربی برای تبدیل به عدد
+DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+
+_MARKER = '|'.join(re.escape(m) for m in AM_MARKERS + PM_MARKERS)
+_CLOCK = r'\d{1,2}:\d{2}'
+_NUMERIC_DATE = r'\d{4}[/\-.]\d{1,2}[/\-.]\d{1,2}'
+_NAMED_DATE = r'\d{1,2}\s+(?:' + '|'.join(JALALI_MONTHS) + r'|[A-Za-z]{3,9})(?:\s+\d{4})?'
+
+# خط زمان: فقط ساعت، با تاریخ و ق.ظ/ب.ظ اختیاری؛ متنی که کلمه بعدازظهر دارد خط زمان نیست
+_MERIDIEM = rf'(?:{_MARKER}|AM|PM|am|pm)'
+TIME_LINE = re.compile(
+    rf'(?:(?:{_NUMERIC_DATE}|{_NAMED_DATE}),?\s+)?(?:{_MERIDIEM}\s*)?{_CLOCK}(?:\s*{_MERIDIEM})?$'
+)
+VIEWS_LINE = re.compile(r'^\d+(?:[.,٫]\d+)?[KkMm]?$')
+CLOCK = re.compile(r'(\d{1,2}):(\d{2})')
+NUMERIC_DATE = re.compile(r'(\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})')
+NAMED_DATE = re.compile(r'(\d{1,2})\s+(' + '|'.join(JALALI_MONTHS) + r'|[A-Za-z]{3,9})(?:\s+(\d{4}))?')
+MERIDIEM = re.compile(rf'({_MERIDIEM})')
+
+
+class ParsedMessage:
+    """Fields split out of a bubble's text
+
+    time is the raw timestamp line as shown. clock ("HH:MM", 24 hour) and
+    date (datetime.date, Jalali dates converted) are parsed from it on
+    first access only, since forwarding uses the raw line.
+    """
+    __slots__ = ('sender', 'time', 'views', 'content', '_stamp')
+
+    def __init__(self, sender='', time='', views=None, content=''):
+        self.sender = sender
+        self.time = time
+        self.views = views
+        self.content = content
+        self._stamp = None
+
+    def _timestamp(self):
+        if self._stamp is None:
+            self._stamp = parse_timestamp(self.time) if self.time else (None, None)
+        return self._stamp
+
+    @property
+    def clock(self):
+        return self._timestamp()[0]
+
+    @property
+    def date(self):
+        return self._timestamp()[1]
+
+    def __iter__(self):
+        # برای باز کردن مثل قبل: sender, time, views, content = parse_message_text(...)
+        return iter((self.sender, self.time, self.views, self.content))
+
+    def __repr__(self):
+        return (f"ParsedMessage(sender={self.sender!r}, time={self.time!r}, views={self.views!r}, "
+                f"content={self.content!r})")
+
+
+def jalali_to_gregorian(jy, jm, jd):
+    """Convert a Jalali (Solar Hijri) date to a datetime.date"""
+    jy += 1595
+    days = -355668 + 365 * jy + (jy // 33) * 8 + ((jy % 33) + 3) // 4 + jd
+    days += (jm - 1) * 31 if jm < 7 else (jm - 7) * 30 + 186
+    gy = 400 * (days // 146097)
+    days %= 146097
+    if days > 36524:
+        days -= 1
+        gy += 100 * (days // 36524)
+        days %= 36524
+        if days >= 365:
+            days += 1
+    gy += 4 * (days // 1461)
+    days %= 1461
+    if days > 365:
+        gy += (days - 1) // 365
+        days = (days - 1) % 365
+    return datetime.date(gy, 1, 1) + datetime.timedelta(days=days)
+
+
+def _to_date(year, month, day):
+    # سال‌های زیر 1700 شمسی فرض می‌شوند
+    if year < 1700:
+        return jalali_to_gregorian(year, month, day)
+    return datetime.date(year, month, day)
+
+
+def parse_timestamp(text, today=None):
+    """Return (clock "HH:MM" or None, datetime.date or None) from a timestamp line"""
+    normalized = text.translate(DIGITS)
+    clock = None
+    match = CLOCK.search(normalized)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        meridiem = MERIDIEM.search(normalized)
+        if meridiem:
+            marker = meridiem.group(1)
+            if (marker in PM_MARKERS or marker.lower() == 'pm') and hour < 12:
+                hour += 12
+            elif (marker in AM_MARKERS or marker.lower() == 'am') and hour == 12:
+                hour = 0
+        clock = f"{hour:02d}:{minute:02d}"
+
+    date = None
+    try:
+        match = NUMERIC_DATE.search(normalized)
+        if match:
+            date = _to_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        else:
+            match = NAMED_DATE.search(normalized)
+            if match:
+                day, month_name, year = match.groups()
+                if month_name in JALALI_MONTHS:
+                    month = JALALI_MONTHS.index(month_name) + 1
+                    if year is None:
+                        year = jalali_year(today or datetime.date.today())
+                    date = jalali_to_gregorian(int(year), month, int(day))
+                else:
+                    names = [name for name in GREGORIAN_MONTHS if name.startswith(month_name.lower())]
+                    if names:
+                        year = int(year) if year else (today or datetime.date.today()).year
+                        date = datetime.date(year, GREGORIAN_MONTHS.index(names[0]) + 1, int(day))
+    except ValueError:
+        date = None
+    return clock, date
+
+
+def jalali_year(date):
+    """Jalali year that contains a Gregorian date"""
+    year = date.year - 621
+    return year if date >= jalali_to_gregorian(year, 1, 1) else year - 1
+
+
+def parse_message_text(full_text):
+    """Split bubble text into sender, time, views and content
+
+    Layout as rendered: content lines, then the views count, then
+    "sender," and the time. These trailer lines are found by reading
+    back from the end, so only the content is walked in full: the time is
+    the last line that looks like one, the sender the last line that does
+    not and the views a number-only line right before the sender. Blank
+    lines and lines ending with a comma are dropped from the content.
+    """
+    lines = full_text.splitlines()
+    time_index = sender_index = views_index = None
+    index = len(lines)
+    while index:
+        index -= 1
+        stripped = lines[index].strip()
+        if not stripped:
+            continue
+        # بیشتر خط‌ها دو نقطه ندارند و به regex نمی‌رسند
+        if ':' in stripped and TIME_LINE.match(stripped):
+            if time_index is None:
+                time_index = index
+            continue
+        if sender_index is None:
+            sender_index = index
+            continue
+        # عدد ویو درست قبل از خط sender می‌آید
+        if stripped[0].isdigit() and VIEWS_LINE.match(stripped):
+            views_index = index
+        break
+
+    content = []
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and stripped[-1] != ',' and index != sender_index and index != time_index \
+                and index != views_index:
+            content.append(line)
+    return ParsedMessage(
+        lines[sender_index].strip().rstrip(',').strip() if sender_index is not None else '',
+        lines[time_index].strip() if time_index is not None else '',
+        lines[views_index].strip() if views_index is not None else None,
+        '\n'.join(content)
+    )
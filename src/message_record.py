@@ -0,0 +1,97 @@
+import time
+
+
+def media_key(mid, index):
+    return mid if index == 0 else f"{mid}#{index}"
+
+
+class MessageRecord:
+    """One Eitaa message on its way from the channel page to Telegram
+
+    Backends fill channel_id, mid, the parsed fields, media_srcs (every
+    media item of the bubble, in order) and group_id (shared by the
+    bubbles of one grouped post). media_kinds gives each item's kind
+    (photo, video, document, voice or audio). MessageProcessor sets text, parse_mode
+    and link_preview (from the channel's template) and file_paths, then
+    TelegramHandler.queue_record sets targets, queued_at and outbox_id.
+    content is None when the bubble had no text element at all.
+    fetched_at and queued_at are time.time() values.
+    """
+    __slots__ = (
+        'channel_id', 'mid', 'sender', 'time', 'views', 'content', 'has_media', 'media_srcs', 'media_kinds',
+        'group_id', 'text', 'parse_mode', 'link_preview', 'file_paths', 'targets', 'fetched_at', 'queued_at', 'outbox_id'
+    )
+
+    def __init__(self, mid=None, sender='', time_sent='', views=None, content=None, has_media=False,
+                 media_srcs=None, channel_id=None, text=None, file_paths=None, targets=None, group_id=None,
+                 media_kinds=None):
+        self.channel_id = channel_id
+        self.mid = mid
+        self.sender = sender
+        self.time = time_sent
+        self.views = views
+        self.content = content
+        self.has_media = has_media
+        self.media_srcs = media_srcs or []
+        # بدون نوع مشخص، هر رسانه عکس فرض می‌شود
+        self.media_kinds = media_kinds or ['photo'] * len(self.media_srcs)
+        self.group_id = group_id
+        self.text = text
+        # None یعنی parse_mode پیش‌فرض کلاینت
+        self.parse_mode = None
+        self.link_preview = True
+        self.file_paths = file_paths or []
+        self.targets = targets
+        self.fetched_at = time.time()
+        self.queued_at = None
+        self.outbox_id = None
+
+    @property
+    def media_src(self):
+        return self.media_srcs[0] if self.media_srcs else None
+
+    def media_items(self):
+        """(key, src, kind) for each media item with a source
+
+        The key is the mid for the first item and mid#n for the n-th one
+        after it, so fetch_media results can be looked up per item.
+        """
+        return [
+            (media_key(self.mid, i), src, kind)
+            for i, (src, kind) in enumerate(zip(self.media_srcs, self.media_kinds)) if src
+        ]
+
+    def to_payload(self):
+        """What the outbox stores to resend this message after a restart"""
+        # کلید message مثل نسخه قبلی صف است تا پیام‌های ذخیره شده قبلی هم ارسال شوند
+        return {
+            'message': self.text, 'file_paths': self.file_paths, 'channel_id': self.channel_id, 'mid': self.mid,
+            'parse_mode': self.parse_mode, 'link_preview': self.link_preview
+        }
+
+    @classmethod
+    def from_payload(cls, payload, outbox_id=None, targets=None):
+        record = cls(
+            payload.get('mid'),
+            channel_id=payload.get('channel_id'),
+            text=payload.get('message'),
+            # صف‌های قدیمی یک file_path داشتند
+            file_paths=payload.get('file_paths') or ([payload['file_path']] if payload.get('file_path') else []),
+            targets=targets
+        )
+        record.parse_mode = payload.get('parse_mode')
+        record.link_preview = payload.get('link_preview', True)
+        record.outbox_id = outbox_id
+        return record
+
+    def send_options(self, with_file=False):
+        """Keyword arguments for send_message, or send_file when with_file"""
+        options = {}
+        if self.parse_mode is not None:
+            options['parse_mode'] = None if self.parse_mode == 'text' else self.parse_mode
+        if not with_file:
+            options['link_preview'] = self.link_preview
+        return options
+
+    def __repr__(self):
+        return f"MessageRecord(channel_id={self.channel_id!r}, mid={self.mid!r}, targets={self.targets!r})"
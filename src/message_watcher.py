@@ -0,0 +1,131 @@
+import time
+
+# اسکریپت داخل صفحه: bubble های جدید را جمع می‌کند و به پایتون می‌فرستد
+WATCH_SCRIPT = """() => {
+    if (window.__eitaaObserver) {
+        return false;
+    }
+    const pending = new Set();
+    let timer = null;
+
+    const flush = () => {
+        timer = null;
+        if (!pending.size) {
+            return;
+        }
+        const mids = Array.from(pending);
+        pending.clear();
+        window.__eitaaOnBubbles(mids);
+    };
+
+    const collect = (node) => {
+        if (node.nodeType !== 1) {
+            return;
+        }
+        if (node.matches('div.bubble[data-mid]')) {
+            pending.add(node.getAttribute('data-mid'));
+        } else if (node.firstElementChild) {
+            node.querySelectorAll('div.bubble[data-mid]').forEach(
+                (bubble) => pending.add(bubble.getAttribute('data-mid'))
+            );
+        }
+    };
+
+    window.__eitaaObserver = new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'attributes') {
+                collect(mutation.target);
+            } else {
+                mutation.addedNodes.forEach(collect);
+            }
+        }
+        if (pending.size && !timer) {
+            timer = setTimeout(flush, 100);
+        }
+    });
+
+    const root = document.getElementById('column-center') || document.body;
+    window.__eitaaObserver.observe(root, {
+        childList: true,
+        subtree: true,
+        attributes: true,
+        attributeFilter: ['data-mid']
+    });
+    return true;
+}"""
+
+
+class MessageWatcher:
+    """Receive new bubble ids pushed from pinned channel pages"""
+
+    def __init__(self, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        # page -> channel_id که الان روی آن صفحه باز است
+        self.channels = {}
+        # صفحه‌هایی که تابع پایتون روی آن‌ها ثبت شده
+        self.exposed = set()
+        # channel_id -> بزرگ‌ترین mid دیده شده از آخرین بررسی
+        self.pending = {}
+
+    def watch(self, page, channel_id):
+        """Install the observer on page and bind it to channel_id"""
+        try:
+            if page not in self.exposed:
+                page.expose_function(
+                    '__eitaaOnBubbles',
+                    lambda mids, page=page: self._on_bubbles(page, mids)
+                )
+                self.exposed.add(page)
+            self.channels[page] = channel_id
+            page.evaluate(WATCH_SCRIPT)
+            self.info_logger.info(f"Watching channel {channel_id} for new messages")
+        except Exception as e:
+            self.error_logger.error(f"Error installing watcher for channel {channel_id}: {e}")
+
+    def unwatch(self, page):
+        """Stop reporting bubbles from page"""
+        self.channels.pop(page, None)
+
+    def _on_bubbles(self, page, mids):
+        """Called from the page when bubbles are added"""
+        channel_id = self.channels.get(page)
+        if channel_id is None:
+            return
+        newest = self.pending.get(channel_id)
+        for mid in mids:
+            try:
+                mid = int(mid)
+            except (TypeError, ValueError):
+                continue
+            if newest is None or mid > newest:
+                newest = mid
+        if newest is not None:
+            self.pending[channel_id] = newest
+
+    def wait(self, timeout):
+        """Pump browser events until a channel reports new bubbles
+
+        Returns channel_id -> newest pushed mid, or an empty dict when
+        the timeout passes first.
+        """
+        deadline = time.time() + timeout
+        while not self.pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            page = next(iter(self.channels), None)
+            if page is None:
+                time.sleep(remaining)
+                break
+            try:
+                # کال‌بک‌های expose_function فقط هنگام انتظار روی صفحه اجرا می‌شوند
+                page.wait_for_timeout(min(remaining, 0.5) * 1000)
+            except Exception as e:
+                self.error_logger.error(f"Error waiting for pushed messages: {e}")
+                self.channels.pop(page, None)
+                self.exposed.discard(page)
+
+        pending = self.pending
+        self.pending = {}
+        return pending
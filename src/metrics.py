@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic total per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = list(self.values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """Current value per label set, or read from a callback at scrape time
+
+    A callback costs nothing until /metrics is requested. It returns a
+    number, or a dict of label-value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self.values = {}
+        self.function = None
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self.values[label_values] = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def render(self):
+        with self._lock:
+            values = dict(self.values)
+        if self.function is not None:
+            try:
+                result = self.function()
+            except Exception:
+                result = None
+            if isinstance(result, dict):
+                values.update(result)
+            elif result is not None:
+                values[()] = result
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """Bucketed observations (seconds) per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def time(self, *label_values):
+        """Context manager observing the time spent inside it"""
+        return _Timer(self, label_values)
+
+    def render(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self.values.items()]
+        lines = self.header()
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, *self.label_values)
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+CHANNEL_POLL_SECONDS = REGISTRY.histogram(
+    'eitaa_channel_poll_seconds', 'Time to poll one channel and queue its new messages', ['channel'])
+DOM_EXTRACT_SECONDS = REGISTRY.histogram(
+    'eitaa_dom_extract_seconds', 'Time to read new bubbles from the channel page')
+MEDIA_DOWNLOAD_SECONDS = REGISTRY.histogram(
+    'eitaa_media_download_seconds', 'Time to download media for one poll or one viewer download', ['method'])
+MESSAGES_FETCHED = REGISTRY.counter(
+    'eitaa_messages_fetched_total', 'New messages read from a channel', ['channel'])
+MESSAGES_BACKFILLED = REGISTRY.counter(
+    'eitaa_messages_backfilled_total', 'Messages recovered by scrolling back over a gap', ['channel'])
+POLL_ERRORS = REGISTRY.counter(
+    'eitaa_poll_errors_total', 'Failed channel polls', ['channel'])
+CONSECUTIVE_ERRORS = REGISTRY.gauge(
+    'eitaa_consecutive_errors', 'Consecutive failed polls (error_count.json)')
+QUEUE_DEPTH = REGISTRY.gauge(
+    'telegram_queue_depth', 'Queued sends (message x target) not finished yet')
+TARGET_QUEUE_DEPTH = REGISTRY.gauge(
+    'telegram_target_queue_depth', 'Messages waiting in one target queue', ['target'])
+SEND_SECONDS = REGISTRY.histogram(
+    'telegram_send_seconds', 'Time from a message entering the target queue until it was sent', ['target'])
+SEND_FAILURES = REGISTRY.counter(
+    'telegram_send_failures_total', 'Sends that failed after retries', ['target'])
+FLOOD_WAIT_SECONDS = REGISTRY.counter(
+    'telegram_flood_wait_seconds_total', 'Seconds spent in FloodWait pauses', ['target'])
+
+
+class MetricsServer:
+    """Serve REGISTRY on http://host:port/metrics from a daemon thread"""
+
+    def __init__(self, config, registry=REGISTRY, info_logger=None, error_logger=None):
+        metrics_config = config.get('metrics', {})
+        self.enabled = metrics_config.get('enabled', False)
+        self.host = metrics_config.get('host', '127.0.0.1')  # فقط روی همین سیستم در دسترس است
+        self.port = metrics_config.get('port', 9464)
+        self.registry = registry
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        self.server = None
+
+    def start(self):
+        if not self.enabled or self.server is not None:
+            return
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            self.error_logger.error(f"Could not start metrics endpoint on {self.host}:{self.port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.info_logger.info(f"Metrics available at http://{self.host}:{self.server.server_port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
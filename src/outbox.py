@@ -0,0 +1,136 @@
+import json
+import sqlite3
+import threading
+import time
+
+from .message_record import MessageRecord
+
+
+class Outbox:
+    """Persistent outbound queue backed by SQLite in WAL mode
+
+    Every queued message gets one delivery row per target. A row is
+    removed when that target was sent successfully, or by flush() once
+    it failed max_attempts times, so whatever is left after a crash or
+    restart is replayed on startup. Writes are only
+    committed by flush() or once batch_size writes are pending, so
+    durability costs one fsync per batch instead of one per message.
+    """
+
+    def __init__(self, db_file, batch_size=100, max_attempts=3, info_logger=None, error_logger=None):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        # اسکرپر پیام اضافه می‌کند و ترد تلگرام تایید می‌کند
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                message_id INTEGER NOT NULL,
+                target INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (message_id, target)
+            );
+        ''')
+        self.conn.commit()
+
+    def add(self, record):
+        """Store a MessageRecord with a pending delivery per target, return its id"""
+        with self._lock:
+            cursor = self.conn.execute(
+                'INSERT INTO messages (payload, created) VALUES (?, ?)',
+                (json.dumps(record.to_payload(), ensure_ascii=False), time.time())
+            )
+            message_id = cursor.lastrowid
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO deliveries (message_id, target) VALUES (?, ?)',
+                [(message_id, target) for target in record.targets]
+            )
+            self._wrote()
+        return message_id
+
+    def ack(self, message_id, target):
+        """Mark delivery to target as done"""
+        with self._lock:
+            self.conn.execute(
+                'DELETE FROM deliveries WHERE message_id = ? AND target = ?',
+                (message_id, target)
+            )
+            self._wrote()
+
+    def fail(self, message_id, target):
+        """Count a failed delivery attempt and return the attempts so far
+
+        The sender retries it until max_attempts; after that flush()
+        drops it.
+        """
+        with self._lock:
+            self.conn.execute(
+                'UPDATE deliveries SET attempts = attempts + 1 WHERE message_id = ? AND target = ?',
+                (message_id, target)
+            )
+            row = self.conn.execute(
+                'SELECT attempts FROM deliveries WHERE message_id = ? AND target = ?',
+                (message_id, target)
+            ).fetchone()
+            self._wrote()
+        return row[0] if row else self.max_attempts
+
+    def _wrote(self):
+        """Commit once enough writes are pending (lock held)"""
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.conn.commit()
+            self._uncommitted = 0
+
+    def flush(self):
+        """Commit pending writes, drop exhausted deliveries and fully delivered messages"""
+        with self._lock:
+            try:
+                exhausted = self.conn.execute(
+                    'DELETE FROM deliveries WHERE attempts >= ?', (self.max_attempts,)
+                ).rowcount
+                if exhausted:
+                    self.error_logger.error(
+                        f"Dropped {exhausted} deliveries that failed {self.max_attempts} times"
+                    )
+                self.conn.execute(
+                    'DELETE FROM messages WHERE id NOT IN (SELECT message_id FROM deliveries)'
+                )
+                self.conn.commit()
+                self._uncommitted = 0
+            except Exception as e:
+                self.error_logger.error(f"Error flushing outbox: {e}")
+
+    def pending(self):
+        """Return undelivered MessageRecords in queue order, with their remaining targets"""
+        with self._lock:
+            rows = self.conn.execute('''
+                SELECT m.id, m.payload, d.target
+                FROM messages m JOIN deliveries d ON d.message_id = m.id
+                WHERE d.attempts < ?
+                ORDER BY m.id
+            ''', (self.max_attempts,)).fetchall()
+
+        messages = []
+        for message_id, payload, target in rows:
+            if not messages or messages[-1].outbox_id != message_id:
+                messages.append(MessageRecord.from_payload(json.loads(payload), message_id, []))
+            messages[-1].targets.append(target)
+        return messages
+
+    def close(self):
+        """Commit and close the database"""
+        self.flush()
+        with self._lock:
+            self.conn.close()
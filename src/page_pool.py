@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+
+class ChannelPagePool:
+    """Keep a bounded set of browser pages, each pinned to one channel"""
+
+    def __init__(self, context, max_pages=3, first_page=None, info_logger=None, error_logger=None):
+        self.context = context
+        self.max_pages = max(1, int(max_pages))
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        # channel_id -> page به ترتیب آخرین استفاده (LRU)
+        self.pages = OrderedDict()
+        # صفحه اصلی (لاگین) هیچ‌وقت بسته نمی‌شود
+        self.main_page = first_page
+        # صفحه‌هایی که هنوز به کانالی وصل نشده‌اند
+        self.free_pages = [first_page] if first_page else []
+        # تعداد کانالی که برایش هشدار داده شده، تا هر دور تکرار نشود
+        self.warned_for = None
+
+    def acquire(self, channel_id):
+        """Return (page, needs_open) for channel, reusing or recycling pages"""
+        if channel_id in self.pages:
+            self.pages.move_to_end(channel_id)
+            return self.pages[channel_id], False
+
+        if self.free_pages:
+            page = self.free_pages.pop(0)
+        elif len(self.pages) < self.max_pages:
+            page = self.context.new_page()
+            page.goto('https://web.eitaa.com/')
+            self.info_logger.info(f"Opened new page for channel {channel_id} ({len(self.pages) + 1}/{self.max_pages})")
+        else:
+            # قدیمی‌ترین صفحه به کانال جدید منتقل می‌شود
+            old_channel_id, page = self.pages.popitem(last=False)
+            self.info_logger.info(f"Moving page from channel {old_channel_id} to {channel_id}")
+
+        self.pages[channel_id] = page
+        return page, True
+
+    def release(self, channel_id):
+        """Unpin channel and close its page"""
+        page = self.pages.pop(channel_id, None)
+        if page is None:
+            return
+        if page is self.main_page:
+            self.free_pages.append(page)
+            return
+        try:
+            page.close()
+        except Exception as e:
+            self.error_logger.error(f"Error closing page for channel {channel_id}: {e}")
+
+    def check_capacity(self, channel_count):
+        """Warn once when more channels are active than pages can stay open"""
+        if channel_count <= self.max_pages:
+            self.warned_for = None
+            return
+        if channel_count != self.warned_for:
+            # صفحه کانال‌های اضافه در هر دور جابه‌جا می‌شود و در حالت push پیام جدیدشان دیده نمی‌شود
+            self.info_logger.warning(
+                f"{channel_count} active channels but page_pool.max_pages is {self.max_pages}; "
+                f"pages will be recycled every cycle, raise max_pages to keep every channel open"
+            )
+            self.warned_for = channel_count
+
+    def batches(self, channels):
+        """Split channels into groups that fit in the pool at once"""
+        for i in range(0, len(channels), self.max_pages):
+            yield channels[i:i + self.max_pages]
+
+    def close(self):
+        """Close every pooled page"""
+        for channel_id in list(self.pages):
+            self.release(channel_id)
+        self.free_pages = []
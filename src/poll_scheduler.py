@@ -0,0 +1,122 @@
+import heapq
+import time
+
+
+class ChannelSchedule:
+    """Polling state of one channel"""
+    __slots__ = ('interval', 'rate', 'last_poll', 'due')
+
+    def __init__(self, interval, due):
+        self.interval = interval
+        # تخمین نرخ پیام (فعالیت در ثانیه) با میانگین نمایی
+        self.rate = 0.0
+        self.last_poll = None
+        self.due = due
+
+
+class PollScheduler:
+    """Poll each channel on its own interval, kept in a heap by due time
+
+    A poll that finds new messages drops the channel back to
+    min_interval. Quiet polls stretch the interval by backoff, but never
+    past what the channel's recent posting rate suggests, and always
+    within [min_interval, max_interval]. With adaptive polling disabled
+    every channel is due every check_interval, as before.
+    """
+
+    def __init__(self, config, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        adaptive_config = config['eitaa'].get('adaptive_polling', {})
+        self.check_interval = config['eitaa'].get('check_interval', 60)
+        self.enabled = adaptive_config.get('enabled', False)
+        self.min_interval = adaptive_config.get('min_interval', self.check_interval)
+        self.max_interval = adaptive_config.get('max_interval', 30 * 60)  # پیش‌فرض 30 دقیقه
+        self.backoff = adaptive_config.get('backoff', 1.5)
+        self.smoothing = adaptive_config.get('smoothing', 0.3)
+        self.channels = {}
+        self.heap = []
+
+    def _clamp(self, interval):
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _schedule(self, channel_id, state):
+        heapq.heappush(self.heap, (state.due, channel_id))
+
+    def due(self, channel_ids, now=None):
+        """Return the channels from channel_ids that should be polled now
+
+        Channels seen for the first time are due immediately.
+        """
+        if not self.enabled:
+            return list(channel_ids)
+        now = time.time() if now is None else now
+        wanted = set(channel_ids)
+        for channel_id in channel_ids:
+            if channel_id not in self.channels:
+                state = self.channels[channel_id] = ChannelSchedule(self.min_interval, now)
+                self._schedule(channel_id, state)
+
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_time, channel_id = heapq.heappop(self.heap)
+            state = self.channels.get(channel_id)
+            # ورودی‌های قدیمی heap (بعد از زمان‌بندی دوباره) نادیده گرفته می‌شوند
+            if state is None or state.due != due_time:
+                continue
+            if channel_id not in wanted:
+                # کانال غیرفعال شده، اگر دوباره فعال شود از نو شروع می‌شود
+                del self.channels[channel_id]
+                continue
+            due.append(channel_id)
+            # اگر record صدا زده نشود (مثلا خطا در حلقه)، کانال از heap گم نمی‌شود
+            state.due = now + state.interval
+            self._schedule(channel_id, state)
+        # ترتیب کانال‌ها مثل ترتیب کانفیگ می‌ماند
+        order = {channel_id: i for i, channel_id in enumerate(channel_ids)}
+        return sorted(due, key=order.get)
+
+    def record(self, channel_id, had_new, now=None):
+        """Schedule the next poll of a channel after polling it"""
+        if not self.enabled:
+            return
+        now = time.time() if now is None else now
+        state = self.channels.get(channel_id)
+        if state is None:
+            state = self.channels[channel_id] = ChannelSchedule(self.min_interval, now)
+
+        if state.last_poll is not None:
+            elapsed = max(now - state.last_poll, 1e-6)
+            observed = (1 if had_new else 0) / elapsed
+            state.rate = self.smoothing * observed + (1 - self.smoothing) * state.rate
+        state.last_poll = now
+
+        if had_new:
+            state.interval = self.min_interval
+        else:
+            # بازه کند می‌شود ولی از حدود متناسب با نرخ اخیر کانال بیشتر نمی‌شود
+            rate_limit = 1 / state.rate if state.rate > 0 else self.max_interval
+            state.interval = self._clamp(min(state.interval * self.backoff, rate_limit))
+        state.due = now + state.interval
+        self._schedule(channel_id, state)
+
+    def seconds_until_next(self, now=None):
+        """Seconds to sleep before the next channel is due"""
+        if not self.enabled:
+            return self.check_interval
+        now = time.time() if now is None else now
+        while self.heap:
+            due_time, channel_id = self.heap[0]
+            state = self.channels.get(channel_id)
+            if state is not None and state.due == due_time:
+                return max(0, due_time - now)
+            heapq.heappop(self.heap)
+        return self.min_interval
+
+    def log_summary(self):
+        if not self.enabled or not self.channels:
+            return
+        intervals = sorted(int(s.interval) for s in self.channels.values())
+        self.info_logger.info(
+            f"Poll intervals: min {intervals[0]}s, median {intervals[len(intervals) // 2]}s, max {intervals[-1]}s"
+        )
@@ -0,0 +1,96 @@
+import time
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+from .message_extractor import ACTIVE_BUBBLES_JS
+
+# چت فعال باید هدر همین peer را داشته باشد و حداقل یک bubble داخل همان چت رندر شده باشد
+CHAT_OPENED_SCRIPT = """(peerId) => {
+    """ + ACTIVE_BUBBLES_JS + """
+    return activeBubbles(peerId).length > 0;
+}"""
+
+class Readiness:
+    """Wait on concrete page signals instead of fixed sleeps
+
+    Every wait is timed and the totals are kept per wait name, so the
+    time spent waiting can be reported at the end of each cycle.
+    """
+
+    def __init__(self, default_timeout=10, info_logger=None, error_logger=None):
+        self.default_timeout = default_timeout
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        # name -> {'count', 'total', 'max', 'timeouts'}
+        self.stats = {}
+
+    def wait(self, name, condition, timeout=None):
+        """Run condition(timeout_ms), returning its result or None on timeout"""
+        timeout = timeout or self.default_timeout
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return condition(timeout * 1000)
+        except PlaywrightTimeoutError:
+            timed_out = True
+            self.info_logger.warning(f"Wait '{name}' timed out after {timeout}s")
+            return None
+        finally:
+            self._record(name, time.perf_counter() - start, timed_out)
+
+    def _record(self, name, elapsed, timed_out):
+        stat = self.stats.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0, 'timeouts': 0})
+        stat['count'] += 1
+        stat['total'] += elapsed
+        stat['max'] = max(stat['max'], elapsed)
+        if timed_out:
+            stat['timeouts'] += 1
+
+    def chatlist_ready(self, page, timeout=30):
+        """Wait until the chat list has rendered its rows"""
+        return self.wait(
+            'chatlist',
+            lambda ms: page.wait_for_selector('li.chatlist-chat[data-peer-id]', timeout=ms),
+            timeout
+        )
+
+    def login_state_known(self, page, timeout=None):
+        """Wait until either the chat list or the sign-in page is shown"""
+        return self.wait(
+            'login_state',
+            lambda ms: page.wait_for_selector('.chatlist-container, .tabs-tab.page-sign.active', timeout=ms),
+            timeout
+        )
+
+    def chat_opened(self, page, peer_id, timeout=None):
+        """Wait until the clicked channel is active and its bubbles are attached"""
+        return self.wait(
+            'chat_opened',
+            lambda ms: page.wait_for_function(CHAT_OPENED_SCRIPT, arg=str(peer_id), timeout=ms),
+            timeout
+        )
+
+    def download(self, page, trigger, timeout=None):
+        """Run trigger() and return the download it starts"""
+        def condition(ms):
+            with page.expect_download(timeout=ms) as download_info:
+                trigger()
+            return download_info.value
+        return self.wait('download', condition, timeout)
+
+    def viewer_closed(self, page, timeout=None):
+        """Wait until the media viewer has been removed from the page"""
+        return self.wait(
+            'viewer_closed',
+            lambda ms: page.wait_for_selector('.media-viewer-whole', state='detached', timeout=ms),
+            timeout
+        )
+
+    def log_summary(self, reset=True):
+        """Log time spent per wait and optionally start a new period"""
+        for name, stat in sorted(self.stats.items()):
+            self.info_logger.info(
+                f"Wait '{name}': {stat['count']} waits, total {stat['total']:.2f}s, "
+                f"max {stat['max']:.2f}s, {stat['timeouts']} timeouts"
+            )
+        if reset:
+            self.stats = {}
@@ -0,0 +1,114 @@
+import os
+import re
+
+# انیمیشن‌ها و transition ها خاموش می‌شوند تا CPU کمتری مصرف شود
+NO_ANIMATIONS_SCRIPT = """(() => {
+    const style = document.createElement('style');
+    style.textContent = '*, *::before, *::after { animation: none !important; transition: none !important; }';
+    const add = () => (document.head || document.documentElement).appendChild(style);
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', add);
+    } else {
+        add();
+    }
+})();"""
+
+# ویدیو و ویس پیام‌ها از نوع media هستند و برای دانلود لازم‌اند
+DEFAULT_BLOCKED_TYPES = ['font']
+DEFAULT_BLOCKED_PATTERNS = [r'sticker', r'emoji', r'avatar', r'\.tgs(\?|$)', r'lottie']
+# الگوهای URL فقط روی این نوع درخواست‌ها اعمال می‌شوند، نه روی صفحه و اسکریپت‌ها
+DEFAULT_PATTERN_TYPES = ['image', 'media', 'fetch', 'other']
+
+
+def process_tree_rss(pid=None):
+    """Return RSS in MB of a process and all of its descendants (Linux only)"""
+    pid = pid or os.getpid()
+    children = {}
+    rss = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+            children.setdefault(int(fields['PPid']), []).append(int(entry))
+            rss[int(entry)] = int(fields.get('VmRSS', '0 kB').split()[0])
+        except (OSError, KeyError, ValueError):
+            continue
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total / 1024
+
+
+class ResourcePolicy:
+    """Block resources the forwarder never uses and lighten page rendering"""
+
+    def __init__(self, config, info_logger=None, error_logger=None):
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        policy_config = config['eitaa'].get('resource_policy', {})
+        self.enabled = policy_config.get('enabled', False)
+        self.blocked_types = set(policy_config.get('blocked_types', DEFAULT_BLOCKED_TYPES))
+        self.blocked_pattern = re.compile(
+            '|'.join(policy_config.get('blocked_url_patterns', DEFAULT_BLOCKED_PATTERNS)) or r'(?!)',
+            re.IGNORECASE
+        )
+        self.pattern_types = set(policy_config.get('pattern_types', DEFAULT_PATTERN_TYPES))
+        self.disable_animations = policy_config.get('disable_animations', True)
+        if self.enabled:
+            self.viewport = policy_config.get('viewport', {'width': 1280, 'height': 720})
+        else:
+            self.viewport = {'width': 1920, 'height': 1080}
+        # resource_type -> تعداد درخواست‌های مسدود شده
+        self.blocked = {}
+        self.allowed = 0
+
+    def context_options(self):
+        """Extra keyword arguments for new_context / launch_persistent_context"""
+        options = {'viewport': self.viewport}
+        if self.enabled and self.disable_animations:
+            options['reduced_motion'] = 'reduce'
+        return options
+
+    def install(self, context):
+        """Attach routing and the no-animation script to a browser context"""
+        if not self.enabled:
+            return
+        context.route('**/*', self._handle)
+        if self.disable_animations:
+            context.add_init_script(NO_ANIMATIONS_SCRIPT)
+        self.info_logger.info(
+            f"Resource policy active: blocking types {sorted(self.blocked_types)}, viewport {self.viewport}"
+        )
+
+    def _handle(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        # عکس‌های داخل پیام لازم‌اند، فقط استیکر/آواتار/ایموجی مسدود می‌شوند
+        if resource_type in self.blocked_types or (
+            resource_type in self.pattern_types and self.blocked_pattern.search(request.url)
+        ):
+            self.blocked[resource_type] = self.blocked.get(resource_type, 0) + 1
+            route.abort()
+            return
+        self.allowed += 1
+        route.continue_()
+
+    def log_summary(self, reset=True):
+        """Log blocked/allowed request counts and browser memory"""
+        if not self.enabled:
+            return
+        blocked = ', '.join(f"{t}={n}" for t, n in sorted(self.blocked.items())) or 'none'
+        self.info_logger.info(f"Requests allowed: {self.allowed}, blocked: {blocked}")
+        try:
+            self.info_logger.info(f"Process tree RSS: {process_tree_rss():.1f} MB")
+        except OSError:
+            pass
+        if reset:
+            self.blocked = {}
+            self.allowed = 0
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from telethon.errors import FloodWaitError
+from . import metrics
+
+
+class TokenBucket:
+    """Async token bucket: rate tokens per second, up to capacity stored"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """Wait until amount tokens are available and take them
+
+        An amount over capacity waits for a full bucket and leaves it in
+        debt, so the sends after it wait until the rate has paid it off.
+        """
+        needed = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+
+class FanoutSender:
+    """Deliver to many targets concurrently, in order within each target
+
+    Every target has its own queue and worker, so a slow or flood-waited
+    target only delays itself. All workers share one global bucket and
+    each has its own per-chat bucket; a send takes cost(target, item)
+    tokens from both (default 1), one per Telegram message it posts.
+    When a send fails, on_failure
+    (target, item) decides whether to retry it: the worker then waits
+    retry_backoff seconds, doubled per attempt, and sends it again
+    before moving on, so the target's order is kept. on_done(target,
+    item, ok) runs once per item when it is sent or given up.
+    """
+
+    def __init__(self, send_fn, config, info_logger=None, error_logger=None, on_done=None, on_failure=None,
+                 cost=None):
+        self.send_fn = send_fn
+        self.on_done = on_done
+        self.on_failure = on_failure
+        self.cost = cost
+        self.info_logger = info_logger
+        self.error_logger = error_logger
+        rate_config = config['telegram'].get('rate_limit', {})
+        global_rate = rate_config.get('global_per_second', 25)  # پیش‌فرض 25 پیام در ثانیه
+        self.per_chat_rate = rate_config.get('per_chat_per_minute', 20) / 60  # پیش‌فرض 20 پیام در دقیقه
+        self.per_chat_burst = rate_config.get('per_chat_burst', 3)
+        self.retry_backoff = config['telegram'].get('retry_backoff', 5)  # پیش‌فرض 5 ثانیه، دو برابر در هر تلاش
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.queues = {}
+        self.buckets = {}
+        self.workers = {}
+        metrics.TARGET_QUEUE_DEPTH.set_function(
+            lambda: {(target,): queue.qsize() for target, queue in list(self.queues.items())}
+        )
+
+    def submit(self, target, item):
+        """Queue item for target, starting its worker if needed"""
+        if target not in self.queues:
+            self.queues[target] = asyncio.Queue()
+            self.buckets[target] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+            self.workers[target] = asyncio.ensure_future(self._worker(target))
+        self.queues[target].put_nowait((time.monotonic(), item))
+
+    async def _worker(self, target):
+        queue = self.queues[target]
+        while True:
+            queued_at, item = await queue.get()
+            ok = False
+            cancelled = False
+            retries = 0
+            try:
+                while True:
+                    # هر تلاش فقط پیام‌هایی را که هنوز ارسال نشده‌اند حساب می‌کند
+                    cost = self.cost(target, item) if self.cost else 1
+                    await self.buckets[target].acquire(cost)
+                    await self.global_bucket.acquire(cost)
+                    try:
+                        await self.send_fn(target, item)
+                        ok = True
+                        metrics.SEND_SECONDS.observe(time.monotonic() - queued_at, target)
+                        break
+                    except FloodWaitError as e:
+                        # فقط همین تارگت منتظر می‌ماند، ترتیب پیام‌ها حفظ می‌شود
+                        self.info_logger.warning(f"Flood wait for {target}: waiting {e.seconds}s")
+                        metrics.FLOOD_WAIT_SECONDS.inc(target, amount=e.seconds)
+                        await asyncio.sleep(e.seconds)
+                    except Exception as e:
+                        self.error_logger.error(f"Error sending message to {target}: {e}")
+                        if not (self.on_failure and self.on_failure(target, item)):
+                            break
+                        delay = self.retry_backoff * 2 ** retries
+                        retries += 1
+                        self.info_logger.info(f"Retrying message to {target} in {delay}s")
+                        await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # توقف سرویس شکست ارسال نیست؛ پیام در outbox می‌ماند و بعد از ری‌استارت ارسال می‌شود
+                cancelled = True
+                raise
+            except Exception as e:
+                self.error_logger.error(f"Error sending message to {target}: {e}")
+            finally:
+                queue.task_done()
+                if not cancelled:
+                    if not ok:
+                        metrics.SEND_FAILURES.inc(target)
+                    if self.on_done:
+                        self.on_done(target, item, ok)
+
+    async def close(self):
+        """Stop all target workers"""
+        for worker in self.workers.values():
+            worker.cancel()
+        await asyncio.gather(*self.workers.values(), return_exceptions=True)
+        self.workers = {}
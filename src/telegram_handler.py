@@ -1,41 +1,89 @@
-from telethon import TelegramClient
+from telethon import TelegramClient, types
+from telethon.errors import FileReferenceExpiredError, MediaEmptyError
 import asyncio
 import os
-from queue import Queue
 import threading
 import time
 import sqlite3
+from .sender import FanoutSender
+from .media_stream import media_kind_of
+from .message_record import MessageRecord
+from .outbox import Outbox
+from . import metrics
+
+# تلگرام حداکثر 10 فایل در یک آلبوم می‌پذیرد
+ALBUM_SIZE = 10
+# نوع‌هایی که در یک آلبوم کنار هم قرار می‌گیرند؛ voice همیشه جدا ارسال می‌شود
+ALBUM_GROUPS = {'photo': 'visual', 'video': 'visual', 'document': 'document', 'audio': 'audio'}
+FILE_OPTIONS = {
+    'video': {'supports_streaming': True},
+    'voice': {'voice_note': True},
+    'document': {'force_document': True},
+}
+
+class SharedUpload:
+    """Upload state shared by every target of one message"""
+
+    def __init__(self, file_path, file_hash, uploaded=None):
+        self.file_path = file_path
+        self.file_hash = file_hash
+        self.kind = media_kind_of(file_path)
+        self.uploaded = uploaded
+        self.saved = uploaded is not None
+        self.lock = asyncio.Lock()
+
+def albums_of(shared):
+    """Split uploads into albums of up to ALBUM_SIZE files Telegram can group"""
+    albums = []
+    for upload in shared:
+        group = ALBUM_GROUPS.get(upload.kind)
+        if albums and group and albums[-1][0] == group and len(albums[-1][1]) < ALBUM_SIZE:
+            albums[-1][1].append(upload)
+        else:
+            albums.append((group, [upload]))
+    return [album for _, album in albums]
 
 class TelegramHandler:
-    def __init__(self, config, targets=None, info_logger=None, error_logger=None):
+    def __init__(self, config, targets=None, info_logger=None, error_logger=None, media_store=None, client=None):
         self.config = config
         self.targets = targets or config['telegram']['default_targets']
         self.info_logger = info_logger
         self.error_logger = error_logger
-        self.message_queue = Queue()
+        self.media_store = media_store
         self.telegram_ready = threading.Event()
         self.telegram_client = None
-        self._running = True
+        # کلاینت جایگزین (مثلا FakeTelegramClient برای بنچمارک) به جای Telethon
+        self.client = client
+        self.sender = None
+        self.loop = None
+        self._stop_event = None
+        # پیام‌هایی که قبل از آماده شدن تلگرام صف شده‌اند
+        self._early_messages = []
+        # تعداد ارسال‌های (پیام × تارگت) که هنوز تمام نشده‌اند
+        self._outstanding = 0
+        self._outstanding_changed = threading.Condition()
+        self._closed = False
+        metrics.QUEUE_DEPTH.set_function(lambda: self._outstanding)
+
+        # صف پایدار روی دیسک؛ پیام‌های ارسال نشده از اجرای قبلی دوباره ارسال می‌شوند
+        base_dir = os.path.dirname(os.path.dirname(__file__))
+        self.outbox = Outbox(
+            os.path.join(base_dir, 'config', config['paths'].get('outbox_file', 'outbox.db')),
+            config['telegram'].get('outbox_batch_size', 100),  # پیش‌فرض هر 100 نوشتن یک commit
+            config['telegram'].get('max_send_attempts', 3),
+            info_logger,
+            error_logger
+        )
+        for record in self.outbox.pending():
+            self._outstanding += len(record.targets)
+            self._early_messages.append(record)
+        if self._early_messages:
+            self.info_logger.info(f"Replaying {len(self._early_messages)} unsent messages from outbox")
         
         # Start Telegram client in a separate thread
         self.telegram_thread = threading.Thread(target=self.run_telegram_client)
         self.telegram_thread.daemon = True
 
-        # Add download event listener
-        def handle_download(download):
-            file_path = os.path.join('channel_images', download.suggested_filename)
-            print(f"Starting download of file: {download.suggested_filename}")
-            print(f"Saving to path: {file_path}")
-            download.save_as(file_path)
-            print(f"File downloaded successfully to: {file_path}")
-            
-            # ارسال فوری به تلگرام
-            if self.current_message_text:
-                self.queue_message(self.current_message_text, file_path)
-                print(f"Message and image queued for Telegram: {file_path}")
-        
-        self.handle_download = handle_download
-
     def connect(self):
         """Start Telegram client thread"""
         self.telegram_thread.start()
@@ -52,99 +100,266 @@ class TelegramHandler:
             try:
                 await asyncio.sleep(1)
                 
-                # Get session file path
-                session_name = self.config['telegram'].get('session_name', 'eitaa_forwarder_session')
-                session_file = f"{session_name}.session"
+                if self.client is not None:
+                    self.telegram_client = self.client
+                else:
+                    # Get session file path
+                    session_name = self.config['telegram'].get('session_name', 'eitaa_forwarder_session')
+                    session_file = f"{session_name}.session"
                 
-                # Check if session file exists and try to fix it if locked
-                if os.path.exists(session_file):
-                    try:
-                        # Try to open the database to check if it's locked
-                        conn = sqlite3.connect(session_file, timeout=1)
-                        conn.close()
-                    except sqlite3.OperationalError as e:
-                        if "database is locked" in str(e):
-                            self.info_logger.warning("Session database is locked. Attempting to fix...")
-                            # Rename the old session file
-                            backup_file = f"{session_file}.bak"
-                            os.rename(session_file, backup_file)
-                            self.info_logger.info(f"Renamed locked session file to {backup_file}")
+                    # Check if session file exists and try to fix it if locked
+                    if os.path.exists(session_file):
+                        try:
+                            # Try to open the database to check if it's locked
+                            conn = sqlite3.connect(session_file, timeout=1)
+                            conn.close()
+                        except sqlite3.OperationalError as e:
+                            if "database is locked" in str(e):
+                                self.info_logger.warning("Session database is locked. Attempting to fix...")
+                                # Rename the old session file
+                                backup_file = f"{session_file}.bak"
+                                os.rename(session_file, backup_file)
+                                self.info_logger.info(f"Renamed locked session file to {backup_file}")
                 
-                self.telegram_client = TelegramClient(
-                    session_name,
-                    self.config['telegram']['api_id'],
-                    self.config['telegram']['api_hash'],
-                    connection_retries=10
-                )
+                    self.telegram_client = TelegramClient(
+                        session_name,
+                        self.config['telegram']['api_id'],
+                        self.config['telegram']['api_hash'],
+                        connection_retries=10
+                    )
                 
                 await self.telegram_client.connect()
                 self.info_logger.info("Please complete Telegram login if needed...")
                 await self.telegram_client.start()
                 self.info_logger.info("Telegram client started successfully")
                 
+                self.sender = FanoutSender(
+                    self._send_to_target, self.config, self.info_logger, self.error_logger, self._send_done,
+                    self._send_failed, self._send_cost
+                )
+                self._stop_event = asyncio.Event()
+                with self._outstanding_changed:
+                    self.loop = loop
+                    early_messages, self._early_messages = self._early_messages, []
+                for record in early_messages:
+                    self._send_message(record)
                 self.telegram_ready.set()
                 
-                while self._running:
-                    if not self.message_queue.empty():
-                        msg_data = self.message_queue.get()
-                        await self._send_message(msg_data)
-                    await asyncio.sleep(0.1)
+                # حلقه فقط با رسیدن پیام از ترد اسکرپر بیدار می‌شود
+                await self._stop_event.wait()
                 
+                await self.sender.close()
                 if self.telegram_client:
                     await self.telegram_client.disconnect()
                 
             except Exception as e:
                 self.error_logger.error(f"Telegram client error: {e}")
                 self.telegram_ready.set()  # Set the event to prevent hanging
+            finally:
+                # بعد از بسته شدن کلاینت، drain نباید منتظر بماند
+                with self._outstanding_changed:
+                    self.loop = None
+                    self._closed = True
+                    self._early_messages = []
+                    self._outstanding = 0
+                    self._outstanding_changed.notify_all()
+                self.outbox.flush()
                 
         loop.run_until_complete(run_client())
 
     def queue_message(self, message, file_path=None, specific_targets=None):
-        """Add message to queue with optional file and specific targets"""
+        """Add a plain text message to queue with optional file and specific targets"""
+        self.queue_record(MessageRecord(text=message, file_paths=[file_path] if file_path else []), specific_targets)
+
+    def queue_record(self, record, specific_targets=None):
+        """Queue a formatted MessageRecord (text and file_paths set) for its targets
+
+        The record itself travels to every target sender, so each send
+        uses the text and file of its own message.
+        """
         try:
-            targets = specific_targets if specific_targets else self.targets
-            self.message_queue.put({
-                'message': message,
-                'file_path': file_path,
-                'targets': targets
-            })
-            self.info_logger.info(f"Message queued for targets: {targets}")
+            record.targets = specific_targets if specific_targets else self.targets
+            record.queued_at = time.time()
+            with self._outstanding_changed:
+                if self._closed:
+                    self.error_logger.error(f"Telegram client is not running, message for {record.targets} dropped")
+                    return
+                record.outbox_id = self.outbox.add(record)
+                self._outstanding += len(record.targets)
+                if self.loop is None:
+                    self._early_messages.append(record)
+                else:
+                    self.loop.call_soon_threadsafe(self._send_message, record)
+            self.info_logger.info(f"Message queued for targets: {record.targets}")
         except Exception as e:
             self.error_logger.error(f"Error queueing message: {e}")
 
-    async def _send_message(self, msg_data):
-        """Send a single message"""
+    def _load_media_ref(self, file_hash):
+        """Rebuild an input media object from a saved file reference"""
+        ref = self.media_store.get_telegram_ref(file_hash) if self.media_store and file_hash else None
+        if not ref:
+            return None
+        input_type = types.InputPhoto if ref['type'] == 'photo' else types.InputDocument
+        return input_type(
+            id=ref['id'],
+            access_hash=ref['access_hash'],
+            file_reference=bytes.fromhex(ref['file_reference'])
+        )
+
+    def _save_media_ref(self, file_hash, sent):
+        """Remember the uploaded media of a sent message, return it for reuse"""
+        media = sent.photo or sent.document
+        if media is None:
+            return None
+        if self.media_store and file_hash:
+            self.media_store.set_telegram_ref(file_hash, {
+                'type': 'photo' if sent.photo else 'document',
+                'id': media.id,
+                'access_hash': media.access_hash,
+                'file_reference': media.file_reference.hex()
+            })
+        return media
+
+    def flush_outbox(self):
+        """Make every queued message durable before advancing checkpoints"""
+        self.outbox.flush()
+
+    def queued_files(self):
+        """Paths of every file a message still waiting in the outbox will send"""
+        return {path for record in self.outbox.pending() for path in record.file_paths}
+
+    def _send_cost(self, target, item):
+        """Rate limit tokens for the rest of a message: one per file, or one for text"""
+        _, shared, progress = item
+        # هر فایل آلبوم در تلگرام یک پیام جدا است
+        return sum(len(album) for album in albums_of(shared)[progress.get(target, 0):]) or 1
+
+    def _send_failed(self, target, item):
+        """Count a failed attempt in the outbox, return whether to retry it"""
+        record = item[0]
+        if record.outbox_id is None:
+            return False
+        attempts = self.outbox.fail(record.outbox_id, target)
+        if attempts >= self.outbox.max_attempts:
+            self.error_logger.error(f"Giving up on message for {target} after {attempts} attempts")
+            return False
+        return True
+
+    def _send_done(self, target, item, ok):
+        """Record a finished target send and wake drain() callers
+
+        Failed attempts were already counted by _send_failed.
+        """
+        record = item[0]
+        if ok and record.outbox_id is not None:
+            self.outbox.ack(record.outbox_id, target)
+        with self._outstanding_changed:
+            self._outstanding -= 1
+            if self._outstanding <= 0:
+                self._outstanding = 0
+                self._outstanding_changed.notify_all()
+
+    def drain(self, timeout=None):
+        """Block until every queued message was sent to every target
+
+        Returns False if the timeout passed first.
+        """
+        with self._outstanding_changed:
+            return self._outstanding_changed.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def stop(self):
+        """Ask the Telegram thread to finish"""
+        if self.loop is not None and self._stop_event is not None:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+
+    def _send_message(self, record):
+        """Hand a message to the per-target senders"""
         try:
-            targets = msg_data['targets']
-            message = msg_data['message']
-            file_path = msg_data.get('file_path')
+            # هر فایل فقط یک بار آپلود می‌شود و برای همه تارگت‌ها استفاده می‌شود
+            shared = []
+            for file_path in record.file_paths:
+                if os.path.exists(file_path):
+                    file_hash = self.media_store.hash_of(file_path) if self.media_store else None
+                    shared.append(SharedUpload(file_path, file_hash, self._load_media_ref(file_hash)))
 
-            for target in targets:
-                try:
-                    if file_path and os.path.exists(file_path):
-                        await self.telegram_client.send_file(
-                            target,
-                            file_path,
-                            caption=message
-                        )
-                        self.info_logger.info(f"Sent message with file to {target}")
-                    else:
-                        await self.telegram_client.send_message(
-                            target,
-                            message
-                        )
-                        self.info_logger.info(f"Sent message to {target}")
-                    
-                except Exception as e:
-                    self.error_logger.error(f"Error sending message to {target}: {e}")
-                    continue
+            # تعداد آلبوم‌های ارسال شده به هر تارگت، تا تکرار بعد از FloodWait از همان‌جا ادامه دهد
+            progress = {}
+            for target in record.targets:
+                self.sender.submit(target, (record, shared, progress))
         except Exception as e:
             self.error_logger.error(f"Error sending message: {e}")
+            for target in record.targets:
+                if record.outbox_id is not None:
+                    # بعد از ری‌استارت دوباره امتحان می‌شود
+                    self.outbox.fail(record.outbox_id, target)
+                self._send_done(target, (record, [], {}), False)
+
+    async def _upload(self, shared):
+        """Return the media to send, uploading the file once per message"""
+        async with shared.lock:
+            if shared.uploaded is None:
+                # بعد از خطا، آپلود بعدی دوباره از فایل روی دیسک خوانده می‌شود
+                shared.uploaded = await self.telegram_client.upload_file(shared.file_path)
+            return shared.uploaded
+
+    async def _send_to_target(self, target, item):
+        """Send one message to one target; FloodWaitError is left to the sender
+
+        Files go out in albums of up to ALBUM_SIZE, one send_file call
+        each, with the text as the caption of the first album. Photos and
+        videos share albums, documents and audio get their own and voice
+        notes go out alone (see albums_of).
+        """
+        record, shared, progress = item
+        message = record.text
+
+        if not shared:
+            await self.telegram_client.send_message(
+                target,
+                message,
+                **record.send_options()
+            )
+            self.info_logger.info(f"Sent message to {target}")
+            return
+
+        albums = albums_of(shared)
+        for index in range(progress.get(target, 0), len(albums)):
+            options = record.send_options(with_file=True)
+            for upload in albums[index]:
+                options.update(FILE_OPTIONS.get(upload.kind, {}))
+            await self._send_album(target, albums[index], message if index == 0 else None, options)
+            progress[target] = index + 1
+        self.info_logger.info(f"Sent message with {len(shared)} file(s) to {target}")
+
+    async def _send_album(self, target, album, caption, options):
+        """Send one file, or several as an album, in a single send_file call"""
+        media = [await self._upload(upload) for upload in album]
+        try:
+            sent = await self.telegram_client.send_file(
+                target, media if len(media) > 1 else media[0], caption=caption, **options
+            )
+        except (FileReferenceExpiredError, MediaEmptyError):
+            self.info_logger.info("Saved file reference expired, uploading again")
+            for upload, item in zip(album, media):
+                if upload.uploaded is item:
+                    upload.uploaded = None
+                    upload.saved = False
+            media = [await self._upload(upload) for upload in album]
+            sent = await self.telegram_client.send_file(
+                target, media if len(media) > 1 else media[0], caption=caption, **options
+            )
+
+        sent = sent if isinstance(sent, list) else [sent]
+        for upload, message in zip(album, sent):
+            if not upload.saved:
+                # بعد از اولین ارسال، عکس تلگرام جایگزین فایل آپلود شده می‌شود
+                upload.uploaded = self._save_media_ref(upload.file_hash, message) or upload.uploaded
+                upload.saved = True
 
     def disconnect(self):
         """Stop Telegram client"""
         try:
-            self._running = False
+            self.stop()
             if self.telegram_thread.is_alive():
                 self.telegram_thread.join(timeout=5)
             
@@ -0,0 +1,85 @@
+import logging
+
+from src.backfill import RANGE_SCRIPT, RENDERED_SCRIPT, SCROLL_SCRIPT, ScrollBackfill
+from src.message_extractor import EXTRACT_SCRIPT, extract_messages
+
+logger = logging.getLogger('test')
+
+
+class HistoryPage:
+    """Channel page that only renders a window of its history, like the real one"""
+
+    def __init__(self, mids, window=10, step=5, peer='-6'):
+        self.mids = mids
+        self.peer = peer
+        self.window = window
+        self.step = step
+        self.lo = len(mids) - window
+
+    def rendered(self, peer):
+        # مثل activeBubbles، چت کانال دیگر هیچ bubble ای ندارد
+        return self.mids[self.lo:self.lo + self.window] if peer == self.peer else []
+
+    def evaluate(self, script, arg=None):
+        if script == RANGE_SCRIPT:
+            rendered = self.rendered(arg)
+            return {'oldest': min(rendered, default=None), 'newest': max(rendered, default=None)}
+        if script == EXTRACT_SCRIPT:
+            peer, last_id = arg
+            rendered = self.rendered(peer)
+            newer = [m for m in rendered if last_id is None or m > last_id]
+            messages = [{'mid': str(m), 'text': f'پیام {m}', 'has_media': False, 'media_src': None} for m in newer]
+            return {'newest': str(max(rendered)) if rendered else None, 'messages': messages}
+        if script == SCROLL_SCRIPT:
+            before = self.lo
+            if arg:
+                self.lo = max(0, min(len(self.mids) - self.window, self.lo + arg * self.step))
+            return {'moved': self.lo != before, 'atBottom': self.lo + self.window >= len(self.mids)}
+        raise AssertionError('unexpected script')
+
+    def wait_for_function(self, script, arg=None, timeout=None):
+        assert script == RENDERED_SCRIPT
+        return True
+
+
+class ImmediateReadiness:
+    def wait(self, name, condition, timeout=None):
+        return condition(1000)
+
+
+def make_backfill(batch_size=4):
+    config = {'eitaa': {'backfill': {'enabled': True, 'batch_size': batch_size}}}
+    return ScrollBackfill(config, ImmediateReadiness(), logger, logger)
+
+
+def test_gap_is_streamed_oldest_first_in_bounded_batches():
+    page = HistoryPage(list(range(1, 101)))
+    backfill = make_backfill()
+    assert backfill.has_gap(page, '-6', '20')
+
+    batches = list(backfill.batches(page, '-6', '20'))
+    mids = [int(b['mid']) for batch in batches for b in batch]
+    assert mids == list(range(21, 101))
+    assert max(len(batch) for batch in batches) == 4
+
+
+def test_no_gap_when_last_message_is_rendered():
+    page = HistoryPage(list(range(1, 101)))
+    backfill = make_backfill()
+    assert not backfill.has_gap(page, '-6', '95')
+    assert not backfill.has_gap(page, '-6', None)
+
+
+def test_history_shorter_than_gap_starts_from_oldest():
+    page = HistoryPage(list(range(50, 101)))
+    batches = list(make_backfill(batch_size=100).batches(page, '-6', '20'))
+    assert [int(b['mid']) for batch in batches for b in batch] == list(range(50, 101))
+
+
+def test_page_still_showing_another_channel_yields_nothing():
+    # صفحه هنوز کانال -5 را نشان می‌دهد؛ پیام‌هایش نباید به اسم -6 خوانده شوند
+    page = HistoryPage(list(range(1, 101)), peer='-5')
+    backfill = make_backfill()
+    assert not backfill.has_gap(page, '-6', '20')
+    assert extract_messages(page, '-6', '20') == (None, [])
+    assert extract_messages(page, '-5', '95')[1][0]['mid'] == '96'
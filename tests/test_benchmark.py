@@ -0,0 +1,24 @@
+from benchmarks.pipeline import compare, percentile, summarize
+
+
+def test_percentiles_use_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([5], 95) == 5
+    assert summarize([])['p50'] is None
+
+
+def result(msgs_per_sec, send_p95):
+    stages = {'send': {'p50': 1.0, 'p95': send_p95, 'p99': send_p95}}
+    return {'msgs_per_sec': msgs_per_sec, 'peak_rss_mb': 50.0, 'stages': stages}
+
+
+def test_compare_flags_only_meaningful_regressions():
+    baseline = {'results': {'fanout': result(100.0, 10.0)}}
+    assert compare({'fanout': result(99.0, 10.5)}, baseline, 0.15) == []
+    # جهش بزرگ نسبی ولی کمتر از یک میلی‌ثانیه، رگرسیون نیست
+    assert compare({'fanout': result(100.0, 10.9)}, baseline, 0.05) == []
+    assert compare({'fanout': result(70.0, 20.0)}, baseline, 0.15) == [
+        'fanout msgs_per_sec', 'fanout send.p95', 'fanout send.p99'
+    ]
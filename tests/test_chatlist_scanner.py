@@ -0,0 +1,60 @@
+import logging
+
+from src.chatlist_scanner import ChatlistScanner
+
+logger = logging.getLogger('test')
+
+
+class ListPage:
+    """Answers the scan evaluate with prepared chat list rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def evaluate(self, script):
+        return self.rows
+
+
+def row(mid='', unread=0, time='', preview=''):
+    return {'mid': mid, 'unread': unread, 'time': time, 'preview': preview}
+
+
+def make_scanner(full_poll_every=0):
+    config = {'eitaa': {'chatlist_scan': {'enabled': True, 'full_poll_every': full_poll_every}}}
+    return ChatlistScanner(config, logger, logger)
+
+
+def process(scanner, page, channel_ids):
+    selected = scanner.changed(page, channel_ids)
+    for channel_id in selected:
+        scanner.mark_seen(channel_id)
+    return selected
+
+
+def test_only_changed_or_unread_channels_are_opened():
+    scanner = make_scanner()
+    page = ListPage({'-6': row(mid='10'), '-7': row(time='10:00', preview='سلام'), '-8': row(mid='5')})
+    assert process(scanner, page, ['-6', '-7', '-8']) == ['-6', '-7', '-8']
+    assert process(scanner, page, ['-6', '-7', '-8']) == []
+
+    page.rows['-6'] = row(mid='11')
+    page.rows['-7'] = row(time='10:05', preview='خبر جدید')
+    page.rows['-8'] = row(mid='5', unread=2)
+    assert process(scanner, page, ['-6', '-7', '-8']) == ['-6', '-7', '-8']
+
+
+def test_unrendered_channels_are_opened_once_then_on_full_polls():
+    scanner = make_scanner(full_poll_every=3)
+    page = ListPage({'-6': row(mid='10')})
+    assert process(scanner, page, ['-6', '-9']) == ['-6', '-9']
+    assert process(scanner, page, ['-6', '-9']) == []
+    assert process(scanner, page, ['-6', '-9']) == []
+    assert process(scanner, page, ['-6', '-9']) == ['-6', '-9']
+
+
+def test_state_is_kept_only_for_processed_channels():
+    scanner = make_scanner()
+    page = ListPage({'-6': row(mid='10')})
+    assert scanner.changed(page, ['-6']) == ['-6']
+    # پردازش نشد (مثلا باز نشد)، پس دور بعد دوباره انتخاب می‌شود
+    assert scanner.changed(page, ['-6']) == ['-6']
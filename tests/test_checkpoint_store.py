@@ -0,0 +1,36 @@
+import json
+import logging
+
+from src.checkpoint_store import JsonCheckpointStore, SqliteCheckpointStore
+
+logger = logging.getLogger('test')
+
+
+def test_json_store_writes_only_on_flush(tmp_path):
+    path = tmp_path / 'last_message.json'
+    store = JsonCheckpointStore(str(path), logger, logger)
+    store.set('-1', '100')
+    store.set('-2', '200')
+    assert json.loads(path.read_text()) == {}
+    store.flush()
+    assert json.loads(path.read_text()) == {'-1': '100', '-2': '200'}
+    assert not (tmp_path / 'last_message.json.tmp').exists()
+
+
+def test_json_store_recovers_from_corrupt_file(tmp_path):
+    path = tmp_path / 'last_message.json'
+    path.write_text('{"-1": "10"')
+    store = JsonCheckpointStore(str(path), logger, logger)
+    assert store.get('-1') is None
+    assert json.loads(path.read_text()) == {}
+
+
+def test_sqlite_store_round_trip(tmp_path):
+    path = str(tmp_path / 'checkpoints.db')
+    store = SqliteCheckpointStore(path, logger, logger)
+    store.set('-1', '100')
+    store.flush()
+    store.set('-1', '101')
+    assert SqliteCheckpointStore(path, logger, logger).get('-1') == '100'
+    store.flush()
+    assert SqliteCheckpointStore(path, logger, logger).get('-1') == '101'
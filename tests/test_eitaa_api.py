@@ -0,0 +1,117 @@
+import json
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.eitaa_api import ApiCircuitBreaker, EitaaApiClient, EitaaApiError, api_message_to_record
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'api')
+logger = logging.getLogger('test')
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Replays recorded history responses and remembers what was asked"""
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    status = 200
+
+    def do_GET(self):
+        type(self).requests.append((self.path, dict(self.headers)))
+        with open(os.path.join(FIXTURES, 'history.json'), 'rb') as f:
+            body = f.read()
+        self.send_response(type(self).status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    ReplayHandler.requests = []
+    ReplayHandler.status = 200
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(tmp_path, server):
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    session_file = tmp_path / 'auth.json'
+    session_file.write_text(json.dumps({
+        'cookies': [{'name': 'sid', 'value': 'abc', 'domain': '127.0.0.1'}],
+        'origins': [{'origin': base_url, 'localStorage': [{'name': 'user_auth', 'value': 'token-1'}]}]
+    }))
+    config = {'eitaa': {'api': {
+        'base_url': base_url,
+        'history_path': '/history/{channel_id}',
+        'token_key': 'user_auth'
+    }}}
+    return EitaaApiClient(config, str(session_file), logger, logger)
+
+
+def test_returns_only_newer_records_oldest_first(tmp_path, stub_server):
+    client = make_client(tmp_path, stub_server)
+    newest, records = client.fetch_history('-6', '4296409087')
+    assert newest == '4296605695'
+    assert [r.mid for r in records] == ['4296540159', '4296605695']
+    assert records[1].has_media and records[1].media_src == 'https://cdn.example/photo.jpg'
+    assert records[0].views == '120'
+
+
+def test_sends_session_material_and_reuses_connection(tmp_path, stub_server):
+    client = make_client(tmp_path, stub_server)
+    client.fetch_history('-6')
+    conn = client.conn
+    client.fetch_history('-6', '4296540159')
+    assert client.conn is conn
+    path, headers = ReplayHandler.requests[-1]
+    assert path.startswith('/history/-6?') and 'after=4296540159' in path
+    assert headers['Cookie'] == 'sid=abc'
+    assert headers['Authorization'] == 'token-1'
+
+
+def test_rejected_session_raises(tmp_path, stub_server):
+    ReplayHandler.status = 401
+    client = make_client(tmp_path, stub_server)
+    with pytest.raises(EitaaApiError):
+        client.fetch_history('-6')
+
+
+def test_album_media_list_and_group_id():
+    record = api_message_to_record({
+        'id': 5, 'text': 'آلبوم', 'grouped_id': 9,
+        'media': [{'url': 'https://cdn.example/a.jpg'}, {'url': 'https://cdn.example/b.mp4', 'type': 'video'}]
+    }, '-6')
+    assert record.media_items() == [
+        ('5', 'https://cdn.example/a.jpg', 'photo'), ('5#1', 'https://cdn.example/b.mp4', 'video')
+    ]
+    assert record.group_id == 9 and record.channel_id == '-6'
+
+
+def test_endpoint_has_no_made_up_default(tmp_path):
+    config = {'eitaa': {'api': {'enabled': True, 'base_url': 'https://example.org'}}}
+    with pytest.raises(ValueError, match='history_path'):
+        EitaaApiClient(config, str(tmp_path / 'auth.json'), logger, logger)
+
+
+def test_breaker_pauses_api_after_consecutive_failures():
+    breaker = ApiCircuitBreaker(max_failures=2, cooldown=60, info_logger=logger)
+    assert not breaker.failure('-6', now=0)
+    breaker.success('-6')
+    assert not breaker.failure('-6', now=1)
+    assert breaker.failure('-6', now=2)
+    assert not breaker.allow('-6', now=30) and breaker.allow('-7', now=30)
+    # بعد از cooldown دوباره امتحان می‌شود و یک خطای دیگر کافی است
+    assert breaker.allow('-6', now=62)
+    assert breaker.failure('-6', now=63)
+    assert not breaker.allow('-6', now=64)
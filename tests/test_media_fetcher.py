@@ -0,0 +1,92 @@
+import base64
+import logging
+from types import SimpleNamespace
+
+from src.media_fetcher import FETCH_SCRIPT, MediaFetcher
+from src.media_store import MediaStore
+
+logger = logging.getLogger('test')
+
+
+class PhotoPage:
+    """Page whose in-page fetch serves blob: photos and rejects http ones like CORS"""
+
+    def __init__(self, files, remote=None, broken=False):
+        self.files = files
+        self.remote = remote or {}
+        self.broken = broken
+        self.groups = []
+        self.requests = []
+        self.context = SimpleNamespace(request=SimpleNamespace(get=self._request))
+
+    def evaluate(self, script, items):
+        assert script == FETCH_SCRIPT
+        self.groups.append([item['mid'] for item in items])
+        if self.broken:
+            raise RuntimeError('page crashed')
+        fetched = []
+        for item in items:
+            if item['src'] in self.files:
+                data = base64.b64encode(self.files[item['src']]).decode()
+                fetched.append({'mid': item['mid'], 'type': 'image/png', 'data': data})
+            else:
+                fetched.append({'mid': item['mid'], 'error': 'TypeError: Failed to fetch'})
+        return fetched
+
+    def _request(self, src):
+        self.requests.append(src)
+        if src not in self.remote:
+            return SimpleNamespace(ok=False, status=404)
+        return SimpleNamespace(ok=True, status=200, headers={'content-type': 'image/jpeg'}, body=lambda: self.remote[src])
+
+
+def make_fetcher(tmp_path, max_concurrent=2):
+    config = {
+        'eitaa': {'media': {'max_concurrent': max_concurrent}},
+        'paths': {'images_dir': str(tmp_path / 'media')},
+    }
+    return MediaFetcher(config, MediaStore(config, logger, logger), logger, logger)
+
+
+def test_photos_are_fetched_in_groups_and_cached(tmp_path):
+    files = {f'blob:{i}': bytes([i]) * 10 for i in range(5)}
+    page = PhotoPage(files)
+    fetcher = make_fetcher(tmp_path)
+    items = [(str(i), f'blob:{i}', 'photo') for i in range(5)]
+
+    paths = fetcher.fetch_all(page, items, '-6')
+    assert page.groups == [['0', '1'], ['2', '3'], ['4']]
+    assert sorted(paths) == ['0', '1', '2', '3', '4'] and paths['3'].endswith('.png')
+    with open(paths['3'], 'rb') as f:
+        assert f.read() == files['blob:3']
+
+    # همه در کش هستند و صفحه دوباره درخواست نمی‌گیرد
+    assert fetcher.fetch_all(page, items, '-6') == paths
+    assert len(page.groups) == 3
+
+
+def test_http_photo_rejected_in_page_falls_back_to_the_request_api(tmp_path):
+    page = PhotoPage({'blob:1': b'local'}, remote={'https://cdn.eitaa.com/a.jpg': b'remote'})
+    fetcher = make_fetcher(tmp_path)
+    items = [
+        ('1', 'blob:1', 'photo'),
+        ('2', 'https://cdn.eitaa.com/a.jpg', 'photo'),
+        ('3', 'https://cdn.eitaa.com/missing.jpg', 'photo'),
+        ('4', 'blob:gone', 'photo'),
+    ]
+    paths = fetcher.fetch_all(page, items, '-6')
+
+    # blob ناموفق مسیر جایگزینی ندارد و برای نمایشگر باقی می‌ماند
+    assert sorted(paths) == ['1', '2']
+    assert page.requests == ['https://cdn.eitaa.com/a.jpg', 'https://cdn.eitaa.com/missing.jpg']
+    with open(paths['2'], 'rb') as f:
+        assert f.read() == b'remote'
+    # کلید کش برای آدرس http خود URL است
+    assert fetcher.media_store.lookup('https://cdn.eitaa.com/a.jpg') == paths['2']
+
+
+def test_failed_page_fetch_falls_back_per_item(tmp_path):
+    page = PhotoPage({}, remote={'https://cdn.eitaa.com/a.jpg': b'remote'}, broken=True)
+    fetcher = make_fetcher(tmp_path)
+    paths = fetcher.fetch_all(page, [('1', 'https://cdn.eitaa.com/a.jpg', 'photo'), ('2', 'blob:1', 'photo')], '-6')
+    assert list(paths) == ['1'] and page.requests == ['https://cdn.eitaa.com/a.jpg']
@@ -0,0 +1,81 @@
+import logging
+import os
+import time
+
+from src.media_store import MediaStore
+
+
+def make_store(tmp_path, max_mb=1):
+    config = {
+        'eitaa': {'media': {'cache_max_mb': max_mb, 'cache_max_age_days': 7}},
+        'paths': {'images_dir': str(tmp_path)}
+    }
+    logger = logging.getLogger('test')
+    return MediaStore(config, logger, logger)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = make_store(tmp_path)
+    first = store.put(b'image-bytes', 'image/jpeg', 'chan1:1')
+    second = store.put(b'image-bytes', 'image/jpeg', 'chan2:7')
+    assert first == second
+    assert store.lookup('chan2:7') == first
+    assert len(store.files) == 1
+
+
+def test_put_file_moves_download_into_store(tmp_path):
+    store = make_store(tmp_path)
+    download = tmp_path / 'photo123.jpg'
+    download.write_bytes(b'downloaded')
+    path = store.put_file(str(download), 'chan:5')
+    assert not download.exists()
+    assert os.path.exists(path)
+    assert store.hash_of(path) is not None
+
+
+def test_evicts_least_recently_used_over_budget(tmp_path):
+    store = make_store(tmp_path)
+    store.max_bytes = 10
+    old = store.put(b'a' * 8, 'image/jpeg', 'old')
+    store.files[store.hash_of(old)]['last_used'] = time.time() - 100
+    new = store.put(b'b' * 8, 'image/jpeg', 'new')
+    assert store.evict() == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    assert store.lookup('old') is None
+
+
+def test_files_of_queued_messages_are_not_evicted(tmp_path):
+    store = make_store(tmp_path)
+    store.max_bytes = 10
+    queued = store.put(b'a' * 8, 'image/jpeg', 'queued')
+    store.files[store.hash_of(queued)]['last_used'] = time.time() - 100
+    sent = store.put(b'b' * 8, 'image/jpeg', 'sent')
+    assert store.evict(keep={queued}) == 1
+    assert os.path.exists(queued)
+    assert not os.path.exists(sent)
+
+
+def test_index_survives_reload(tmp_path):
+    store = make_store(tmp_path)
+    path = store.put(b'data', 'image/png', 'key')
+    store.set_telegram_ref(store.hash_of(path), {'type': 'photo'})
+    store.flush()
+    reloaded = make_store(tmp_path)
+    assert reloaded.lookup('key') == path
+    assert reloaded.get_telegram_ref(reloaded.hash_of(path)) == {'type': 'photo'}
+
+
+def test_evicting_many_files_drops_only_their_keys(tmp_path):
+    store = make_store(tmp_path)
+    paths = [store.put(bytes([i]) * 8, 'image/jpeg', f'chan:{i}') for i in range(200)]
+    store.put(bytes([0]) * 8, 'image/jpeg', 'other:0')
+    # کلیدی که به فایل دیگری منتقل شده نباید با فایل قبلی حذف شود
+    store.put(bytes([199]) * 8, 'image/jpeg', 'chan:0')
+    for i, path in enumerate(paths):
+        store.files[store.hash_of(path)]['last_used'] = time.time() - 1000 + i
+    store.max_bytes = 8
+
+    assert store.evict() == 199
+    assert store.keys == {'chan:0': store.hash_of(paths[199]), 'chan:199': store.hash_of(paths[199])}
+    assert store.lookup('chan:0') == paths[199] and store.lookup('other:0') is None
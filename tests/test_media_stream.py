@@ -0,0 +1,168 @@
+import asyncio
+import base64
+import logging
+import os
+
+from src.fake_telegram import FakeTelegramClient
+from src.media_fetcher import MediaFetcher
+from src.media_store import MediaStore
+from src.media_stream import CLOSE_SCRIPT, OPEN_SCRIPT, READ_SCRIPT
+from src.message_record import MessageRecord
+from src.telegram_handler import SharedUpload, TelegramHandler, albums_of
+
+logger = logging.getLogger('test')
+
+
+class StreamPage:
+    """Page whose fetch() serves files chunk by chunk like the in-page reader"""
+
+    def __init__(self, files, sized=True):
+        self.files = files
+        self.sized = sized
+        self.open = {}
+        self.reads = 0
+
+    def evaluate(self, script, arg=None):
+        if script == OPEN_SCRIPT:
+            if arg not in self.files:
+                return {'error': 'HTTP 404'}
+            stream_id = str(len(self.open) + self.reads + 1)
+            self.open[stream_id] = [self.files[arg], 0]
+            return {'id': stream_id, 'size': len(self.files[arg]) if self.sized else None, 'type': 'video/mp4'}
+        if script == READ_SCRIPT:
+            stream_id, size = arg
+            data, offset = self.open[stream_id]
+            self.reads += 1
+            if offset >= len(data):
+                del self.open[stream_id]
+                return None
+            self.open[stream_id][1] = offset + size
+            return base64.b64encode(data[offset:offset + size]).decode()
+        if script == CLOSE_SCRIPT:
+            self.open.pop(arg, None)
+            return None
+        raise AssertionError('unexpected script')
+
+
+def make_fetcher(tmp_path, **media):
+    config = {
+        'eitaa': {'media': {'stream_chunk_kb': 1, **media}},
+        'paths': {'images_dir': str(tmp_path / 'media')},
+    }
+    return MediaFetcher(config, MediaStore(config, logger, logger), logger, logger)
+
+
+def make_handler(tmp_path, client, media_store):
+    config = {
+        'telegram': {'default_targets': [-11, -12], 'retry_backoff': 0},
+        'eitaa': {},
+        'paths': {'outbox_file': str(tmp_path / 'outbox.db')},
+    }
+    return TelegramHandler(config, info_logger=logger, error_logger=logger, media_store=media_store, client=client)
+
+
+def test_video_is_spooled_to_the_store_chunk_by_chunk(tmp_path):
+    data = bytes(range(256)) * 20
+    page = StreamPage({'blob:video': data})
+    fetcher = make_fetcher(tmp_path)
+    paths = fetcher.fetch_all(page, [('7', 'blob:video', 'video')], '-6')
+
+    with open(paths['7'], 'rb') as f:
+        assert f.read() == data
+    assert paths['7'].endswith('.mp4') and page.open == {}
+    # هر بار فقط یک تکه یک کیلوبایتی از صفحه خوانده شده است
+    reads = page.reads
+    assert reads == len(data) // 1024 + 1
+    # بار دوم از کش خوانده می‌شود
+    assert fetcher.fetch_all(page, [('7', 'blob:video', 'video')], '-6') == paths
+    assert page.reads == reads
+
+
+def test_spooled_video_is_sent_once_to_every_target(tmp_path):
+    data = bytes(range(256)) * 20
+    fetcher = make_fetcher(tmp_path)
+    paths = fetcher.fetch_all(StreamPage({'blob:video': data}), [('7', 'blob:video', 'video')], '-6')
+
+    client = FakeTelegramClient()
+    handler = make_handler(tmp_path, client, fetcher.media_store)
+    handler.connect()
+    handler.queue_record(MessageRecord('7', text='video', file_paths=[paths['7']]))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    assert [upload.size for upload in client.uploads] == [len(data)]
+    assert sorted(target for _, target, _, _ in client.sent) == [-12, -11]
+    assert handler.outbox.pending() == []
+
+
+def test_streamed_media_survives_a_restart(tmp_path):
+    data = b'voice' * 300
+    fetcher = make_fetcher(tmp_path)
+    paths = fetcher.fetch_all(StreamPage({'blob:voice': data}), [('8', 'blob:voice', 'voice')], '-6')
+
+    # پیام صف شد ولی برنامه قبل از وصل شدن به تلگرام متوقف شد
+    crashed = make_handler(tmp_path, FakeTelegramClient(), fetcher.media_store)
+    crashed.queue_record(MessageRecord('8', text='voice', file_paths=[paths['8']]))
+    crashed.flush_outbox()
+
+    client = FakeTelegramClient()
+    handler = make_handler(tmp_path, client, fetcher.media_store)
+    handler.connect()
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    assert [upload.file_path for upload in client.uploads] == [paths['8']]
+    assert sorted(target for _, target, _, _ in client.sent) == [-12, -11]
+
+
+def test_failed_upload_is_retried_from_the_spooled_file(tmp_path):
+    class FailingUploadClient(FakeTelegramClient):
+        failed = False
+
+        async def upload_file(self, file_path):
+            if not self.failed:
+                self.failed = True
+                raise ConnectionError('upload interrupted')
+            return await super().upload_file(file_path)
+
+    data = bytes(range(256)) * 8
+    fetcher = make_fetcher(tmp_path)
+    paths = fetcher.fetch_all(StreamPage({'blob:video': data}), [('9', 'blob:video', 'video')], '-6')
+
+    client = FailingUploadClient()
+    handler = make_handler(tmp_path, client, fetcher.media_store)
+    handler.connect()
+    handler.queue_record(MessageRecord('9', text='video', file_paths=[paths['9']]))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    assert [upload.size for upload in client.uploads] == [len(data)]
+    assert sorted(target for _, target, _, _ in client.sent) == [-12, -11]
+    assert handler.outbox.pending() == []
+
+
+def test_oversize_media_is_skipped_and_unknown_size_is_bounded(tmp_path):
+    page = StreamPage({'blob:big': b'x' * 4096, 'blob:small': b'x' * 100})
+    fetcher = make_fetcher(tmp_path, max_upload_mb=1 / 1024)
+    result = fetcher.fetch_all(page, [('1', 'blob:big', 'video'), ('2', 'blob:small', 'voice')], '-6')
+    assert list(result) == ['2']
+    # reader فایل رد شده در صفحه بسته شده است
+    assert page.open == {}
+
+    unsized = StreamPage({'blob:big': b'x' * 4096, 'blob:small': b'y' * 100}, sized=False)
+    result = fetcher.fetch_all(unsized, [('3', 'blob:big', 'document'), ('4', 'blob:small', 'document')], '-6')
+    assert list(result) == ['4'] and unsized.open == {}
+    assert [name for name in os.listdir(fetcher.media_store.images_dir) if name.endswith('.tmp')] == []
+
+
+def test_albums_group_kinds_telegram_can_send_together():
+    async def build():
+        return [SharedUpload(path, None) for path in ('a.jpg', 'b.mp4', 'c.pdf', 'd.pdf', 'e.ogg', 'f.jpg')]
+
+    shared = asyncio.run(build())
+    assert [[upload.kind for upload in album] for album in albums_of(shared)] == [
+        ['photo', 'video'], ['document', 'document'], ['voice'], ['photo']
+    ]
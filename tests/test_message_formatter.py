@@ -0,0 +1,77 @@
+import logging
+
+from telethon.extensions import html as telegram_html
+
+from src.message_formatter import MessageFormatter, compile_template
+from src.message_record import MessageRecord
+
+logger = logging.getLogger('test')
+
+
+def make_formatter(default=None, channel_format=None):
+    channel = {'id': '-6', 'name': 'اخبار'}
+    if channel_format is not None:
+        channel['format'] = channel_format
+    return MessageFormatter({'telegram': {'format': default or {}}, 'eitaa': {'channels': [channel]}}, logger, logger)
+
+
+def record(channel_id='-6', views=None, content='متن <b>'):
+    return MessageRecord('42', 'مدیر', '۱۰:۳۰ بعدازظهر', views, content, channel_id=channel_id)
+
+
+def test_default_template_matches_the_built_in_layout():
+    formatter = make_formatter()
+    assert formatter.format(record(views='12')) == (
+        'Message from Eitaa:\n\nSender: مدیر\nTime: ۱۰:۳۰ بعدازظهر\nText:\nمتن <b>\nViews: 12'
+    )
+    assert formatter.format(record()).endswith('Text:\nمتن <b>')
+
+
+def test_channel_template_overrides_defaults_and_escapes_html():
+    formatter = make_formatter(channel_format={
+        'template': '<b>{channel}</b>\n{content}\n👁 {views}\n{time}',
+        'parse_mode': 'html',
+        'link_preview': False,
+        'omit': ['time']
+    })
+    item = record()
+    assert formatter.format(item) == '<b>اخبار</b>\nمتن &lt;b&gt;'
+    assert item.send_options() == {'parse_mode': 'html', 'link_preview': False}
+    assert item.send_options(with_file=True) == {'parse_mode': 'html'}
+    # کانال‌های دیگر قالب پیش‌فرض را دارند
+    other = record(channel_id='-7')
+    formatter.format(other)
+    assert other.text.startswith('Message from Eitaa:') and other.send_options() == {'link_preview': True}
+
+
+def test_markdown_in_values_does_not_become_formatting():
+    formatter = make_formatter(channel_format={
+        'template': '**{channel}**\n__{sender}__\n{content}',
+        'parse_mode': 'markdown'
+    })
+    item = record(content='2*3*4 = **24** __x__ `code` [link](http://x) <b>')
+    assert formatter.format(item) == (
+        '<strong>اخبار</strong>\n<em>مدیر</em>\n'
+        '2*3*4 = **24** __x__ `code` [link](http://x) &lt;b&gt;'
+    )
+    assert item.send_options() == {'parse_mode': 'html', 'link_preview': True}
+    # متن پیام بعد از parse تلگرام دست نخورده می‌ماند
+    text, entities = telegram_html.parse(item.text)
+    assert text.endswith('2*3*4 = **24** __x__ `code` [link](http://x) <b>') and len(entities) == 2
+
+
+def test_invalid_channel_template_falls_back_to_default():
+    formatter = make_formatter(channel_format={'template': '{unknown} {content}'})
+    assert formatter.format(record()).startswith('Message from Eitaa:')
+
+
+def test_templates_are_compiled_once():
+    compile_template.cache_clear()
+    make_formatter(channel_format={'template': '{content}'})
+    make_formatter(channel_format={'template': '{content}'})
+    info = compile_template.cache_info()
+    assert info.misses == 2 and info.hits == 2
+    text_only = compile_template('{content}', parse_mode='text')
+    item = record()
+    item.parse_mode = text_only.parse_mode
+    assert item.send_options() == {'parse_mode': None, 'link_preview': True}
@@ -0,0 +1,43 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from src.message_parser import jalali_to_gregorian, jalali_year, parse_message_text, parse_timestamp
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'fixtures', 'messages', 'corpus.json')
+
+with open(CORPUS, 'r', encoding='utf-8') as f:
+    CASES = json.load(f)
+
+
+@pytest.mark.parametrize('case', CASES, ids=[case['name'] for case in CASES])
+def test_corpus(case):
+    parsed = parse_message_text(case['text'])
+    assert parsed.sender == case['sender']
+    assert parsed.time == case['time']
+    assert parsed.views == case['views']
+    assert parsed.content == case['content']
+    assert parsed.clock == case['clock']
+    assert (parsed.date.isoformat() if parsed.date else None) == case['date']
+
+
+def test_unpacks_like_a_tuple():
+    sender, time_sent, views, content = parse_message_text("متن\n۱۲\nکانال,\n۱۰:۳۰ بعدازظهر")
+    assert (sender, time_sent, views, content) == ('کانال', '۱۰:۳۰ بعدازظهر', '۱۲', 'متن')
+
+
+def test_jalali_conversion():
+    assert jalali_to_gregorian(1403, 1, 1) == datetime.date(2024, 3, 20)
+    assert jalali_to_gregorian(1402, 12, 29) == datetime.date(2024, 3, 19)
+    assert jalali_to_gregorian(1399, 12, 30) == datetime.date(2021, 3, 20)
+    assert jalali_year(datetime.date(2024, 3, 19)) == 1402
+    assert jalali_year(datetime.date(2024, 3, 20)) == 1403
+
+
+def test_named_month_without_year_uses_current_jalali_year():
+    assert parse_timestamp('۱۲ مرداد ۸:۰۰ بعدازظهر', today=datetime.date(2024, 9, 1)) == (
+        '20:00', datetime.date(2024, 8, 2)
+    )
+    assert parse_timestamp('31/02 10:00') == ('10:00', None)
@@ -0,0 +1,77 @@
+import logging
+import time
+
+from src.message_watcher import WATCH_SCRIPT, MessageWatcher
+
+logger = logging.getLogger('test')
+
+
+class WatchedPage:
+    """Page that runs the exposed callback while Python waits on it"""
+
+    def __init__(self, pushes=(), fail=False):
+        self.callbacks = {}
+        self.scripts = []
+        self.pushes = list(pushes)
+        self.fail = fail
+        self.waits = 0
+
+    def expose_function(self, name, callback):
+        self.callbacks[name] = callback
+
+    def evaluate(self, script, arg=None):
+        self.scripts.append(script)
+
+    def wait_for_timeout(self, ms):
+        self.waits += 1
+        if self.fail:
+            raise RuntimeError('page closed')
+        if self.pushes:
+            self.callbacks['__eitaaOnBubbles'](self.pushes.pop(0))
+        else:
+            time.sleep(ms / 1000)
+
+
+def test_pushed_bubbles_keep_the_newest_mid_per_channel():
+    watcher = MessageWatcher(logger, logger)
+    page, other = WatchedPage(), WatchedPage()
+    watcher.watch(page, '-6')
+    watcher.watch(page, '-6')
+    assert list(page.callbacks) == ['__eitaaOnBubbles'] and page.scripts == [WATCH_SCRIPT, WATCH_SCRIPT]
+
+    watcher._on_bubbles(page, ['5', '9', 'not-a-mid', None, '7'])
+    watcher._on_bubbles(page, ['8'])
+    # صفحه‌ای که کانالی روی آن نیست نادیده گرفته می‌شود
+    watcher._on_bubbles(other, ['100'])
+    assert watcher.pending == {'-6': 9}
+
+    watcher.unwatch(page)
+    watcher._on_bubbles(page, ['50'])
+    assert watcher.pending == {'-6': 9}
+
+
+def test_wait_wakes_up_when_a_page_pushes():
+    watcher = MessageWatcher(logger, logger)
+    page = WatchedPage(pushes=[['12', '11']])
+    watcher.watch(page, '-6')
+
+    start = time.monotonic()
+    assert watcher.wait(5) == {'-6': 12}
+    assert time.monotonic() - start < 1 and page.waits == 1
+    # بعد از تحویل، صف خالی شده است
+    assert watcher.pending == {}
+
+
+def test_wait_times_out_and_drops_broken_pages():
+    watcher = MessageWatcher(logger, logger)
+    page = WatchedPage()
+    watcher.watch(page, '-6')
+    start = time.monotonic()
+    assert watcher.wait(0.3) == {}
+    assert 0.3 <= time.monotonic() - start < 2
+
+    broken = WatchedPage(fail=True)
+    watcher = MessageWatcher(logger, logger)
+    watcher.watch(broken, '-7')
+    assert watcher.wait(0.2) == {}
+    assert watcher.channels == {} and broken not in watcher.exposed
@@ -0,0 +1,48 @@
+import logging
+import urllib.request
+
+from src.metrics import MetricsServer, Registry
+
+logger = logging.getLogger('test')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('poll_seconds', 'Poll time', ['channel'], buckets=(0.1, 1))
+    histogram.observe(0.05, '-6')
+    histogram.observe(0.5, '-6')
+    histogram.observe(5, '-6')
+    text = registry.render()
+    assert 'poll_seconds_bucket{channel="-6",le="0.1"} 1' in text
+    assert 'poll_seconds_bucket{channel="-6",le="1.0"} 2' in text
+    assert 'poll_seconds_bucket{channel="-6",le="+Inf"} 3' in text
+    assert 'poll_seconds_count{channel="-6"} 3' in text
+    assert 'poll_seconds_sum{channel="-6"} 5.55' in text
+
+
+def test_counters_and_callback_gauges():
+    registry = Registry()
+    counter = registry.counter('flood_wait_seconds_total', 'Flood wait', ['target'])
+    counter.inc(-11, amount=30)
+    counter.inc(-11, amount=12)
+    depth = {'value': 0}
+    gauge = registry.gauge('queue_depth', 'Queue depth')
+    gauge.set_function(lambda: depth['value'])
+    depth['value'] = 7
+    text = registry.render()
+    assert 'flood_wait_seconds_total{target="-11"} 42' in text
+    assert 'queue_depth 7' in text
+    assert '# TYPE queue_depth gauge' in text
+
+
+def test_endpoint_serves_registry():
+    registry = Registry()
+    registry.counter('polls_total', 'Polls').inc()
+    server = MetricsServer({'metrics': {'enabled': True, 'port': 0}}, registry, logger, logger)
+    server.start()
+    try:
+        url = f"http://127.0.0.1:{server.server.server_port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert 'polls_total 1' in response.read().decode()
+    finally:
+        server.stop()
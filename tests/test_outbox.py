@@ -0,0 +1,48 @@
+import logging
+
+from src.message_record import MessageRecord
+from src.outbox import Outbox
+
+
+def make_outbox(tmp_path, **kwargs):
+    logger = logging.getLogger('test')
+    return Outbox(str(tmp_path / 'outbox.db'), info_logger=logger, error_logger=logger, **kwargs)
+
+
+def test_unacked_targets_are_replayed_after_restart(tmp_path):
+    outbox = make_outbox(tmp_path)
+    first = outbox.add(MessageRecord(text='one', targets=[1, 2]))
+    outbox.add(MessageRecord(text='two', targets=[1]))
+    outbox.ack(first, 1)
+    outbox.close()
+
+    pending = make_outbox(tmp_path).pending()
+    assert [(m.text, m.targets) for m in pending] == [('one', [2]), ('two', [1])]
+
+
+def test_uncommitted_writes_are_lost_without_flush(tmp_path):
+    outbox = make_outbox(tmp_path, batch_size=10)
+    outbox.add(MessageRecord(text='one', targets=[1]))
+    outbox.conn.close()
+    assert make_outbox(tmp_path).pending() == []
+
+
+def test_failed_deliveries_stop_after_max_attempts(tmp_path):
+    outbox = make_outbox(tmp_path, max_attempts=2)
+    message_id = outbox.add(MessageRecord(text='one', targets=[1]))
+    outbox.fail(message_id, 1)
+    assert outbox.pending()
+    outbox.fail(message_id, 1)
+    assert outbox.pending() == []
+
+
+def test_exhausted_deliveries_are_dropped_on_flush(tmp_path):
+    outbox = make_outbox(tmp_path, max_attempts=2)
+    message_id = outbox.add(MessageRecord(text='one', targets=[1, 2]))
+    assert outbox.fail(message_id, 1) == 1
+    assert outbox.fail(message_id, 1) == 2
+    outbox.flush()
+    assert outbox.conn.execute('SELECT target FROM deliveries').fetchall() == [(2,)]
+    outbox.ack(message_id, 2)
+    outbox.flush()
+    assert outbox.conn.execute('SELECT COUNT(*) FROM messages').fetchone() == (0,)
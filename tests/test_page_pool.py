@@ -0,0 +1,72 @@
+import logging
+
+from src.page_pool import ChannelPagePool
+
+logger = logging.getLogger('test')
+
+
+class FakePage:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def goto(self, url):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.opened = []
+
+    def new_page(self):
+        page = FakePage(f'page{len(self.opened) + 1}')
+        self.opened.append(page)
+        return page
+
+
+def make_pool(max_pages=2):
+    return ChannelPagePool(FakeContext(), max_pages, FakePage('main'), logger, logger)
+
+
+def test_batches_fit_in_the_pool():
+    pool = make_pool(max_pages=2)
+    assert list(pool.batches([1, 2, 3, 4, 5])) == [[1, 2], [3, 4], [5]]
+    assert list(pool.batches([])) == []
+
+
+def test_pinned_pages_are_reused_and_the_least_recent_is_recycled():
+    pool = make_pool(max_pages=2)
+    first, needs_open = pool.acquire('a')
+    assert first.name == 'main' and needs_open
+    second, _ = pool.acquire('b')
+    assert second.name == 'page1'
+
+    # استفاده دوباره از a باعث می‌شود b قدیمی‌ترین باشد
+    assert pool.acquire('a') == (first, False)
+    page, needs_open = pool.acquire('c')
+    assert page is second and needs_open
+    assert list(pool.pages) == ['a', 'c']
+    assert len(pool.context.opened) == 1
+
+
+def test_release_keeps_the_main_page_open():
+    pool = make_pool(max_pages=2)
+    main_page, _ = pool.acquire('a')
+    other, _ = pool.acquire('b')
+    pool.close()
+
+    assert other.closed and not main_page.closed
+    assert pool.pages == {}
+
+
+def test_capacity_warning_is_logged_once(caplog):
+    pool = make_pool(max_pages=2)
+    with caplog.at_level(logging.WARNING, logger='test'):
+        pool.check_capacity(2)
+        pool.check_capacity(3)
+        pool.check_capacity(3)
+    assert len(caplog.records) == 1
+    assert 'max_pages is 2' in caplog.records[0].getMessage()
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+
+import pytest
+
+pytest.importorskip('playwright.sync_api')
+
+from src import eitaa_login as eitaa_login_module  # noqa: E402
+from src.eitaa_login import EitaaLogin  # noqa: E402
+
+logger = logging.getLogger('test')
+
+
+class ProfilePage:
+    def __init__(self, browser):
+        self.browser = browser
+
+    def goto(self, url):
+        self.browser.calls.append(('goto', url))
+
+    def evaluate(self, script, arg=None):
+        self.browser.calls.append(('evaluate', arg))
+
+
+class ProfileContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages = [ProfilePage(browser)]
+
+    def add_cookies(self, cookies):
+        self.browser.calls.append(('cookies', cookies))
+
+
+class Chromium:
+    """Creates the profile directory on launch like Chromium does"""
+
+    def __init__(self):
+        self.calls = []
+        self.launches = []
+
+    def launch_persistent_context(self, user_data_dir, **options):
+        self.launches.append((user_data_dir, os.path.exists(user_data_dir)))
+        os.makedirs(user_data_dir, exist_ok=True)
+        return ProfileContext(self)
+
+    def launch(self, **options):
+        raise AssertionError('persistent profile should not launch a plain browser')
+
+
+def start(tmp_path, monkeypatch, chromium):
+    playwright = type('Playwright', (), {'chromium': chromium, 'start': lambda self: self})()
+    monkeypatch.setattr(eitaa_login_module, 'sync_playwright', lambda: playwright)
+    config = {
+        'eitaa': {'persistent_profile': {'enabled': True, 'user_data_dir': str(tmp_path / 'profile')}},
+        'paths': {'session_file': str(tmp_path / 'auth.json'), 'images_dir': str(tmp_path / 'media')},
+    }
+    login = EitaaLogin(config, info_logger=logger, error_logger=logger)
+    login.initialize()
+    return login
+
+
+def test_new_profile_is_seeded_once_and_reused_after(tmp_path, monkeypatch):
+    state = {
+        'cookies': [{'name': 'sid', 'value': '1', 'domain': 'web.eitaa.com', 'path': '/'}],
+        'origins': [{'origin': 'https://web.eitaa.com', 'localStorage': [{'name': 'user_auth', 'value': 'x'}]}],
+    }
+    (tmp_path / 'auth.json').write_text(json.dumps(state))
+
+    chromium = Chromium()
+    start(tmp_path, monkeypatch, chromium)
+    assert chromium.launches == [(str(tmp_path / 'profile'), False)]
+    assert chromium.calls[:3] == [
+        ('cookies', state['cookies']),
+        ('goto', 'https://web.eitaa.com'),
+        ('evaluate', state['origins'][0]['localStorage']),
+    ]
+    assert chromium.calls[3] == ('goto', 'https://web.eitaa.com/')
+
+    # اجرای بعدی همان پروفایل را باز می‌کند و دوباره از فایل auth کپی نمی‌کند
+    again = Chromium()
+    login = start(tmp_path, monkeypatch, again)
+    assert again.launches == [(str(tmp_path / 'profile'), True)]
+    assert again.calls == [('goto', 'https://web.eitaa.com/')]
+    assert login._page_fresh
+
+
+def test_new_profile_without_auth_file_is_not_seeded(tmp_path, monkeypatch):
+    chromium = Chromium()
+    start(tmp_path, monkeypatch, chromium)
+    assert [call[0] for call in chromium.calls] == ['goto', 'evaluate']
@@ -0,0 +1,63 @@
+import logging
+
+from src.poll_scheduler import PollScheduler
+
+logger = logging.getLogger('test')
+
+
+def make_scheduler(enabled=True):
+    config = {'eitaa': {'check_interval': 60, 'adaptive_polling': {
+        'enabled': enabled, 'min_interval': 10, 'max_interval': 100, 'backoff': 2
+    }}}
+    return PollScheduler(config, logger, logger)
+
+
+def test_quiet_channels_back_off_and_activity_resets():
+    scheduler = make_scheduler()
+    assert scheduler.due(['a', 'b'], now=0) == ['a', 'b']
+    scheduler.record('a', True, now=0)
+    scheduler.record('b', False, now=0)
+
+    now = 0
+    intervals = []
+    for _ in range(6):
+        now += scheduler.channels['b'].interval
+        assert 'b' in scheduler.due(['a', 'b'], now)
+        scheduler.record('b', False, now)
+        intervals.append(scheduler.channels['b'].interval)
+    assert intervals == sorted(intervals) and intervals[-1] == 100
+
+    scheduler.record('b', True, now)
+    assert scheduler.channels['b'].interval == 10
+
+
+def test_only_due_channels_are_returned_in_config_order():
+    scheduler = make_scheduler()
+    scheduler.due(['a', 'b', 'c'], now=0)
+    scheduler.record('a', True, now=0)
+    scheduler.record('b', False, now=0)
+    scheduler.record('c', True, now=0)
+    assert scheduler.due(['a', 'b', 'c'], now=5) == []
+    assert scheduler.seconds_until_next(now=5) == 5
+    assert scheduler.due(['c', 'a', 'b'], now=10) == ['c', 'a']
+    scheduler.record('a', False, now=10)
+    scheduler.record('c', False, now=10)
+    assert scheduler.due(['a', 'b', 'c'], now=20) == ['b']
+
+
+def test_busy_rate_caps_backoff():
+    scheduler = make_scheduler()
+    scheduler.due(['a'], now=0)
+    # هر 10 ثانیه یک پیام، پس یک دور بی‌پیام بازه را زیاد بالا نمی‌برد
+    for now in range(0, 100, 10):
+        scheduler.record('a', True, now=now)
+    scheduler.record('a', False, now=100)
+    assert scheduler.channels['a'].interval <= 20
+
+
+def test_disabled_polls_everything_every_check_interval():
+    scheduler = make_scheduler(enabled=False)
+    assert scheduler.due(['a', 'b'], now=0) == ['a', 'b']
+    scheduler.record('a', False, now=0)
+    assert scheduler.due(['a', 'b'], now=1) == ['a', 'b']
+    assert scheduler.seconds_until_next() == 60
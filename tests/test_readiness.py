@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+pytest.importorskip('playwright.sync_api')
+
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError  # noqa: E402
+
+from src.fetch_backend import BrowserBackend  # noqa: E402
+from src.message_extractor import EXTRACT_SCRIPT  # noqa: E402
+from src.readiness import CHAT_OPENED_SCRIPT, Readiness  # noqa: E402
+
+logger = logging.getLogger('test')
+
+
+class ProbePage:
+    """Records readiness probes; opened decides whether they succeed"""
+
+    def __init__(self, opened=True):
+        self.opened = opened
+        self.probes = []
+
+    def wait_for_function(self, script, arg=None, timeout=None):
+        self.probes.append((script, arg, timeout))
+        if not self.opened:
+            raise PlaywrightTimeoutError(f'Timeout {timeout}ms exceeded.')
+        return True
+
+    def wait_for_selector(self, selector, timeout=None, state=None):
+        self.probes.append((selector, state, timeout))
+        if not self.opened:
+            raise PlaywrightTimeoutError(f'Timeout {timeout}ms exceeded.')
+        return selector
+
+    def evaluate(self, script, arg=None):
+        assert script == EXTRACT_SCRIPT and arg == ['-6', None]
+        return {'newest': '5', 'messages': [
+            {'mid': '5', 'text': None, 'has_media': False, 'media_srcs': [], 'group_id': None}
+        ]}
+
+
+def test_chat_opened_probes_the_active_chat_of_the_peer():
+    readiness = Readiness(2, logger, logger)
+    page = ProbePage()
+    assert readiness.chat_opened(page, -6)
+    assert page.probes == [(CHAT_OPENED_SCRIPT, '-6', 2000)]
+    assert readiness.stats['chat_opened']['count'] == 1 and readiness.stats['chat_opened']['timeouts'] == 0
+
+
+def test_timeout_returns_none_and_is_counted(caplog):
+    readiness = Readiness(2, logger, logger)
+    page = ProbePage(opened=False)
+    with caplog.at_level(logging.WARNING, logger='test'):
+        assert readiness.chatlist_ready(page, timeout=0.5) is None
+        assert readiness.viewer_closed(page) is None
+    assert [probe[2] for probe in page.probes] == [500, 2000]
+    assert page.probes[1][1] == 'detached'
+    assert readiness.stats['chatlist']['timeouts'] == 1 and readiness.stats['viewer_closed']['timeouts'] == 1
+    assert "Wait 'chatlist' timed out after 0.5s" in caplog.text
+
+    readiness.log_summary()
+    assert readiness.stats == {}
+
+
+def test_other_errors_are_not_treated_as_timeouts():
+    readiness = Readiness(2, logger, logger)
+
+    def broken(ms):
+        raise RuntimeError('page crashed')
+
+    with pytest.raises(RuntimeError):
+        readiness.wait('broken', broken)
+    assert readiness.stats['broken']['count'] == 1 and readiness.stats['broken']['timeouts'] == 0
+
+
+def test_fetch_still_reads_the_page_when_the_chat_probe_times_out():
+    class Login:
+        readiness = Readiness(1, logger, logger)
+        backfill = type('Backfill', (), {'has_gap': lambda self, page, peer_id, last: False})()
+
+        def _wait_for_chatlist(self, page, message_processor):
+            pass
+
+        def _click_channel(self, page, message_processor, channel_id):
+            return True
+
+    login = Login()
+    newest, records = BrowserBackend(login, None, ProbePage(opened=False)).fetch('-6')
+    assert newest == '5' and [r.mid for r in records] == ['5']
+    assert login.readiness.stats['chat_opened']['timeouts'] == 1
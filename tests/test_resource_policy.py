@@ -0,0 +1,42 @@
+import logging
+from types import SimpleNamespace
+
+from src.resource_policy import ResourcePolicy
+
+logger = logging.getLogger('test')
+
+
+class FakeRoute:
+    def __init__(self, resource_type, url):
+        self.request = SimpleNamespace(resource_type=resource_type, url=url)
+        self.result = None
+
+    def abort(self):
+        self.result = 'aborted'
+
+    def continue_(self):
+        self.result = 'continued'
+
+
+def test_message_media_is_not_blocked_by_default():
+    policy = ResourcePolicy({'eitaa': {'resource_policy': {'enabled': True}}}, logger, logger)
+    routes = [
+        FakeRoute('media', 'https://web.eitaa.com/media/clip.mp4'),
+        FakeRoute('media', 'https://web.eitaa.com/media/voice.ogg'),
+        FakeRoute('font', 'https://web.eitaa.com/fonts/vazir.woff2'),
+        FakeRoute('image', 'https://web.eitaa.com/sticker/1.webp'),
+    ]
+    for route in routes:
+        policy._handle(route)
+    assert [route.result for route in routes] == ['continued', 'continued', 'aborted', 'aborted']
+
+
+def test_disabled_policy_logs_nothing(caplog, monkeypatch):
+    def walk_proc(pid=None):
+        raise AssertionError('should not read /proc')
+
+    monkeypatch.setattr('src.resource_policy.process_tree_rss', walk_proc)
+    policy = ResourcePolicy({'eitaa': {}}, logger, logger)
+    with caplog.at_level(logging.INFO, logger='test'):
+        policy.log_summary()
+    assert caplog.records == []
@@ -1,7 +1,161 @@
-import pytest
-from eitaa_scraper import EitaaScraper
+import asyncio
+import logging
+import os
 
-@pytest.mark.asyncio
-async def test_login():
-    async with EitaaScraper() as scraper:
-        assert await scraper.is_logged_in() 
\ No newline at end of file
+from src.fake_telegram import FakeTelegramClient
+from src.fetch_backend import FixtureBackend
+from src.message_processor import MessageProcessor
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'channels')
+logger = logging.getLogger('test')
+
+
+class RecordingHandler:
+    """Collects queue_record calls instead of talking to Telegram"""
+
+    def __init__(self):
+        self.queued = []
+
+    def queue_record(self, record, specific_targets=None):
+        self.queued.append((record, specific_targets))
+
+
+def make_processor(tmp_path):
+    config = {
+        'eitaa': {'checkpoint_backend': 'json'},
+        'paths': {'last_message_file': str(tmp_path / 'last_message_id.json')}
+    }
+    return MessageProcessor(config, RecordingHandler(), logger, logger)
+
+
+def test_html_snapshot_is_parsed_like_the_page():
+    backend = FixtureBackend(FIXTURES)
+    newest, records = backend.fetch('1001')
+    assert newest == '4296605695'
+    assert [r.mid for r in records] == ['4296409087', '4296540159', '4296605695']
+
+    first = records[0]
+    assert first.sender == 'مدیر کانال'
+    assert first.time == '9:01 قبل‌ازظهر'
+    assert first.views == '340'
+    assert first.content == 'سلام به همه\nخط دوم پیام'
+    assert records[1].has_media and records[1].media_src == 'media/photo1.jpg'
+    assert records[2].content is None and first.channel_id == '1001'
+
+
+def test_only_newer_messages_and_unknown_channels():
+    backend = FixtureBackend(FIXTURES)
+    newest, records = backend.fetch('1002', '4296409087')
+    assert newest == '4296605695'
+    assert [r.mid for r in records] == ['4296540159', '4296605695']
+    assert backend.fetch('1001', '4296605695') == ('4296605695', [])
+    assert backend.fetch('missing') is None
+
+
+def test_records_are_formatted_and_queued_with_local_media(tmp_path):
+    backend = FixtureBackend(FIXTURES)
+    processor = make_processor(tmp_path)
+    _, records = backend.fetch('1001', '4296409087')
+    media = backend.fetch_media(records, '1001')
+    assert media == {'4296540159': os.path.join(FIXTURES, 'media/photo1.jpg')}
+
+    fallback_calls = []
+    processor.forward_records(records, media, [42], lambda mid: fallback_calls.append(mid))
+
+    record, targets = processor.telegram_handler.queued[0]
+    message, file_paths = record.text, record.file_paths
+    assert record.mid == '4296540159' and record.channel_id == '1001'
+    assert message.startswith('Message from Eitaa:\n\nSender: مدیر کانال\n')
+    assert 'Text:\nعکس روز' in message and message.endswith('Views: 120')
+    assert file_paths == [media['4296540159']] and targets == [42]
+    # عکس راه دور در فیکسچر نیست، پس مسیر جایگزین امتحان می‌شود
+    assert fallback_calls == ['4296605695']
+
+
+def test_album_and_grouped_bubbles_are_queued_as_one_post(tmp_path):
+    backend = FixtureBackend(FIXTURES)
+    processor = make_processor(tmp_path)
+    _, records = backend.fetch('1003')
+    assert records[0].media_srcs == ['media/photo1.jpg', 'media/photo2.jpg', 'media/photo3.jpg']
+    assert [r.group_id for r in records] == [None, '777', '777', None]
+    media = backend.fetch_media(records, '1003')
+    assert sorted(media) == ['4296700000', '4296700000#1', '4296700000#2', '4296700001', '4296700002']
+
+    processor.forward_records(records, media, [42])
+
+    queued = [record for record, _ in processor.telegram_handler.queued]
+    assert [r.mid for r in queued] == ['4296700000', '4296700002', '4296700003']
+    photo = lambda name: os.path.join(FIXTURES, 'media', name)
+    assert queued[0].file_paths == [photo('photo1.jpg'), photo('photo2.jpg'), photo('photo3.jpg')]
+    # متن روی حباب دوم گروه است ولی عکس‌ها به ترتیب حباب‌ها می‌مانند
+    assert 'دو عکس در حباب‌های جدا' in queued[1].text
+    assert queued[1].file_paths == [photo('photo2.jpg'), photo('photo3.jpg')]
+    assert queued[2].file_paths == []
+
+
+def test_grouped_post_without_any_caption_is_queued(tmp_path):
+    backend = FixtureBackend(FIXTURES)
+    processor = make_processor(tmp_path)
+    _, records = backend.fetch('1005', '4296900001')
+    assert [r.group_id for r in records] == ['999', '999']
+    processor.forward_records(records, backend.fetch_media(records, '1005'), [42])
+
+    queued = [record for record, _ in processor.telegram_handler.queued]
+    photo = lambda name: os.path.join(FIXTURES, 'media', name)
+    assert [r.mid for r in queued] == ['4296900002']
+    assert queued[0].file_paths == [photo('photo2.jpg'), photo('photo3.jpg')]
+
+
+def test_captionless_photo_is_not_sent_with_the_previous_text(tmp_path):
+    backend = FixtureBackend(FIXTURES)
+    processor = make_processor(tmp_path)
+    _, records = backend.fetch('1005', None)
+    records = records[:2]
+    processor.forward_records(records, backend.fetch_media(records, '1005'), [42])
+
+    queued = [record for record, _ in processor.telegram_handler.queued]
+    assert [r.mid for r in queued] == ['4296900000', '4296900001']
+    assert 'فقط متن' in queued[0].text and queued[0].file_paths == []
+    # عکس بدون متن با فیلدهای خودش و محتوای خالی ارسال می‌شود
+    assert 'فقط متن' not in queued[1].text
+    assert queued[1].file_paths == [os.path.join(FIXTURES, 'media', 'photo1.jpg')]
+
+
+def test_video_document_and_voice_bubbles_carry_their_kind():
+    _, records = FixtureBackend(FIXTURES).fetch('1004')
+    assert [(r.media_srcs, r.media_kinds) for r in records] == [
+        (['media/clip.mp4'], ['video']),
+        (['media/report.pdf'], ['document']),
+        (['media/voice.ogg'], ['voice']),
+    ]
+    assert records[2].has_media and records[2].content is None
+
+
+def test_voice_only_post_first_in_a_poll_is_queued(tmp_path):
+    backend = FixtureBackend(FIXTURES)
+    processor = make_processor(tmp_path)
+    newest, records = backend.fetch('1004', '4296800001')
+    assert newest == '4296800002' and [r.mid for r in records] == ['4296800002']
+    processor.forward_records(records, backend.fetch_media(records, '1004'), [42])
+
+    queued = [record for record, _ in processor.telegram_handler.queued]
+    assert [r.mid for r in queued] == ['4296800002']
+    assert queued[0].file_paths == [os.path.join(FIXTURES, 'media', 'voice.ogg')]
+
+
+def test_fake_telegram_records_sends(tmp_path):
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'data')
+
+    async def run():
+        client = FakeTelegramClient()
+        await client.connect()
+        uploaded = await client.upload_file(str(photo))
+        sent = await client.send_file(7, uploaded, caption='hi')
+        await client.send_message(8, 'text')
+        return client, uploaded, sent
+
+    client, uploaded, sent = asyncio.run(run())
+    assert uploaded.size == 4
+    assert sent.photo is None and sent.document is None
+    assert [(target, text) for _, target, text, _ in client.sent] == [(7, 'hi'), (8, 'text')]
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import random
+import time
+from types import SimpleNamespace
+
+from telethon import types
+from telethon.errors import FileReferenceExpiredError, FloodWaitError
+
+from src.fake_telegram import FakeTelegramClient, FakeUploadedFile
+from src.media_store import MediaStore
+from src.message_record import MessageRecord
+from src.sender import FanoutSender, TokenBucket
+from src.telegram_handler import TelegramHandler
+
+logger = logging.getLogger('test')
+
+
+def make_handler(tmp_path, client, telegram=None, media_store=None):
+    config = {
+        'telegram': {'default_targets': [-11, -12], **(telegram or {})},
+        'eitaa': {},
+        'paths': {'outbox_file': str(tmp_path / 'outbox.db')},
+    }
+    return TelegramHandler(config, info_logger=logger, error_logger=logger, media_store=media_store, client=client)
+
+
+def test_album_is_sent_in_chunks_of_ten_per_target(tmp_path):
+    paths = []
+    for i in range(12):
+        path = tmp_path / f'photo{i}.jpg'
+        path.write_bytes(b'x' * (i + 1))
+        paths.append(str(path))
+
+    client = FakeTelegramClient()
+    handler = make_handler(tmp_path, client)
+    handler.connect()
+    handler.queue_record(MessageRecord('1', text='album', file_paths=paths))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    for target in (-11, -12):
+        sends = [(text, media) for _, sent_to, text, media in client.sent if sent_to == target]
+        assert [text for text, _ in sends] == ['album', None]
+        assert [len(media) if isinstance(media, list) else 1 for _, media in sends] == [10, 2]
+    # هر فایل یک بار آپلود شده و برای هر دو تارگت استفاده شده
+    assert len(client.uploads) == 12
+    assert all(isinstance(item, FakeUploadedFile) for _, _, _, media in client.sent for item in media)
+
+
+def test_shutdown_during_a_send_is_not_counted_as_a_failure():
+    done = []
+
+    async def run():
+        async def send(target, item):
+            await asyncio.sleep(60)
+
+        sender = FanoutSender(send, {'telegram': {}}, logger, logger, lambda *args: done.append(args))
+        sender.submit(-11, 'message')
+        await asyncio.sleep(0.01)
+        await sender.close()
+
+    asyncio.run(run())
+    assert done == []
+
+
+def test_failed_send_is_retried_in_process_until_max_attempts(tmp_path):
+    class FlakyClient(FakeTelegramClient):
+        def __init__(self, failures):
+            super().__init__()
+            self.failures = failures
+
+        async def send_message(self, target, message, **options):
+            if self.failures.get(target, 0):
+                self.failures[target] -= 1
+                raise ConnectionError('network down')
+            return await super().send_message(target, message, **options)
+
+    # -11 بعد از دو خطا ارسال می‌شود و -12 هر سه تلاشش را از دست می‌دهد
+    client = FlakyClient({-11: 2, -12: 5})
+    handler = make_handler(tmp_path, client, telegram={'retry_backoff': 0.01})
+    handler.connect()
+    handler.queue_record(MessageRecord('1', text='retry me'))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    assert [target for _, target, _, _ in client.sent] == [-11]
+    assert client.failures == {-11: 0, -12: 2}
+    # تحویل ناموفق در flush پاک شده و چیزی برای ارسال دوباره نمانده
+    assert handler.outbox.pending() == []
+    assert handler.outbox.conn.execute('SELECT COUNT(*) FROM deliveries').fetchone() == (0,)
+
+
+FAST = {'telegram': {'rate_limit': {'global_per_second': 1000, 'per_chat_per_minute': 60000, 'per_chat_burst': 100}}}
+
+
+def test_each_target_receives_its_messages_in_order():
+    sent = []
+
+    async def run():
+        async def send(target, item):
+            await asyncio.sleep(random.random() / 100)
+            sent.append((target, item))
+
+        done = asyncio.Event()
+        finished = []
+
+        def on_done(target, item, ok):
+            finished.append(item)
+            if len(finished) == 20:
+                done.set()
+
+        sender = FanoutSender(send, FAST, logger, logger, on_done)
+        for i in range(10):
+            sender.submit(-11, i)
+            sender.submit(-12, i)
+        await asyncio.wait_for(done.wait(), 5)
+        await sender.close()
+
+    asyncio.run(run())
+    for target in (-11, -12):
+        assert [item for sent_to, item in sent if sent_to == target] == list(range(10))
+
+
+def test_flood_wait_on_one_target_does_not_delay_the_others(tmp_path):
+    class FloodedClient(FakeTelegramClient):
+        flooded = False
+
+        async def send_message(self, target, message, **options):
+            if target == -11 and not self.flooded:
+                self.flooded = True
+                raise FloodWaitError(request=None, capture=1)
+            return await super().send_message(target, message, **options)
+
+    client = FloodedClient()
+    handler = make_handler(tmp_path, client, telegram=FAST['telegram'])
+    handler.connect()
+    start = time.monotonic()
+    for i in range(3):
+        handler.queue_record(MessageRecord(str(i), text=f'message {i}'))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    times = {target: [at - start for at, sent_to, _, _ in client.sent if sent_to == target] for target in (-11, -12)}
+    assert max(times[-12]) < 0.5
+    assert min(times[-11]) >= 1
+    # بعد از FloodWait همان پیام اول دوباره ارسال شده و ترتیب حفظ شده
+    assert [text for _, sent_to, text, _ in client.sent if sent_to == -11] == ['message 0', 'message 1', 'message 2']
+
+
+def test_token_bucket_allows_a_burst_then_its_rate():
+    async def run():
+        bucket = TokenBucket(20, 2)
+        start = time.monotonic()
+        stamps = []
+        for _ in range(6):
+            await bucket.acquire()
+            stamps.append(time.monotonic() - start)
+        return stamps
+
+    stamps = asyncio.run(run())
+    assert stamps[1] < 0.02
+    # چهار توکن بعدی با نرخ 20 در ثانیه، یعنی حدود 0.2 ثانیه
+    assert 0.18 <= stamps[-1] < 0.4
+
+
+def test_token_bucket_charges_amounts_over_capacity_as_debt():
+    async def run():
+        bucket = TokenBucket(20, 2)
+        start = time.monotonic()
+        await bucket.acquire(6)
+        first = time.monotonic() - start
+        await bucket.acquire()
+        return first, time.monotonic() - start
+
+    first, second = asyncio.run(run())
+    # شش توکن با ظرفیت دو: بدهی چهار توکنی و یک توکن بعدی با نرخ 20 در ثانیه
+    assert first < 0.02 and 0.23 <= second < 0.45
+
+
+def test_each_album_file_takes_a_rate_limit_token(tmp_path):
+    paths = []
+    for i in range(12):
+        path = tmp_path / f'photo{i}.jpg'
+        path.write_bytes(b'x' * (i + 1))
+        paths.append(str(path))
+
+    client = FakeTelegramClient()
+    rate_limit = {'global_per_second': 1000, 'per_chat_per_minute': 600, 'per_chat_burst': 3}
+    handler = make_handler(tmp_path, client, telegram={'default_targets': [-11], 'rate_limit': rate_limit})
+    handler.connect()
+    start = time.monotonic()
+    handler.queue_record(MessageRecord('1', text='album', file_paths=paths))
+    handler.queue_record(MessageRecord('2', text='after'))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    times = [at - start for at, _, _, _ in client.sent]
+    assert len(times) == 3 and times[1] < 0.3
+    # آلبوم 12 فایلی 12 توکن گرفته، پس پیام بعدی با نرخ 10 در ثانیه حدود یک ثانیه منتظر مانده
+    assert 0.85 <= times[2] < 2
+
+
+def test_file_for_many_targets_is_uploaded_once(tmp_path):
+    photo = tmp_path / 'photo.jpg'
+    photo.write_bytes(b'photo')
+    client = FakeTelegramClient()
+    handler = make_handler(tmp_path, client, telegram={'default_targets': [-11, -12, -13, -14]})
+    handler.connect()
+    handler.queue_record(MessageRecord('1', text='photo', file_paths=[str(photo)]))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    assert sorted(target for _, target, _, _ in client.sent) == [-14, -13, -12, -11]
+    assert len(client.uploads) == 1
+    assert all(media is client.uploads[0] for _, _, _, media in client.sent)
+
+
+def test_expired_file_reference_is_uploaded_again_and_saved(tmp_path):
+    class RefClient(FakeTelegramClient):
+        async def send_file(self, target, file, caption=None, **options):
+            if isinstance(file, types.InputPhoto) and file.file_reference == b'old':
+                raise FileReferenceExpiredError(request=None)
+            sent = await super().send_file(target, file, caption, **options)
+            sent.photo = SimpleNamespace(id=2, access_hash=3, file_reference=b'new')
+            return sent
+
+    store = MediaStore({'eitaa': {}, 'paths': {'images_dir': str(tmp_path / 'media')}}, logger, logger)
+    path = store.put(b'photo', 'image/jpeg', 'key')
+    file_hash = store.hash_of(path)
+    store.set_telegram_ref(file_hash, {'type': 'photo', 'id': 1, 'access_hash': 1, 'file_reference': b'old'.hex()})
+
+    client = RefClient()
+    handler = make_handler(tmp_path, client, telegram={'default_targets': [-11, -12, -13]}, media_store=store)
+    handler.connect()
+    handler.queue_record(MessageRecord('1', text='photo', file_paths=[path]))
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    # رفرنس منقضی شده فقط یک بار آپلود دوباره لازم داشت و رفرنس جدید ذخیره شد
+    assert sorted(target for _, target, _, _ in client.sent) == [-13, -12, -11]
+    assert len(client.uploads) == 1
+    assert store.get_telegram_ref(file_hash)['file_reference'] == b'new'.hex()
+
+
+def test_messages_queued_before_connect_are_sent(tmp_path):
+    client = FakeTelegramClient()
+    handler = make_handler(tmp_path, client)
+    handler.queue_record(MessageRecord('1', text='early'))
+    handler.queue_record(MessageRecord('2', text='also early'))
+    assert not handler.drain(timeout=0.1)
+
+    handler.connect()
+    assert handler.drain(timeout=10)
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)
+
+    for target in (-11, -12):
+        assert [text for _, sent_to, text, _ in client.sent if sent_to == target] == ['early', 'also early']
+    assert handler.outbox.pending() == []
+
+
+def test_drain_waits_for_every_target_or_times_out(tmp_path):
+    client = FakeTelegramClient(latency=0.5)
+    handler = make_handler(tmp_path, client)
+    handler.connect()
+    handler.queue_record(MessageRecord('1', text='slow'))
+
+    # هنوز هیچ تارگتی ack نکرده است
+    assert not handler.drain(timeout=0.1)
+    assert len(handler.outbox.pending()) == 1
+
+    assert handler.drain(timeout=10)
+    assert sorted(target for _, target, _, _ in client.sent) == [-12, -11]
+    assert handler.outbox.pending() == []
+    handler.stop()
+    handler.telegram_thread.join(timeout=5)